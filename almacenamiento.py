@@ -0,0 +1,195 @@
+import logging
+import sqlite3
+import threading
+import time
+
+# 💾 Historial persistente en SQLite (modo WAL) con escrituras agrupadas
+# procesar_datos_bluetooth solo agrega la muestra a un buffer en memoria;
+# un hilo escritor hace un commit por lote en lugar de un fsync por muestra.
+# Las sesiones de mala postura cerradas (ver sesiones.py) viajan en el mismo commit.
+# reemplazar_sesiones() las reescribe en el momento (p. ej. tras recalcular las alertas).
+# purgar() borra las muestras vencidas (la retención la decide retencion.py).
+
+LOTE_ESCRITURA = 500        # Muestras por commit como máximo
+INTERVALO_ESCRITURA = 1.0   # Segundos máximos que una muestra espera en memoria
+MAX_PENDIENTES = 100_000    # Si el disco no da abasto se descartan las más antiguas
+PURGA_LOTE = 5000           # Muestras borradas por transacción al aplicar la retención
+
+log = logging.getLogger("postura.almacen")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS muestras (
+    dispositivo TEXT NOT NULL,
+    ts REAL NOT NULL,
+    alertas INTEGER NOT NULL,
+    lumbar REAL NOT NULL,
+    toracico REAL NOT NULL,
+    hombro REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_muestras_dispositivo_ts ON muestras (dispositivo, ts);
+CREATE TABLE IF NOT EXISTS sesiones (
+    dispositivo TEXT NOT NULL,
+    inicio REAL NOT NULL,
+    fin REAL NOT NULL,
+    sensores INTEGER NOT NULL,
+    pico REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sesiones_dispositivo ON sesiones (dispositivo);
+"""
+
+
+def conectar(ruta):
+    conexion = sqlite3.connect(ruta, check_same_thread=False)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")  # En WAL: fsync solo en checkpoints
+    return conexion
+
+
+class AlmacenHistorial:
+    """Cola de muestras + hilo escritor que hace group commit en SQLite"""
+
+    def __init__(self, ruta, lote=LOTE_ESCRITURA, intervalo=INTERVALO_ESCRITURA):
+        self.ruta = ruta
+        self.lote = lote
+        self.intervalo = intervalo
+        self.activo = False
+        self.pendientes = []
+        self.sesiones_pendientes = []
+        self.descartadas = 0
+        self.escritas = 0
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()  # Ordena los commits del hilo escritor, reemplazar_sesiones() y purgar()
+        self._hay_lote = threading.Event()
+        self._hilo = None
+        self._lectura = threading.local()
+
+    def iniciar(self):
+        conexion = conectar(self.ruta)
+        conexion.executescript(ESQUEMA)
+        conexion.close()
+        self.activo = True
+        self._hilo = threading.Thread(target=self._escritor, name="almacen-historial", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self.activo = False
+        self._hay_lote.set()
+        if self._hilo:
+            self._hilo.join()
+            self._hilo = None
+
+    def guardar(self, dispositivo_id, muestra):
+        """muestra = (epoch, bits_alerta, ang_lumbar, ang_toracico, ang_hombro); no bloquea"""
+        with self._lock:
+            self.pendientes.append((dispositivo_id,) + muestra)
+            n = len(self.pendientes)
+            if n > MAX_PENDIENTES:
+                del self.pendientes[:n - MAX_PENDIENTES]
+                self.descartadas += n - MAX_PENDIENTES
+        if n >= self.lote:
+            self._hay_lote.set()
+
+    def guardar_sesion(self, dispositivo_id, inicio, fin, sensores, pico):
+        """Sesión de mala postura cerrada; se escribe con el próximo lote de muestras"""
+        with self._lock:
+            self.sesiones_pendientes.append((dispositivo_id, inicio, fin, sensores, pico))
+
+    def reemplazar_sesiones(self, dispositivo_id, desde, sesiones):
+        """Reemplaza las sesiones del dispositivo que empezaron desde `desde` por
+        `sesiones` [(inicio, fin, sensores, pico)]; las que seguían en la cola se descartan"""
+        with self._escritura:
+            with self._lock:
+                self.sesiones_pendientes = [s for s in self.sesiones_pendientes
+                                            if s[0] != dispositivo_id or s[1] < desde]
+            conexion = self._conexion_lectura()
+            try:
+                with conexion:
+                    conexion.execute("DELETE FROM sesiones WHERE dispositivo = ? AND inicio >= ?",
+                                     (dispositivo_id, desde))
+                    conexion.executemany("INSERT INTO sesiones VALUES (?, ?, ?, ?, ?)",
+                                         [(dispositivo_id,) + tuple(sesion) for sesion in sesiones])
+            except sqlite3.Error as e:
+                log.error("❌ Error reemplazando las sesiones de %s: %s", dispositivo_id, e)
+
+    def purgar(self, dispositivo_id, antes_de, lote=PURGA_LOTE):
+        """Borra las muestras del dispositivo anteriores a `antes_de` en transacciones cortas
+        (el hilo escritor no espera más que un lote); devuelve cuántas"""
+        borradas = 0
+        conexion = self._conexion_lectura()
+        while True:
+            with self._escritura:
+                try:
+                    with conexion:
+                        n = conexion.execute(
+                            "DELETE FROM muestras WHERE rowid IN (SELECT rowid FROM muestras "
+                            "WHERE dispositivo = ? AND ts < ? LIMIT ?)", (dispositivo_id, antes_de, lote)
+                        ).rowcount
+                except sqlite3.Error as e:
+                    log.error("❌ Error purgando muestras antiguas de %s: %s", dispositivo_id, e)
+                    return borradas
+            borradas += n
+            if n < lote:
+                return borradas
+
+    def _escritor(self):
+        conexion = conectar(self.ruta)
+        try:
+            while self.activo:
+                self._hay_lote.wait(self.intervalo)
+                self._hay_lote.clear()
+                with self._escritura:
+                    self._vaciar(conexion)
+            with self._escritura:
+                self._vaciar(conexion)  # Último lote al apagar
+        finally:
+            conexion.close()
+
+    def _vaciar(self, conexion):
+        with self._lock:
+            lote, self.pendientes = self.pendientes, []
+            sesiones, self.sesiones_pendientes = self.sesiones_pendientes, []
+        if not lote and not sesiones:
+            return
+        try:
+            with conexion:  # Una sola transacción por lote
+                conexion.executemany("INSERT INTO muestras VALUES (?, ?, ?, ?, ?, ?)", lote)
+                conexion.executemany("INSERT INTO sesiones VALUES (?, ?, ?, ?, ?)", sesiones)
+            self.escritas += len(lote)
+        except sqlite3.Error as e:
+            log.error("❌ Error guardando historial (%d muestras y %d sesiones perdidas): %s",
+                      len(lote), len(sesiones), e)
+            self.descartadas += len(lote)
+
+    # --- Lecturas (una conexión por hilo) ---
+    def _conexion_lectura(self):
+        conexion = getattr(self._lectura, "conexion", None)
+        if conexion is None:
+            conexion = conectar(self.ruta)
+            self._lectura.conexion = conexion
+        return conexion
+
+    def ultimas(self, dispositivo_id, n):
+        """Últimas n muestras de un dispositivo, de la más antigua a la más reciente"""
+        filas = self._conexion_lectura().execute(
+            "SELECT ts, alertas, lumbar, toracico, hombro FROM muestras "
+            "WHERE dispositivo = ? ORDER BY ts DESC LIMIT ?", (dispositivo_id, n)
+        ).fetchall()
+        filas.reverse()
+        return filas
+
+    def consultar(self, dispositivo_id, desde=None, hasta=None, limite=10_000):
+        """Muestras de un dispositivo en [desde, hasta] (epoch), en orden cronológico"""
+        desde = 0 if desde is None else desde
+        hasta = time.time() if hasta is None else hasta
+        return self._conexion_lectura().execute(
+            "SELECT ts, alertas, lumbar, toracico, hombro FROM muestras "
+            "WHERE dispositivo = ? AND ts BETWEEN ? AND ? ORDER BY ts LIMIT ?",
+            (dispositivo_id, desde, hasta, limite)
+        ).fetchall()
+
+    def sesiones(self, dispositivo_id, despues_de=0):
+        """[(rowid, inicio, fin, sensores, pico)] guardadas después de la fila `despues_de`"""
+        return self._conexion_lectura().execute(
+            "SELECT rowid, inicio, fin, sensores, pico FROM sesiones "
+            "WHERE dispositivo = ? AND rowid > ? ORDER BY rowid", (dispositivo_id, despues_de)
+        ).fetchall()
@@ -0,0 +1,334 @@
+import math
+from array import array
+
+import numpy as np
+
+from estadisticas import porcentaje
+
+# 🔬 Analítica por ventanas deslizantes: últimos 5 min, 1 h y 24 h
+# Por sensor: ángulo medio, máximo y mínimo y cuántas veces se disparó la alerta; además,
+# segundos en buena/mala postura. Cada muestra solo toca la cubeta del segundo en curso (O(1));
+# al cerrar un segundo se suma a la fila de su cubeta en cada ventana. Las ventanas son anillos
+# de tamaño fijo (una fila por cubeta de su resolución, en índice % capacidad) dentro de un solo
+# arreglo NumPy por dispositivo. Las sumas son corridas (se suma lo que entra y se resta lo que
+# sale); los extremos de las tres ventanas salen de un solo reduceat. El borde de cada ventana
+# avanza de a una cubeta de su resolución.
+# El arreglo se crea con el primer segundo cerrado y se libera cuando las 24 h quedan vacías:
+# un cinturón inactivo no ocupa memoria de analítica.
+# desde_historial() arma el mismo estado a partir de un historial completo, en bloque con NumPy.
+
+SENSORES = ("lumbar", "toracico", "hombro")
+VENTANAS = (("5min", 300, 1), ("1h", 3600, 10), ("24h", 86400, 300))  # (nombre, segundos, resolución)
+MAX_INTERVALO = 5.0  # Segundos: un hueco mayor (cinturón apagado) no cuenta como tiempo de uso
+VIGENCIA = max(duracion + resolucion for _, duracion, resolucion in VENTANAS)  # Después de esto todo venció
+
+# resumen(): (calculado, y por ventana: n, mala, buena, media×3, máximo×3, mínimo×3, disparos×3)
+CAMPOS_VENTANA = 15
+TAMANO_RESUMEN = 1 + CAMPOS_VENTANA * len(VENTANAS)
+
+# Fila de una cubeta: n, mala, buena, suma×3, disparos×3, máximo×3, -mínimo×3
+# (el mínimo va negado para reducir todos los extremos con un solo maximum)
+SUMAS, EXTREMOS = slice(0, 9), slice(9, 15)
+FILA_VACIA = np.array([0.0] * 9 + [-np.inf] * 6)
+LIBRE = -1  # Índice de una fila sin cubeta
+CAPACIDADES = [duracion // resolucion for _, duracion, resolucion in VENTANAS]
+INICIOS = [sum(CAPACIDADES[:k]) for k in range(len(VENTANAS))]  # Primera fila de cada ventana en el arreglo
+SIN_SUMAS = [[0.0] * 9] * len(VENTANAS)
+SIN_EXTREMOS = [[-math.inf] * 6] * len(VENTANAS)
+
+
+class Cubeta:
+    """Agregados de un intervalo: muestras, sumas/extremos por sensor, segundos y disparos"""
+    __slots__ = ("indice", "n", "suma", "maximo", "minimo", "mala", "buena", "disparos")
+
+    def __init__(self, indice):
+        self.indice = indice
+        self.n = 0
+        self.suma = [0.0, 0.0, 0.0]
+        self.maximo = [-math.inf, -math.inf, -math.inf]
+        self.minimo = [math.inf, math.inf, math.inf]
+        self.mala = 0.0
+        self.buena = 0.0
+        self.disparos = [0, 0, 0]
+
+    def fila(self):
+        """La cubeta como fila de anillo (ver FILA_VACIA)"""
+        m0, m1, m2 = self.minimo
+        return np.array([self.n, self.mala, self.buena, *self.suma, *self.disparos, *self.maximo, -m0, -m1, -m2])
+
+    @classmethod
+    def desde_fila(cls, indice, fila):
+        cubeta = cls(indice)
+        valores = fila.tolist()
+        cubeta.n, cubeta.mala, cubeta.buena = int(valores[0]), valores[1], valores[2]
+        cubeta.suma, cubeta.disparos = valores[3:6], [int(d) for d in valores[6:9]]
+        cubeta.maximo, cubeta.minimo = valores[9:12], [-m for m in valores[12:15]]
+        return cubeta
+
+
+class VentanaDeslizante:
+    """Últimos `duracion` s en cubetas de `resolucion` s, alimentada con cubetas de 1 s"""
+    __slots__ = ("duracion", "resolucion", "capacidad", "filas", "indices", "totales", "vigentes", "vencido")
+
+    def __init__(self, duracion, resolucion, filas, totales):
+        self.duracion = duracion
+        self.resolucion = resolucion
+        # Cubetas dentro de la ventana: dos índices vigentes nunca comparten fila
+        self.capacidad = duracion // resolucion
+        self.filas = filas        # Vista de `capacidad` filas del arreglo del dispositivo
+        self.indices = array("q", [LIBRE]) * self.capacidad  # Índice de la cubeta de cada fila
+        self.totales = totales    # Vista: sumas de las filas ocupadas
+        self.vigentes = 0         # Filas ocupadas
+        self.vencido = None       # Último límite aplicado por vencer()
+
+    def agregar(self, segundo, sumas, extremos):
+        """Suma un segundo ya cerrado a la cubeta que le toca (los totales los suma el motor)"""
+        indice = segundo // self.resolucion
+        posicion = indice % self.capacidad
+        if self.indices[posicion] != indice:
+            self._vaciar(posicion)  # La fila era de una cubeta ya vencida (o estaba libre)
+            self.indices[posicion] = indice
+            self.vigentes += 1
+        fila = self.filas[posicion]
+        destino = fila[SUMAS]
+        destino += sumas
+        destino = fila[EXTREMOS]
+        np.maximum(destino, extremos, out=destino)
+
+    def _vaciar(self, posicion):
+        if self.indices[posicion] != LIBRE:
+            self.totales -= self.filas[posicion, SUMAS]
+            self.filas[posicion] = FILA_VACIA
+            self.indices[posicion] = LIBRE
+            self.vigentes -= 1
+            if not self.vigentes:
+                self.totales[:] = 0.0  # Volver a cero exacto (las restas acumulan error de redondeo)
+
+    def cargar(self, indices, filas):
+        """Reemplaza el contenido por cubetas de esta resolución (índices crecientes)"""
+        vigentes = indices > indices[-1] - self.capacidad if len(indices) else slice(0)
+        indices, filas = indices[vigentes], filas[vigentes]
+        posiciones = indices % self.capacidad
+        self.filas[:] = FILA_VACIA
+        self.filas[posiciones] = filas
+        self.indices = array("q", [LIBRE]) * self.capacidad
+        for posicion, indice in zip(posiciones.tolist(), indices.tolist()):
+            self.indices[posicion] = indice
+        self.totales[:] = filas[:, SUMAS].sum(axis=0)
+        self.vigentes = len(indices)
+        self.vencido = None
+
+    def vencer(self, limite):
+        """Vacía las filas de cubetas con índice <= limite"""
+        vencido = self.vencido
+        if vencido is not None and limite <= vencido:
+            return
+        if vencido is not None and limite - vencido < self.capacidad:
+            # Lo habitual: el límite avanzó una cubeta
+            for indice in range(vencido + 1, limite + 1):
+                posicion = indice % self.capacidad
+                if self.indices[posicion] <= limite:
+                    self._vaciar(posicion)
+        else:
+            for posicion, indice in enumerate(self.indices):
+                if indice <= limite:
+                    self._vaciar(posicion)
+        self.vencido = limite
+
+
+def _limite(ahora, duracion, resolucion):
+    """Índice de cubeta más reciente que ya quedó fuera de la ventana"""
+    return int(ahora // resolucion) - duracion // resolucion
+
+
+def _resumir(sumas, extremos, limite, resolucion, segundo_actual):
+    """Valores de una ventana: sus filas vigentes más el segundo en curso si cae dentro"""
+    n, mala, buena = sumas[:3]
+    suma, disparos = sumas[3:6], sumas[6:]
+    maximos, minimos = extremos[:3], [-m for m in extremos[3:]]
+    if segundo_actual is not None and segundo_actual.indice // resolucion > limite:
+        n += segundo_actual.n
+        mala += segundo_actual.mala
+        buena += segundo_actual.buena
+        for s in range(3):
+            suma[s] += segundo_actual.suma[s]
+            disparos[s] += segundo_actual.disparos[s]
+            maximos[s] = max(maximos[s], segundo_actual.maximo[s])
+            minimos[s] = min(minimos[s], segundo_actual.minimo[s])
+    disparos = [int(d) for d in disparos]
+    if not n:
+        return (0, mala, buena, *[math.nan] * 9, *disparos)
+    return (int(n), mala, buena, *[valor / n for valor in suma], *maximos, *minimos, *disparos)
+
+
+class AnaliticaPostura:
+    """Motor por dispositivo: registrar() por muestra, resumen() al publicar"""
+    __slots__ = ("anillo", "totales", "ventanas", "actual", "ultimo_epoch", "ultimas_alertas")
+
+    def __init__(self):
+        self.anillo = None        # Filas de las tres ventanas; se crea con el primer segundo cerrado
+        self.totales = None       # Sumas corridas de cada ventana
+        self.ventanas = ()
+        self.actual = None        # Cubeta del segundo en curso
+        self.ultimo_epoch = 0.0
+        self.ultimas_alertas = 0
+
+    def _crear_ventanas(self):
+        self.anillo = np.tile(FILA_VACIA, (sum(CAPACIDADES), 1))
+        self.totales = np.zeros((len(VENTANAS), 9))
+        self.ventanas = tuple(VentanaDeslizante(duracion, resolucion, self.anillo[inicio:inicio + capacidad],
+                                                self.totales[k])
+                              for k, ((_, duracion, resolucion), inicio, capacidad)
+                              in enumerate(zip(VENTANAS, INICIOS, CAPACIDADES)))
+        return self.ventanas
+
+    def _cerrar(self, segundo):
+        """Entrega un segundo ya cerrado a las tres ventanas"""
+        fila = segundo.fila()
+        sumas, extremos = fila[SUMAS], fila[EXTREMOS]
+        for ventana in self.ventanas or self._crear_ventanas():
+            ventana.agregar(segundo.indice, sumas, extremos)
+        self.totales += sumas
+
+    def registrar(self, epoch, alertas, angulos):
+        actual = self.actual
+        segundo = int(epoch)
+        # Una muestra atrasada (segundo anterior) se suma a la cubeta en curso
+        if actual is None or segundo > actual.indice:
+            if actual is not None:
+                self._cerrar(actual)
+            actual = self.actual = Cubeta(segundo)
+
+        # El intervalo desde la muestra anterior se atribuye al estado anterior
+        dt = epoch - self.ultimo_epoch
+        if self.ultimo_epoch and 0 < dt <= MAX_INTERVALO:
+            if self.ultimas_alertas:
+                actual.mala += dt
+            else:
+                actual.buena += dt
+        disparos = alertas & ~self.ultimas_alertas  # Flancos de subida por sensor
+        if disparos:
+            for s in range(3):
+                if disparos & (1 << s):
+                    actual.disparos[s] += 1
+        self.ultimo_epoch = epoch
+        self.ultimas_alertas = alertas
+
+        a0, a1, a2 = angulos
+        actual.n += 1
+        suma, maximo, minimo = actual.suma, actual.maximo, actual.minimo
+        suma[0] += a0
+        suma[1] += a1
+        suma[2] += a2
+        if a0 > maximo[0]:
+            maximo[0] = a0
+        if a0 < minimo[0]:
+            minimo[0] = a0
+        if a1 > maximo[1]:
+            maximo[1] = a1
+        if a1 < minimo[1]:
+            minimo[1] = a1
+        if a2 > maximo[2]:
+            maximo[2] = a2
+        if a2 < minimo[2]:
+            minimo[2] = a2
+
+    @classmethod
+    def desde_historial(cls, ts, alertas, angulos):
+        """Motor equivalente a registrar() muestra por muestra (ts ordenado)"""
+        motor = cls()
+        if not len(ts):
+            return motor
+        alertas = np.asarray(alertas, dtype=np.int64)
+        previas = np.zeros(len(ts), dtype=np.int64)
+        previas[1:] = alertas[:-1]
+        dt = np.zeros(len(ts))
+        dt[1:] = np.diff(ts)
+        valido = (dt > 0) & (dt <= MAX_INTERVALO)
+        mala = np.where(valido & (previas != 0), dt, 0.0)
+        buena = np.where(valido & (previas == 0), dt, 0.0)
+        disparos = ((alertas & ~previas)[:, None] >> np.arange(3)) & 1
+        angulos = np.asarray(angulos, dtype=np.float64)
+        segundos = np.floor(ts).astype(np.int64)
+        ultimo = int(segundos[-1])
+        # El segundo en curso queda en `actual`; los anteriores ya se entregaron a las ventanas
+        corte = int(np.searchsorted(segundos, ultimo))
+        indices, filas = _filas(segundos[corte:], angulos[corte:], mala[corte:], buena[corte:], disparos[corte:])
+        motor.actual = Cubeta.desde_fila(ultimo, filas[0])
+        if corte:
+            for ventana in motor._crear_ventanas():
+                r = ventana.resolucion
+                desde = int(np.searchsorted(segundos, ultimo - ventana.duracion - r))
+                ventana.cargar(*_filas(segundos[desde:corte] // r, angulos[desde:corte], mala[desde:corte],
+                                       buena[desde:corte], disparos[desde:corte]))
+        motor.ultimo_epoch = float(ts[-1])
+        motor.ultimas_alertas = int(alertas[-1])
+        return motor
+
+    def resumen(self, ahora):
+        """Tupla plana de TAMANO_RESUMEN números (ver formatear)"""
+        if self.anillo is not None and ahora - self.ultimo_epoch > VIGENCIA:
+            # Todo venció: se libera el arreglo hasta el próximo segundo cerrado
+            self.anillo, self.totales, self.ventanas = None, None, ()
+        limites = [_limite(ahora, duracion, resolucion) for _, duracion, resolucion in VENTANAS]
+        if self.anillo is None:
+            sumas, extremos = SIN_SUMAS, SIN_EXTREMOS
+        else:
+            for ventana, limite in zip(self.ventanas, limites):
+                ventana.vencer(limite)
+            sumas = self.totales.tolist()
+            extremos = np.maximum.reduceat(self.anillo[:, EXTREMOS], INICIOS).tolist()
+        valores = [ahora]
+        for (_, _, resolucion), limite, sumas_ventana, extremos_ventana in zip(VENTANAS, limites, sumas, extremos):
+            valores.extend(_resumir(sumas_ventana, extremos_ventana, limite, resolucion, self.actual))
+        return tuple(valores)
+
+
+def _filas(indices, angulos, mala, buena, disparos):
+    """(índices, filas de anillo): una por valor de `indices` (ordenado), con los agregados de sus muestras"""
+    if not len(indices):
+        return indices, np.empty((0, len(FILA_VACIA)))
+    inicios = np.flatnonzero(np.diff(indices)) + 1
+    inicios = np.concatenate(([0], inicios))
+    n = np.diff(np.append(inicios, len(indices)))
+    return indices[inicios], np.column_stack((
+        n, np.add.reduceat(mala, inicios), np.add.reduceat(buena, inicios), np.add.reduceat(angulos, inicios),
+        np.add.reduceat(disparos, inicios), np.maximum.reduceat(angulos, inicios),
+        -np.minimum.reduceat(angulos, inicios))).astype(np.float64)
+
+
+def _numero(valor, decimales=2):
+    return None if math.isnan(valor) else round(valor, decimales)
+
+
+def formatear(resumen):
+    """Formato de /api/analitica a partir de la tupla de AnaliticaPostura.resumen()"""
+    ventanas = {}
+    for k, (nombre, duracion, resolucion) in enumerate(VENTANAS):
+        inicio = 1 + k * CAMPOS_VENTANA
+        n, mala, buena = resumen[inicio:inicio + 3]
+        medias = resumen[inicio + 3:inicio + 6]
+        maximos = resumen[inicio + 6:inicio + 9]
+        minimos = resumen[inicio + 9:inicio + 12]
+        disparos = resumen[inicio + 12:inicio + 15]
+        ventanas[nombre] = {
+            "segundos": duracion,
+            "resolucion": resolucion,
+            "muestras": int(n),
+            "segundos_buena": round(buena, 1),
+            "segundos_mala": round(mala, 1),
+            "porcentaje_buena": porcentaje(buena, mala),
+            "sensores": {
+                sensor: {
+                    "media": _numero(medias[s]),
+                    "maximo": _numero(maximos[s]),
+                    "minimo": _numero(minimos[s]),
+                    "disparos": int(disparos[s])
+                }
+                for s, sensor in enumerate(SENSORES)
+            }
+        }
+    return {"calculado": resumen[0], "ventanas": ventanas}
+
+
+RESUMEN_VACIO = AnaliticaPostura().resumen(0.0)
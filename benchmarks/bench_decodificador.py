@@ -0,0 +1,79 @@
+"""Micro-benchmark: costo por línea del parseo de tramas del cinturón.
+
+Uso:  python benchmarks/bench_decodificador.py [iteraciones]
+
+"antes"   = json.loads + búsquedas anidadas + datetime.now() + 2 strftime (server.py original)
+"despues" = decodificador.decodificar (msgspec u orjson/json) + hora cacheada por segundo
+"binaria" = la misma lectura en la trama binaria de 17 bytes (struct + CRC-16)
+"""
+import json
+import os
+import sys
+import time
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import decodificador  # noqa: E402
+
+LINEA = (
+    '{"lumbar":{"angulo":12.34,"referencia":1.20,"alerta":false,"motor":false},'
+    '"toracico":{"angulo":15.67,"referencia":2.10,"alerta":true,"motor":true},'
+    '"hombro":{"angulo":3.21,"referencia":0.50,"alerta":false,"motor":false},'
+    '"timestamp":123456}'
+)
+LINEA_BYTES = LINEA.encode()
+TRAMA_BINARIA = decodificador.codificar_binaria(1, 123456, (12.34, 15.67, 3.21), 2, 2)
+LINEA_MALA = '{"lumbar":{"angulo":"x","alerta":false},"toracico":{}}'
+
+
+def antes(linea=LINEA):
+    data = json.loads(linea)
+    now = datetime.now()
+    actual = {
+        "lumbar": data["lumbar"],
+        "toracico": data["toracico"],
+        "hombro": data["hombro"],
+        "timestamp": now.strftime("%H:%M:%S"),
+        "fecha": now.strftime("%Y-%m-%d"),
+    }
+    mala = data["lumbar"]["alerta"] or data["toracico"]["alerta"] or data["hombro"]["alerta"]
+    return actual, mala, (data["lumbar"]["alerta"], data["toracico"]["alerta"], data["hombro"]["alerta"],
+                          data["lumbar"]["angulo"], data["toracico"]["angulo"], data["hombro"]["angulo"])
+
+
+_hora = [0, ""]
+
+
+def despues(linea=LINEA_BYTES):
+    lectura = decodificador.decodificar(linea)
+    ahora = time.time()
+    segundo = int(ahora)
+    if _hora[0] != segundo:
+        _hora[0], _hora[1] = segundo, time.strftime("%H:%M:%S", time.localtime(segundo))
+    return lectura, ahora, _hora[1]
+
+
+def rechazo():
+    try:
+        decodificador.decodificar(LINEA_MALA)
+    except decodificador.ErrorTrama:
+        pass
+
+
+def medir(nombre, funcion, n):
+    mejor = min(timeit.repeat(funcion, number=n, repeat=5)) / n
+    print(f"{nombre:<28} {mejor * 1e6:8.2f} µs/línea  ({1 / mejor:,.0f} líneas/s)")
+    return mejor
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    motor = "msgspec" if decodificador.msgspec else decodificador._loads.__module__
+    print(f"Decodificador: {motor} | {n} iteraciones, mejor de 5")
+    t_antes = medir("antes (json + dicts)", antes, n)
+    t_despues = medir("después (decodificar)", despues, n)
+    t_binaria = medir("binaria (decodificar)", lambda: despues(TRAMA_BINARIA), n)
+    medir("trama inválida rechazada", rechazo, n)
+    print(f"Mejora: {t_antes / t_despues:.1f}x (JSON), {t_antes / t_binaria:.1f}x (binaria)")
+    print(f"Tamaño por muestra: {len(LINEA_BYTES) + 1} B en JSON vs {len(TRAMA_BINARIA)} B en binario")
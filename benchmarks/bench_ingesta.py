@@ -0,0 +1,305 @@
+"""Benchmark de ingesta y API de server.py con cinturones simulados.
+
+Uso:  python benchmarks/bench_ingesta.py [--escenario directo|pty|mqtt|todos] [--dispositivos N]
+                                         [--hz R] [--duracion S] [--formato json|binario] [--sin-almacen]
+
+Escenarios:
+  directo  procesar_lote() en bucle cerrado: muestras/s máximas y memoria retenida (tracemalloc)
+  pty      servidor completo (uvicorn + init_bluetooth) leyendo de un puerto serie virtual
+  mqtt     servidor completo suscrito a un broker local (benchmarks/broker_local.py)
+
+En pty/mqtt se reporta: muestras/s ingeridas frente a las ofrecidas, latencia muestra→API
+(p50/p99) medida con una sonda que hace long-poll a /snapshot durante la carga, RSS antes y
+después, y latencia de los endpoints /api/* con los datos ya cargados.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+import bitacora  # noqa: E402
+import server  # noqa: E402
+from almacenamiento import AlmacenHistorial  # noqa: E402
+from particiones import HistorialParticionado  # noqa: E402
+from retencion import Compactador  # noqa: E402
+from broker_local import BrokerLocal  # noqa: E402
+from simulador import (CinturonVirtual, Simulador, TransporteMQTT, TransportePty,  # noqa: E402
+                       crear_cinturones)
+
+ESPERA_SONDA = 0.05       # Segundos entre mediciones de latencia
+TIMEOUT_SONDA = 5.0       # Una muestra que no aparece en este tiempo cuenta como perdida
+PETICIONES_API = 300      # Peticiones por endpoint en la fase de API
+
+# init_bluetooth reintenta para siempre: el pty se cierra recién al terminar todos los escenarios
+transportes_abiertos = []
+
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Máximo, no actual
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def total_muestras():
+    return sum(d.historial.total for d in list(server.dispositivos.values()))
+
+
+def reiniciar_servidor(args, carpeta):
+    """Estado limpio entre escenarios (cada uno con su propia base SQLite y carpeta de particiones)"""
+    server.dispositivos.clear()
+    if server.almacen:
+        server.almacen.detener()
+    if server.particiones:
+        server.particiones.detener()
+    sufijo = time.time_ns()
+    server.almacen = None if args.sin_almacen else AlmacenHistorial(
+        os.path.join(carpeta, f"bench-{sufijo}.db"))
+    server.particiones = None if args.sin_almacen else HistorialParticionado(
+        os.path.join(carpeta, f"historial-{sufijo}"))
+    server.compactador = server.particiones and Compactador(server.particiones, server.almacen)
+
+
+def ms(segundos):
+    return f"{segundos * 1000:7.2f} ms"
+
+
+# --- Escenario directo ---
+def escenario_directo(args):
+    cinturones = crear_cinturones(args.dispositivos, args.formato, args.invalidas)
+    rondas = max(1, args.muestras // len(cinturones))
+    lote = [(server.DISPOSITIVO_POR_DEFECTO, c.trama()) for _ in range(rondas) for c in cinturones]
+    validas = len(lote) - sum(c.invalidas for c in cinturones)
+    if server.almacen:
+        server.almacen.iniciar()
+    if server.particiones:
+        server.particiones.iniciar()
+    calentamiento, medidas = lote[:len(lote) // 10], lote[len(lote) // 10:]
+
+    with open(os.devnull, "w") as nulo, redirect_stdout(nulo):
+        for i in range(0, len(calentamiento), 256):
+            server.procesar_lote(calentamiento[i:i + 256])
+        inicio = time.perf_counter()
+        for i in range(0, len(medidas), 256):
+            server.procesar_lote(medidas[i:i + 256])
+        duracion = time.perf_counter() - inicio
+        # Segunda pasada con tracemalloc: los buffers ya están a tope, lo retenido debería ser ~0
+        tracemalloc.start()
+        antes = tracemalloc.get_traced_memory()[0]
+        for i in range(0, len(medidas), 256):
+            server.procesar_lote(medidas[i:i + 256])
+        retenido, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"  tramas: {len(medidas)} ({len(cinturones)} dispositivos, {validas * 100 / len(lote):.1f}% válidas)")
+    print(f"  procesar_lote: {len(medidas) / duracion:,.0f} tramas/s  ({duracion * 1e6 / len(medidas):.1f} µs/trama)")
+    print(f"  memoria retenida tras {len(medidas)} tramas más: {(retenido - antes) / 1024:,.1f} KiB "
+          f"(pico {(pico - antes) / 1024:,.1f} KiB)")
+
+
+# --- Escenarios con servidor completo ---
+class BrokerEnHilo:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="broker-local", daemon=True).start()
+        self.broker = asyncio.run_coroutine_threadsafe(BrokerLocal().iniciar(), self.loop).result()
+
+    def detener(self):
+        asyncio.run_coroutine_threadsafe(self.broker.detener(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def esperar(condicion, limite=10.0):
+    fin = time.time() + limite
+    while not condicion():
+        if time.time() > fin:
+            raise TimeoutError("el servidor no arrancó a tiempo")
+        time.sleep(0.05)
+
+
+def medir_sonda(cliente, transporte, sonda, activo):
+    """Latencias muestra→API: envía un ángulo único y hace long-poll hasta verlo en /snapshot"""
+    latencias, perdidas, version, k = [], 0, -1, 0
+    ruta = f"/api/dispositivos/{sonda.dispositivo_id}/snapshot"
+    while activo():
+        k += 1
+        valor = (k % 2000) / 4 - 250  # Exacto en float32 y en centésimas
+        sonda.fijado = valor
+        inicio = time.perf_counter()
+        transporte.enviar([sonda.trama()], [sonda.dispositivo_id])
+        limite = inicio + TIMEOUT_SONDA
+        while True:
+            restante = limite - time.perf_counter()
+            if restante <= 0:
+                perdidas += 1
+                break
+            parametros = {"wait_for_version": version, "timeout": round(restante, 3)} if version >= 0 else None
+            r = cliente.get(ruta, params=parametros, timeout=TIMEOUT_SONDA + 1)
+            if r.status_code == 404:
+                time.sleep(0.001)  # La sonda todavía no existe en el servidor
+                continue
+            snapshot = r.json()
+            version = snapshot["version"]
+            datos = snapshot["datos"]
+            if datos and datos["lumbar"]["angulo"] == valor:
+                latencias.append(time.perf_counter() - inicio)
+                break
+        time.sleep(ESPERA_SONDA)
+    return latencias, perdidas
+
+
+def medir_api(cliente, dispositivo_id):
+    rutas = [
+        "/api/dispositivos",
+        f"/api/dispositivos/{dispositivo_id}/datos",
+        f"/api/dispositivos/{dispositivo_id}/snapshot",
+        f"/api/dispositivos/{dispositivo_id}/estadisticas",
+        f"/api/dispositivos/{dispositivo_id}/eventos",
+        f"/api/dispositivos/{dispositivo_id}/historial",
+        f"/api/dispositivos/{dispositivo_id}/historial?puntos=50",
+    ]
+    for ruta in rutas:
+        tiempos = []
+        for _ in range(PETICIONES_API):
+            inicio = time.perf_counter()
+            cliente.get(ruta).raise_for_status()
+            tiempos.append(time.perf_counter() - inicio)
+        print(f"  {ruta:<52} p50 {ms(percentil(tiempos, 50))}  p99 {ms(percentil(tiempos, 99))}"
+              f"  ({len(tiempos) / sum(tiempos):,.0f} req/s)")
+
+
+def escenario_servidor(args, nombre):
+    broker = None
+    if nombre == "mqtt":
+        broker = BrokerEnHilo()
+        server.FUENTE_DATOS, server.MQTT_BROKER, server.MQTT_PORT = "mqtt", "127.0.0.1", broker.broker.puerto
+    else:
+        server.FUENTE_DATOS = "serial"
+
+    puerto = puerto_libre()
+    web = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=puerto,
+                                        log_level="warning", access_log=False))
+    nulo = open(os.devnull, "w")
+    with redirect_stdout(nulo):
+        hilo_web = threading.Thread(target=web.run, name="uvicorn", daemon=True)
+        hilo_web.start()
+        esperar(lambda: web.started)
+        if nombre == "mqtt":
+            esperar(lambda: server.ingesta_mqtt is not None and server.ingesta_mqtt.conectado)
+            transporte = TransporteMQTT("127.0.0.1", broker.broker.puerto)
+        else:
+            transporte = TransportePty()
+            threading.Thread(target=server.init_bluetooth, args=(transporte.ruta,), daemon=True).start()
+            esperar(lambda: server.lector_serial is not None and server.lector_serial.conectados())
+
+    cinturones = crear_cinturones(args.dispositivos, args.formato, args.invalidas)
+    sonda = CinturonVirtual(9999, args.formato)
+    simulador = Simulador(cinturones, transporte, args.hz)
+    cliente = httpx.Client(base_url=f"http://127.0.0.1:{puerto}")
+
+    try:
+        rss_inicial, inicial = rss_mb(), total_muestras()
+        with redirect_stdout(nulo):
+            carga = threading.Thread(target=simulador.ejecutar, args=(args.duracion,), daemon=True)
+            inicio = time.perf_counter()
+            carga.start()
+            latencias, perdidas = medir_sonda(cliente, transporte, sonda, carga.is_alive)
+            # Dejar que el servidor termine lo que tenga en cola
+            anterior = -1
+            while total_muestras() != anterior:
+                anterior = total_muestras()
+                time.sleep(0.5)
+            duracion = time.perf_counter() - inicio
+        ingeridas = total_muestras() - inicial - len(latencias)
+        validas = simulador.enviadas - sum(c.invalidas for c in cinturones)
+
+        print(f"  ofrecidas: {simulador.enviadas / args.duracion:,.0f} tramas/s "
+              f"({args.dispositivos} dispositivos × {args.hz:g} Hz, {validas} válidas)")
+        print(f"  ingeridas: {ingeridas:,} ({ingeridas * 100 / max(validas, 1):.1f}% de las válidas, "
+              f"{ingeridas / duracion:,.0f} muestras/s)")
+        print(f"  cola de ingesta ({server.escritor.politica}): {server.escritor.descartadas:,} descartadas, "
+              f"{server.escritor.coalescidas:,} fusionadas, {server.escritor.bloqueos:,} esperas")
+        print(f"  latencia muestra→API: p50 {ms(percentil(latencias, 50))}  p99 {ms(percentil(latencias, 99))}"
+              f"  ({len(latencias)} sondas, {perdidas} sin respuesta)")
+        print(f"  RSS: {rss_inicial:.1f} MiB -> {rss_mb():.1f} MiB")
+        medir_api(cliente, cinturones[0].dispositivo_id)
+    finally:
+        cliente.close()
+        with redirect_stdout(nulo):
+            web.should_exit = True
+            hilo_web.join(10)
+            if nombre == "mqtt":
+                transporte.cerrar()
+            else:
+                transportes_abiertos.append(transporte)
+            if broker:
+                broker.detener()
+        nulo.close()
+
+
+def argumentos():
+    p = argparse.ArgumentParser(description="Benchmark de ingesta y API de server.py")
+    p.add_argument("--escenario", choices=("directo", "pty", "mqtt", "todos"), default="todos")
+    p.add_argument("--dispositivos", type=int, default=20)
+    p.add_argument("--hz", type=float, default=10.0, help="muestras por segundo y por cinturón")
+    p.add_argument("--duracion", type=float, default=10.0, help="segundos de carga (pty/mqtt)")
+    p.add_argument("--muestras", type=int, default=50_000, help="tramas del escenario directo")
+    p.add_argument("--formato", choices=("json", "binario"), default="json")
+    p.add_argument("--invalidas", type=float, default=0.01, help="probabilidad de trama inválida")
+    p.add_argument("--sin-almacen", action="store_true", help="sin persistencia (SQLite ni archivos por día)")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = argumentos()
+    escenarios = ("directo", "pty", "mqtt") if args.escenario == "todos" else (args.escenario,)
+    if os.name != "posix" and "pty" in escenarios:
+        print("⚠️ El escenario pty necesita un sistema POSIX; se omite")
+        escenarios = tuple(e for e in escenarios if e != "pty")
+    # Misma configuración de logging que en producción, pero escribiendo a /dev/null
+    bitacora.configurar(server.NIVEL_LOG, flujo=open(os.devnull, "w"))
+    print(f"📊 Benchmark de ingesta | formato {args.formato} | "
+          f"{'sin almacén' if args.sin_almacen else 'con almacén SQLite y particiones'}")
+    with tempfile.TemporaryDirectory() as carpeta:
+        for nombre in escenarios:
+            print(f"\n▶ {nombre}")
+            reiniciar_servidor(args, carpeta)
+            if nombre == "directo":
+                escenario_directo(args)
+            else:
+                escenario_servidor(args, nombre)
+        if server.almacen:
+            server.almacen.detener()
+        if server.particiones:
+            server.particiones.detener()
+    for transporte in transportes_abiertos:
+        transporte.cerrar()
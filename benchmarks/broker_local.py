@@ -0,0 +1,132 @@
+"""Broker MQTT 3.1.1 mínimo para pruebas de carga sin instalar mosquitto.
+
+Uso:  python benchmarks/broker_local.py [puerto]      (por defecto 1883)
+
+Acepta QoS 0/1 de entrada (responde PUBACK) y reenvía siempre con QoS 0.
+Sin retención, sin sesiones persistentes ni autenticación: solo para pruebas locales.
+"""
+import asyncio
+import struct
+import sys
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK = 1, 2, 3, 4, 8, 9
+UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 10, 11, 12, 13, 14
+
+
+def coincide(filtro, topico):
+    """¿El tópico cumple el filtro? (comodines + y #)"""
+    f, t = filtro.split("/"), topico.split("/")
+    for i, parte in enumerate(f):
+        if parte == "#":
+            return True
+        if i >= len(t) or (parte != "+" and parte != t[i]):
+            return False
+    return len(f) == len(t)
+
+
+def codificar_longitud(n):
+    salida = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        salida.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(salida)
+
+
+def paquete(tipo, flags, cuerpo):
+    return bytes([(tipo << 4) | flags]) + codificar_longitud(len(cuerpo)) + cuerpo
+
+
+class BrokerLocal:
+    """Broker asyncio; `puerto=0` elige un puerto libre (ver `self.puerto` tras iniciar)"""
+
+    def __init__(self, host="127.0.0.1", puerto=0):
+        self.host = host
+        self.puerto = puerto
+        self.servidor = None
+        self.clientes = {}        # writer -> lista de filtros suscritos
+        self.publicados = 0
+
+    async def iniciar(self):
+        self.servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self.servidor.sockets[0].getsockname()[1]
+        return self
+
+    async def detener(self):
+        self.servidor.close()
+        for writer in list(self.clientes):
+            writer.close()
+        await self.servidor.wait_closed()
+
+    async def _leer_paquete(self, reader):
+        cabecera = await reader.readexactly(1)
+        multiplicador, longitud = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            longitud += (byte & 0x7F) * multiplicador
+            multiplicador *= 128
+            if not byte & 0x80:
+                break
+        return cabecera[0] >> 4, cabecera[0] & 0x0F, await reader.readexactly(longitud)
+
+    async def _atender(self, reader, writer):
+        self.clientes[writer] = []
+        try:
+            while True:
+                tipo, flags, cuerpo = await self._leer_paquete(reader)
+                if tipo == CONNECT:
+                    writer.write(paquete(CONNACK, 0, b"\x00\x00"))
+                elif tipo == SUBSCRIBE:
+                    pid = cuerpo[:2]
+                    i, codigos = 2, bytearray()
+                    while i < len(cuerpo):
+                        n = struct.unpack("!H", cuerpo[i:i + 2])[0]
+                        self.clientes[writer].append(cuerpo[i + 2:i + 2 + n].decode())
+                        codigos.append(min(cuerpo[i + 2 + n], 1))
+                        i += 3 + n
+                    writer.write(paquete(SUBACK, 0, pid + bytes(codigos)))
+                elif tipo == UNSUBSCRIBE:
+                    writer.write(paquete(UNSUBACK, 0, cuerpo[:2]))
+                elif tipo == PUBLISH:
+                    qos = (flags >> 1) & 3
+                    n = struct.unpack("!H", cuerpo[:2])[0]
+                    topico = cuerpo[2:2 + n].decode()
+                    i = 2 + n
+                    if qos:
+                        writer.write(paquete(PUBACK, 0, cuerpo[i:i + 2]))
+                        i += 2
+                    self._reenviar(topico, cuerpo[i:])
+                elif tipo == PINGREQ:
+                    writer.write(paquete(PINGRESP, 0, b""))
+                elif tipo == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clientes.pop(writer, None)
+            writer.close()
+
+    def _reenviar(self, topico, payload):
+        self.publicados += 1
+        t = topico.encode()
+        datos = paquete(PUBLISH, 0, struct.pack("!H", len(t)) + t + payload)
+        for writer, filtros in list(self.clientes.items()):
+            if any(coincide(f, topico) for f in filtros):
+                writer.write(datos)
+
+
+async def main(puerto):
+    broker = await BrokerLocal("0.0.0.0", puerto).iniciar()
+    print(f"📡 Broker MQTT local escuchando en el puerto {broker.puerto} (Ctrl+C para salir)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.detener()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1883))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,218 @@
+"""Simulador de cinturones: N dispositivos virtuales con posturas realistas.
+
+Uso:
+  python benchmarks/simulador.py pty  [--dispositivos N] [--hz R] [--formato json|binario] ...
+  python benchmarks/simulador.py mqtt [--broker HOST:PUERTO] [--dispositivos N] [--hz R] ...
+
+- pty:  crea un puerto serie virtual (POSIX) e imprime su ruta; pasar esa ruta en --puertos (o PUERTOS_SERIAL).
+        Todas las tramas van por el mismo puerto y se identifican con el campo `dispositivo`.
+- mqtt: publica en cinturon/<id>/sensores (arrancar antes benchmarks/broker_local.py o mosquitto).
+
+Cada cinturón deriva lentamente alrededor de su referencia, tiene sesiones de mala postura
+(un sensor supera su umbral durante varios segundos) y emite tramas inválidas con la
+probabilidad indicada (JSON truncado, tipos erróneos, texto de depuración, CRC roto).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from decodificador import SENSORES, codificar_binaria  # noqa: E402
+
+# Umbrales de cinturon.ino (grados sobre la referencia)
+UMBRALES = (15.0, 10.0, 12.0)
+PROB_INICIO_SESION = 0.01    # Por muestra: probabilidad de empezar una mala postura
+MUESTRAS_SESION = 20         # Duración media (en muestras) de una mala postura
+MUESTRAS_MOTOR = 2           # El motor se activa tras confirmar la alerta (como el firmware)
+
+
+class CinturonVirtual:
+    """Genera las tramas de un cinturón; `dispositivo_id` es el id que verá el servidor"""
+
+    def __init__(self, numero, formato="json", prob_invalida=0.0, semilla=None):
+        self.numero = numero
+        self.formato = formato
+        self.prob_invalida = prob_invalida
+        self.dispositivo_id = str(numero) if formato == "binario" else f"sim-{numero}"
+        self.azar = random.Random(semilla if semilla is not None else numero)
+        self.referencias = [round(self.azar.uniform(-5, 5), 2) for _ in SENSORES]
+        self.deriva = [0.0, 0.0, 0.0]
+        self.sesion = None          # (sensor, muestras restantes, desvío)
+        self.en_alerta = [0, 0, 0]  # Muestras consecutivas en alerta por sensor
+        self.secuencia = 0
+        self.invalidas = 0
+        self.fijado = None          # Ángulo lumbar forzado (sonda de latencia)
+
+    def _avanzar(self):
+        azar = self.azar
+        # Deriva lenta con reversión a la media + ruido de medición
+        self.deriva = [d * 0.98 + azar.gauss(0, 0.3) for d in self.deriva]
+        angulos = [r + d + azar.gauss(0, 0.2) for r, d in zip(self.referencias, self.deriva)]
+        if self.sesion is None and azar.random() < PROB_INICIO_SESION:
+            sensor = azar.randrange(3)
+            self.sesion = [sensor, max(1, int(azar.expovariate(1 / MUESTRAS_SESION))),
+                           UMBRALES[sensor] * azar.uniform(1.2, 2.5) * azar.choice((-1, 1))]
+        if self.sesion is not None:
+            sensor, restantes, desvio = self.sesion
+            angulos[sensor] += desvio
+            self.sesion[1] -= 1
+            if self.sesion[1] <= 0:
+                self.sesion = None
+        if self.fijado is not None:
+            angulos[0] = self.fijado
+        alertas = motores = 0
+        for i, (a, r, u) in enumerate(zip(angulos, self.referencias, UMBRALES)):
+            if abs(a - r) > u:
+                alertas |= 1 << i
+                self.en_alerta[i] += 1
+                if self.en_alerta[i] >= MUESTRAS_MOTOR:
+                    motores |= 1 << i
+            else:
+                self.en_alerta[i] = 0
+        self.secuencia += 1
+        return [round(a, 2) for a in angulos], alertas, motores
+
+    def trama(self):
+        """Siguiente muestra como bytes (JSON sin salto de línea o binaria)"""
+        angulos, alertas, motores = self._avanzar()
+        if self.prob_invalida and self.azar.random() < self.prob_invalida:
+            self.invalidas += 1
+            return self._invalida(angulos, alertas, motores)
+        return self._codificar(angulos, alertas, motores)
+
+    def _codificar(self, angulos, alertas, motores):
+        if self.formato == "binario":
+            return codificar_binaria(self.numero, self.secuencia, angulos, alertas, motores)
+        trama = {"dispositivo": self.dispositivo_id}
+        for i, sensor in enumerate(SENSORES):
+            trama[sensor] = {"angulo": angulos[i], "referencia": self.referencias[i],
+                             "alerta": bool(alertas & (1 << i)), "motor": bool(motores & (1 << i))}
+        trama["timestamp"] = int(time.monotonic() * 1000)
+        return json.dumps(trama, separators=(",", ":")).encode()
+
+    def _invalida(self, angulos, alertas, motores):
+        tipo = self.azar.randrange(3)
+        if tipo == 0:
+            if self.formato == "binario":
+                roto = bytearray(self._codificar(angulos, alertas, motores))
+                roto[self.azar.randrange(2, len(roto))] ^= 0x10  # CRC incorrecto
+                return bytes(roto)
+            return b'{"lumbar":{"angulo":"nan","alerta":0},"toracico":{},"hombro":null}'  # Tipos erróneos
+        if tipo == 1:
+            return b"Calibrando canal 1... Mantente quieto."  # Texto de depuración del firmware
+        buena = self._codificar(angulos, alertas, motores)
+        if self.formato == "binario":
+            return buena[:len(buena) // 2]
+        return buena[:self.azar.randrange(5, len(buena) - 1)]  # JSON truncado
+
+
+class TransportePty:
+    """Puerto serie virtual: el servidor lee de `ruta` como si fuera el Bluetooth"""
+
+    def __init__(self):
+        import pty
+        import tty
+        self.maestro, self.esclavo = pty.openpty()
+        tty.setraw(self.esclavo)
+        self.ruta = os.ttyname(self.esclavo)
+        self.lock = threading.Lock()
+
+    def enviar(self, tramas, dispositivos=None):
+        # JSON van una por línea; las binarias se delimitan solas pero un \n extra no estorba
+        with self.lock:
+            os.write(self.maestro, b"\n".join(tramas) + b"\n")
+
+    def cerrar(self):
+        os.close(self.maestro)
+        os.close(self.esclavo)
+
+
+class TransporteMQTT:
+    """Publica cada trama en cinturon/<id>/sensores (QoS 0)"""
+
+    def __init__(self, host="localhost", puerto=1883, topico="cinturon/{}/sensores"):
+        from ingesta_mqtt import crear_cliente
+        self.topico = topico
+        self.client = crear_cliente()
+        self.client.connect(host, puerto, 60)
+        self.client.loop_start()
+
+    def enviar(self, tramas, dispositivos):
+        for trama, dispositivo_id in zip(tramas, dispositivos):
+            self.client.publish(self.topico.format(dispositivo_id), trama, qos=0)
+
+    def cerrar(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class Simulador:
+    """Emite una trama por cinturón cada 1/hz segundos hasta `duracion` o `detener()`"""
+
+    def __init__(self, cinturones, transporte, hz=1.0):
+        self.cinturones = cinturones
+        self.transporte = transporte
+        self.hz = hz
+        self.enviadas = 0
+        self._parar = threading.Event()
+
+    def detener(self):
+        self._parar.set()
+
+    def ejecutar(self, duracion=None):
+        periodo = 1 / self.hz
+        inicio = proximo = time.perf_counter()
+        while not self._parar.is_set():
+            if duracion is not None and proximo - inicio >= duracion:
+                break
+            tramas = [c.trama() for c in self.cinturones]
+            self.transporte.enviar(tramas, [c.dispositivo_id for c in self.cinturones])
+            self.enviadas += len(tramas)
+            proximo += periodo
+            espera = proximo - time.perf_counter()
+            if espera > 0:
+                self._parar.wait(espera)
+            else:
+                proximo = time.perf_counter()  # Atrasado: no acumular ráfagas
+        return self.enviadas
+
+
+def crear_cinturones(n, formato="json", prob_invalida=0.0, semilla=0):
+    return [CinturonVirtual(i + 1, formato, prob_invalida, semilla + i) for i in range(n)]
+
+
+def argumentos():
+    p = argparse.ArgumentParser(description="Simulador de cinturones de postura")
+    p.add_argument("transporte", choices=("pty", "mqtt"))
+    p.add_argument("--dispositivos", type=int, default=5)
+    p.add_argument("--hz", type=float, default=1.0, help="muestras por segundo y por cinturón")
+    p.add_argument("--duracion", type=float, default=None, help="segundos (por defecto sin límite)")
+    p.add_argument("--formato", choices=("json", "binario"), default="json")
+    p.add_argument("--invalidas", type=float, default=0.01, help="probabilidad de trama inválida")
+    p.add_argument("--broker", default="localhost:1883")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = argumentos()
+    if args.transporte == "pty":
+        transporte = TransportePty()
+        print(f"🔌 Puerto virtual: {transporte.ruta}  (usar en --puertos)")
+    else:
+        host, _, puerto = args.broker.partition(":")
+        transporte = TransporteMQTT(host, int(puerto or 1883))
+        print(f"📡 Publicando en {args.broker}")
+    simulador = Simulador(crear_cinturones(args.dispositivos, args.formato, args.invalidas),
+                          transporte, args.hz)
+    print(f"🤖 {args.dispositivos} cinturones a {args.hz} Hz ({args.formato}) - Ctrl+C para salir")
+    try:
+        simulador.ejecutar(args.duracion)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transporte.cerrar()
+        print(f"📊 Tramas enviadas: {simulador.enviadas}")
@@ -0,0 +1,53 @@
+import logging
+import sys
+import threading
+import time
+
+# 📝 Logging con niveles y límite de frecuencia
+# Los mensajes por muestra van en DEBUG (desactivados por defecto); los que se pueden
+# repetir en ráfaga (tramas inválidas, reconexiones) se limitan por mensaje y se resume
+# cuántos se suprimieron en lugar de escribir miles de líneas a stdout.
+
+FORMATO = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+MAX_POR_INTERVALO = 5     # Mensajes iguales permitidos por intervalo
+INTERVALO = 10.0          # Segundos
+
+
+class FiltroFrecuencia(logging.Filter):
+    """Deja pasar como máximo `maximo` registros por plantilla de mensaje cada `intervalo` s"""
+
+    def __init__(self, maximo=MAX_POR_INTERVALO, intervalo=INTERVALO):
+        super().__init__()
+        self.maximo = maximo
+        self.intervalo = intervalo
+        self.ventanas = {}  # (logger, nivel, plantilla) -> [inicio, emitidos, suprimidos]
+        self._lock = threading.Lock()
+
+    def filter(self, registro):
+        clave = (registro.name, registro.levelno, registro.msg)
+        ahora = time.monotonic()
+        with self._lock:
+            ventana = self.ventanas.get(clave)
+            if ventana is None or ahora - ventana[0] >= self.intervalo:
+                suprimidos = ventana[2] if ventana else 0
+                self.ventanas[clave] = [ahora, 1, 0]
+                if suprimidos:
+                    registro.msg = f"{registro.msg} (+{suprimidos} iguales suprimidos)"
+                return True
+            if ventana[1] < self.maximo:
+                ventana[1] += 1
+                return True
+            ventana[2] += 1
+            return False
+
+
+def configurar(nivel="INFO", maximo=MAX_POR_INTERVALO, intervalo=INTERVALO, flujo=None):
+    """Handler a `flujo` (stdout por defecto) con el filtro de frecuencia; idempotente"""
+    raiz = logging.getLogger()
+    raiz.setLevel(nivel)
+    if not any(getattr(h, "_bitacora", False) for h in raiz.handlers):
+        handler = logging.StreamHandler(flujo or sys.stdout)
+        handler.setFormatter(logging.Formatter(FORMATO, "%H:%M:%S"))
+        handler.addFilter(FiltroFrecuencia(maximo, intervalo))
+        handler._bitacora = True
+        raiz.addHandler(handler)
@@ -8,6 +8,12 @@ size_t idxSerial2 = 0;
 char bufBT[BUF_SIZE];
 size_t idxBT = 0;
 
+// Tramas binarias del cinturón (0xA5 | versión 1 | ... | CRC): se reenvían tal cual
+static const uint8_t TRAMA_MAGIA = 0xA5;
+static const size_t TAM_TRAMA_BINARIA = 17;
+uint8_t tramaBinaria[TAM_TRAMA_BINARIA];
+size_t idxBinaria = 0;
+
 void setup() {
   Serial.begin(115200);
   Serial2.begin(115200, SERIAL_8N1, /*RX=*/16, /*TX=*/17);
@@ -22,7 +28,17 @@ void setup() {
 void loop() {
   // 1) Leer de Arduino → Bluetooth
   while (Serial2.available()) {
-    char c = Serial2.read();
+    uint8_t b = Serial2.read();
+    if (idxBinaria > 0 || (idxSerial2 == 0 && b == TRAMA_MAGIA)) {
+      // El CRC lo valida el servidor; aquí solo se delimita por longitud
+      tramaBinaria[idxBinaria++] = b;
+      if (idxBinaria == TAM_TRAMA_BINARIA) {
+        SerialBT.write(tramaBinaria, TAM_TRAMA_BINARIA);
+        idxBinaria = 0;
+      }
+      continue;
+    }
+    char c = (char)b;
     if (c == '\n' || idxSerial2 >= BUF_SIZE - 1) {
       bufSerial2[idxSerial2] = '\0';
       if (idxSerial2) {
@@ -1,43 +1,99 @@
-import serial
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import struct
 import time
-import paho.mqtt.client as mqtt
+
+# Módulos compartidos con server.py (carpeta raíz del proyecto)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bitacora
+from decodificador import CRC, es_binaria, crc16
+from ingesta_serial import IngestaSerial
+from ingesta_mqtt import crear_cliente
+from publicador_mqtt import PublicadorMQTT
 
 # ————— CONFIGURACIÓN —————
-BT_PORT   = 'COM8'           # o '/dev/tty.SLAB_USBtoUART' según tu SO
+PUERTOS   = ['COM8']         # o '/dev/rfcomm*', 'COM*', 'COM7=cinturon-2'... (ver ingesta_serial.py)
 BAUD_RATE = 115200
 MQTT_BROKER = 'localhost'
 MQTT_PORT   = 1883
+MQTT_TOPICO = 'cinturon/sensores'
+MQTT_TOPICO_DISPOSITIVO = 'cinturon/{}/sensores'  # Con varios puertos: uno por puerto (id en el tópico)
+MQTT_QOS    = 1              # 0 = sin confirmación; 1 = el broker confirma cada trama
+MQTT_MAX_INFLIGHT = 20       # Publicaciones sin confirmar como máximo
+DIARIO = 'diario_mqtt.bin'   # Tramas pendientes mientras el broker no está disponible
+NIVEL_LOG = 'INFO'           # 'DEBUG' muestra cada trama recibida (solo para depurar)
+
+log = logging.getLogger("postura.puente")
+
+
+def marcar_recepcion(trama):
+    """Agrega la hora de recepción a la trama para que el servidor conserve
+    la hora real de las muestras que se reenvían desde el diario"""
+    if trama.startswith(b"{") and len(trama) > 2:
+        return b'{"recibido":%.3f,' % time.time() + trama[1:]
+    if es_binaria(trama) and trama[1] == 1:
+        # Binaria v1 -> v2: mismos campos + hora de recepción (f64) y CRC recalculado
+        cuerpo = b"\xa5\x02" + trama[2:-CRC.size] + struct.pack("<d", time.time())
+        return cuerpo + CRC.pack(crc16(cuerpo))
+    return trama
+
+
+def topico(dispositivo):
+    """Tópico de las tramas de un puerto: el id va en el tópico, no en la trama (vale para JSON y binarias)"""
+    if dispositivo is None:
+        return None  # Único puerto: MQTT_TOPICO, el servidor usa el id de la trama
+    return MQTT_TOPICO_DISPOSITIVO.format(dispositivo.replace("/", "_").replace("+", "_").replace("#", "_"))
+
 
-# Cliente MQTT
-client = mqtt.Client()
-client.connect(MQTT_BROKER, MQTT_PORT, 60)
+def entregar(lote):
+    depurar = log.isEnabledFor(logging.DEBUG)  # El volcado de cada trama solo se arma si se va a mostrar
+    for dispositivo, trama in lote:
+        if depurar:
+            log.debug("📥 Recibido BT (%s): %s", dispositivo or "sin id",
+                      trama.hex(" ") if es_binaria(trama) else trama.decode("utf-8", "replace"))
+
+        # Publicar en MQTT (cola + diario en disco si el broker no está)
+        publicador.publicar(marcar_recepcion(trama), topico(dispositivo))
+
+
+argumentos = argparse.ArgumentParser(description="Puente Bluetooth -> MQTT")
+argumentos.add_argument("--puertos", nargs="+", default=PUERTOS, metavar="PUERTO",
+                        help="Puertos serie a leer (admite comodines y 'puerto=id')")
+argumentos.add_argument("--baudios", type=int, default=BAUD_RATE)
+argumentos.add_argument("--nivel", default=NIVEL_LOG, help="Nivel de log (DEBUG muestra cada trama)")
+opciones = argumentos.parse_args()
+bitacora.configurar(opciones.nivel.upper())
+
+
+# Cliente MQTT: paho reconecta solo; mientras tanto las tramas van al diario
+client = crear_cliente()
+client.reconnect_delay_set(min_delay=1, max_delay=30)
+publicador = PublicadorMQTT(client, MQTT_TOPICO, qos=MQTT_QOS, max_inflight=MQTT_MAX_INFLIGHT,
+                            ruta_diario=DIARIO)
+client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
 client.loop_start()
 
-# Conexión serial Bluetooth
-ser = serial.Serial(BT_PORT, BAUD_RATE, timeout=1)
-time.sleep(2)  # dejar que se inicie
+# Todos los puertos en un solo event loop; con un único puerto las tramas van a MQTT_TOPICO,
+# con varios cada puerto publica en cinturon/<id>/sensores y el servidor usa ese id
+lector = IngestaSerial(opciones.puertos, opciones.baudios, entregar)
 
-print("Conectado a Bluetooth en", BT_PORT)
+log.info("📱 Leyendo Bluetooth en %s", ", ".join(opciones.puertos))
 try:
-    while True:
-        line = ser.readline().decode('utf-8').strip()
-        if not line:
-            continue
-        print("Recibido BT:", line)
-
-        # Publicar en MQTT
-        client.publish("cinturon/sensores", line)
-
-        # (Opcional) Leer comandos desde MQTT 
-        # y reenviarlos por serial BT:
-        # def on_message(client, userdata, msg):
-        #     ser.write(msg.payload + b'\n')
-        # client.subscribe("cinturon/comandos")
-        # client.on_message = on_message
+    asyncio.run(lector.correr())
+
+    # (Opcional) Leer comandos desde MQTT
+    # y reenviarlos por serial BT:
+    # def on_message(client, userdata, msg):
+    #     lector.puertos[ruta].serial.write(msg.payload + b'\n')
+    # client.subscribe("cinturon/comandos")
+    # client.on_message = on_message
 
 except KeyboardInterrupt:
     pass
 finally:
+    publicador.detener()
     client.loop_stop()
-    ser.close()
     client.disconnect()
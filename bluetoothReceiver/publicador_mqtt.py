@@ -0,0 +1,317 @@
+import logging
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+# 📤 Publicación MQTT tolerante a caídas del broker
+# - Cola acotada en memoria; si el broker no está o la cola se llena, el hilo de envío la
+#   vuelca por lotes (al llenarse o cada INTERVALO_VOLCADO s) a un diario en disco, con un
+#   fsync por volcado. publicar() nunca toca el disco.
+# - El diario guarda registros [uint32 longitud][bytes]. Una trama con tópico
+#   propio lleva el bit alto de la longitud y sus bytes son [uint8 largo][tópico][trama].
+# - Al volver el broker se reenvía primero el diario, por lotes, y luego la cola.
+# - Ventana de mensajes en vuelo: nunca hay más de `max_inflight` publicaciones sin confirmar.
+# Entrega "al menos una vez": tras un corte se pueden repetir algunas tramas.
+
+MAX_COLA = 10_000
+LOTE = 100
+MAX_INFLIGHT = 20
+ESPERA_CONFIRMACION = 10  # Segundos máximos esperando los PUBACK de un lote del diario
+INTERVALO_VOLCADO = 1     # Sin broker, segundos máximos que una trama espera en memoria
+CON_TOPICO = 0x8000_0000  # Bit de la longitud: el registro trae su tópico
+
+log = logging.getLogger("postura.publicador")
+
+
+def _registro(topico, trama):
+    if topico is None:
+        return struct.pack("<I", len(trama)) + trama
+    topico = topico.encode()
+    return struct.pack("<IB", CON_TOPICO | (1 + len(topico) + len(trama)), len(topico)) + topico + trama
+
+
+class Diario:
+    """Diario de tramas en disco con posición de lectura persistente"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.ruta_pos = ruta + ".pos"
+        self.lock = threading.Lock()
+        self.pos = 0
+        if os.path.exists(self.ruta_pos):
+            with open(self.ruta_pos) as f:
+                self.pos = int(f.read() or 0)
+        self._reparar()
+
+    def _reparar(self):
+        """Corta un registro incompleto al final (corte de luz a mitad de escritura)"""
+        try:
+            tamano = os.path.getsize(self.ruta)
+        except OSError:
+            self.pos = 0
+            return
+        if self.pos > tamano:
+            self.pos = 0  # Posición de un diario anterior ya vaciado
+        with open(self.ruta, "r+b") as f:
+            f.seek(self.pos)
+            fin = self.pos
+            while True:
+                cabecera = f.read(4)
+                if len(cabecera) < 4:
+                    break
+                (longitud,) = struct.unpack("<I", cabecera)
+                longitud &= ~CON_TOPICO
+                if fin + 4 + longitud > tamano:
+                    break
+                fin += 4 + longitud
+                f.seek(fin)
+            if fin < tamano:
+                log.warning("⚠️ Diario %s: se descartan %d bytes de un registro incompleto", self.ruta, tamano - fin)
+                f.truncate(fin)
+
+    def agregar(self, tramas):
+        """Agrega [(tópico o None, trama)]"""
+        with self.lock, open(self.ruta, "ab") as f:
+            f.write(b"".join(_registro(topico, trama) for topico, trama in tramas))
+            f.flush()
+            os.fsync(f.fileno())  # Un fsync por volcado, no por trama
+
+    def pendiente(self):
+        try:
+            return os.path.getsize(self.ruta) > self.pos
+        except OSError:
+            return False
+
+    def leer_lote(self, n):
+        """Hasta n [(tópico o None, trama)] desde la posición actual -> (tramas, posición tras el lote)"""
+        with self.lock:
+            with open(self.ruta, "rb") as f:
+                f.seek(self.pos)
+                pos = self.pos
+                tramas = []
+                incompleto = False
+                while len(tramas) < n:
+                    cabecera = f.read(4)
+                    if len(cabecera) < 4:
+                        incompleto = bool(cabecera)
+                        break
+                    (longitud,) = struct.unpack("<I", cabecera)
+                    con_topico, longitud = longitud & CON_TOPICO, longitud & ~CON_TOPICO
+                    trama = f.read(longitud)
+                    if len(trama) < longitud:
+                        incompleto = True
+                        break
+                    if con_topico:
+                        fin_topico = 1 + trama[0]
+                        tramas.append((trama[1:fin_topico].decode(), trama[fin_topico:]))
+                    else:
+                        tramas.append((None, trama))
+                    pos += 4 + longitud
+            if incompleto:
+                # agregar() escribe registros enteros con el lock tomado: es la cola rota de un
+                # corte. Se corta para que lo que se agregue después quede bien alineado
+                os.truncate(self.ruta, pos)
+            return tramas, pos
+
+    def confirmar(self, pos):
+        with self.lock:
+            if pos >= os.path.getsize(self.ruta):
+                # Todo reenviado: vaciar el diario
+                os.remove(self.ruta)
+                if os.path.exists(self.ruta_pos):
+                    os.remove(self.ruta_pos)
+                self.pos = 0
+                return
+            self.pos = pos
+            # Escritura atómica: un corte deja la posición anterior, nunca un archivo a medias
+            temporal = self.ruta_pos + ".tmp"
+            with open(temporal, "w") as f:
+                f.write(str(pos))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, self.ruta_pos)
+
+
+class PublicadorMQTT:
+    """Envía tramas a `topico` desde un hilo propio; `publicar()` nunca bloquea al lector serial"""
+
+    def __init__(self, client, topico, qos=1, max_inflight=MAX_INFLIGHT, max_cola=MAX_COLA,
+                 ruta_diario="diario_mqtt.bin", lote=LOTE):
+        self.client = client
+        self.topico = topico
+        self.qos = qos
+        self.max_inflight = max_inflight
+        self.max_cola = max_cola
+        self.lote = lote
+        self.diario = Diario(ruta_diario)
+        self.cola = deque()
+        self.en_vuelo = set()
+        self.confirmados_antes = set()  # PUBACK que llegaron antes de registrar el mid
+        self.conectado = False
+        self.activo = True
+        self.publicadas = 0
+        self.al_diario = 0
+        self.ultimo_volcado = time.monotonic()
+        self.cond = threading.Condition()
+
+        client.max_inflight_messages_set(max_inflight)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_publish = self._on_publish
+        self.hilo = threading.Thread(target=self._enviar, name="publicador-mqtt", daemon=True)
+        self.hilo.start()
+
+    # --- Callbacks de paho (hilo de red de paho) ---
+    # Importante: paho los llama con sus locks internos tomados, por eso este
+    # módulo nunca llama a client.publish() mientras tiene self.cond.
+    def _on_connect(self, client, userdata, flags, reason_code, *args):
+        with self.cond:
+            self.conectado = reason_code == 0
+            self.confirmados_antes.clear()
+            self.cond.notify_all()
+        if self.conectado:
+            log.info("✅ MQTT conectado")
+        else:
+            log.error("❌ MQTT rechazó la conexión: %s", reason_code)
+
+    def _on_disconnect(self, client, userdata, *args):
+        with self.cond:
+            self.conectado = False
+            self.en_vuelo.clear()  # paho reintenta por su cuenta lo que ya tenía
+            self.cond.notify_all()
+        log.warning("❌ MQTT desconectado - las tramas se guardan en el diario")
+
+    def _on_publish(self, client, userdata, mid, *args):
+        if self.qos == 0:
+            return
+        with self.cond:
+            if mid in self.en_vuelo:
+                self.en_vuelo.discard(mid)
+            else:
+                self.confirmados_antes.add(mid)
+            self.cond.notify_all()
+
+    # --- API ---
+    def publicar(self, trama, topico=None):
+        """No bloquea ni escribe en disco: encola la trama y el hilo de envío la publica o la
+        vuelca al diario. Sin `topico` va al tópico del publicador"""
+        with self.cond:
+            self.cola.append((topico, trama))
+            if self.conectado or len(self.cola) >= self.max_cola:
+                self.cond.notify_all()
+
+    def detener(self, espera=5):
+        """Intenta vaciar la cola y vuelca al diario lo que no se alcanzó a enviar"""
+        limite = time.time() + espera
+        with self.cond:
+            while (self.cola or self.en_vuelo) and self.conectado and time.time() < limite:
+                self.cond.wait(0.1)
+            self.activo = False
+            pendientes = list(self.cola)
+            self.cola.clear()
+            self.cond.notify_all()
+        self.hilo.join()
+        if pendientes:
+            self.diario.agregar(pendientes)
+            self.al_diario += len(pendientes)
+
+    # --- Envío (hilo propio) ---
+    def _toca_volcar(self):
+        """Con self.cond tomado: la cola se llenó o, sin broker, ya pasó INTERVALO_VOLCADO"""
+        if len(self.cola) >= self.max_cola:
+            return True
+        return (not self.conectado and bool(self.cola)
+                and time.monotonic() - self.ultimo_volcado >= INTERVALO_VOLCADO)
+
+    def _volcar(self):
+        """Pasa la cola entera al diario con un solo fsync (fuera del lock)"""
+        with self.cond:
+            pendientes = list(self.cola)
+            self.cola.clear()
+            self.ultimo_volcado = time.monotonic()
+        if pendientes:
+            self.diario.agregar(pendientes)
+            self.al_diario += len(pendientes)
+
+    def _esperar(self, seguir, limite=None):
+        """Espera mientras seguir() (hasta `limite`, en monotonic); si entretanto la cola se
+        llena, la vuelca al diario para que publicar() nunca tenga que hacerlo"""
+        while True:
+            with self.cond:
+                if not seguir() or (limite is not None and time.monotonic() >= limite):
+                    return
+                if len(self.cola) < self.max_cola:
+                    self.cond.wait(0.5)
+                    continue
+            self._volcar()
+
+    def _publicar_con_ventana(self, topico, trama):
+        """Publica respetando la ventana; devuelve el mid o None si no se pudo"""
+        self._esperar(lambda: len(self.en_vuelo) >= self.max_inflight and self.conectado and self.activo)
+        with self.cond:
+            if not (self.conectado and self.activo):
+                return None
+        info = self.client.publish(topico or self.topico, trama, qos=self.qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return None
+        self.publicadas += 1
+        if self.qos > 0:
+            with self.cond:
+                if info.mid in self.confirmados_antes:
+                    self.confirmados_antes.discard(info.mid)
+                else:
+                    self.en_vuelo.add(info.mid)
+        return info.mid
+
+    def _enviar(self):
+        while True:
+            with self.cond:
+                while self.activo and not self._toca_volcar() and (
+                        not self.conectado or (not self.cola and not self.diario.pendiente())):
+                    self.cond.wait(0.5)
+                if not self.activo:
+                    return
+                if self._toca_volcar():
+                    volcar = True
+                else:
+                    volcar = False
+                    desde_diario = self.diario.pendiente()
+                    if desde_diario:
+                        tramas, pos = self.diario.leer_lote(self.lote)
+                        desde_diario = bool(tramas)  # Lote vacío: no quedaba nada completo en el diario
+                    if not desde_diario:
+                        tramas = [self.cola.popleft() for _ in range(min(self.lote, len(self.cola)))]
+
+            if volcar:
+                self._volcar()
+            elif desde_diario:
+                self._reenviar_diario(tramas, pos)
+            else:
+                self._enviar_lote(tramas)
+
+    def _enviar_lote(self, tramas):
+        for i, (topico, trama) in enumerate(tramas):
+            if self._publicar_con_ventana(topico, trama) is None:
+                # Se cayó la conexión a mitad del lote: el resto va al diario
+                self.diario.agregar(tramas[i:])
+                self.al_diario += len(tramas) - i
+                return
+
+    def _reenviar_diario(self, tramas, pos):
+        mids = set()
+        for topico, trama in tramas:
+            mid = self._publicar_con_ventana(topico, trama)
+            if mid is None:
+                return  # Sin confirmar: el lote se reenviará al reconectar
+            mids.add(mid)
+        if self.qos > 0:
+            self._esperar(lambda: self.en_vuelo & mids and self.conectado,
+                          time.monotonic() + ESPERA_CONFIRMACION)
+            with self.cond:
+                if self.en_vuelo & mids or not self.conectado:
+                    return
+        self.diario.confirmar(pos)
@@ -0,0 +1,155 @@
+import numpy as np
+from datetime import datetime
+
+# 📈 Historial columnar de tamaño fijo
+# Por muestra: epoch float64 (8 B) + 3 ángulos float32 (12 B) + bits de alerta uint8 (1 B) = 21 B
+# Los arreglos se reservan con la primera muestra: un cinturón sin datos no ocupa memoria.
+# Un solo escritor; los lectores copian sin locks a partir de un estado publicado (total, n)
+# y descartan lo que el escritor haya sobrescrito mientras copiaban. Hay una posición de más
+# (`ranuras` = capacidad + 1) para que la muestra en escritura no pise una ventana completa.
+
+ALERTA_LUMBAR, ALERTA_TORACICO, ALERTA_HOMBRO = 1, 2, 4
+
+
+class BufferCircular:
+    __slots__ = ("capacidad", "ranuras", "ts", "angulos", "alertas", "fin", "n", "total")
+
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.ranuras = capacidad + 1
+        self.ts = None
+        self.angulos = None
+        self.alertas = None
+        self.fin = 0      # Próxima posición a escribir
+        self.n = 0        # Muestras válidas
+        self.total = 0    # Muestras agregadas desde el inicio (sirve de cursor)
+
+    def _reservar(self):
+        # `ts` se asigna al final: los lectores miran solo `ts is None`
+        self.angulos = np.zeros((self.ranuras, 3), dtype=np.float32)
+        self.alertas = np.zeros(self.ranuras, dtype=np.uint8)
+        self.ts = np.zeros(self.ranuras, dtype=np.float64)
+
+    def __len__(self):
+        return self.n
+
+    def agregar(self, epoch, alertas, lumbar, toracico, hombro):
+        if self.ts is None:
+            self._reservar()
+        i = self.fin
+        self.ts[i] = epoch
+        self.angulos[i] = (lumbar, toracico, hombro)
+        self.alertas[i] = alertas
+        self.fin = (i + 1) % self.ranuras
+        if self.n < self.capacidad:
+            self.n += 1
+        self.total += 1
+
+    def extender(self, muestras):
+        for muestra in muestras:
+            self.agregar(*muestra)
+
+    def limpiar(self):
+        # `fin` no se toca: la muestra k siempre vive en la posición k % ranuras
+        self.n = 0
+
+    def rango(self, primero, ultimo):
+        """Copia de las muestras [primero, ultimo) en índices absolutos (comparables con `total`).
+
+        Segura frente al escritor: lo sobrescrito mientras se copiaba se recorta del principio.
+        """
+        ts, alertas, angulos = self.ts, self.alertas, self.angulos
+        if ts is None or ultimo <= primero:
+            return (np.empty(0, np.float64), np.empty(0, np.uint8), np.empty((0, 3), np.float32))
+        indices = np.arange(primero, ultimo) % self.ranuras
+        copia = (ts[indices], alertas[indices], angulos[indices])
+        # Validar DESPUÉS de copiar; la muestra `total` puede estar escribiéndose ahora mismo
+        vigente = self.total + 1 - self.ranuras
+        if primero < vigente:
+            corte = min(vigente - primero, ultimo - primero)
+            copia = tuple(c[corte:] for c in copia)
+        return copia
+
+    def ventana(self, ultimas=None, total=None, n=None):
+        """(ts, alertas, angulos) de las últimas muestras en orden cronológico.
+
+        `total`/`n` son los de una instantánea publicada; por defecto, el estado actual.
+        """
+        if total is None:
+            total, n = self.total, self.n
+        k = n if ultimas is None else max(0, min(ultimas, n))
+        return self.rango(total - k, total)
+
+    def desde_cursor(self, cursor, limite=None, total=None, n=None):
+        """Muestras agregadas después de `cursor` (valor previo de `total`).
+
+        Devuelve (ventana, cursor_siguiente, completo); completo=False si parte de
+        las muestras pedidas ya se sobrescribieron en el buffer.
+        """
+        if total is None:
+            total, n = self.total, self.n
+        nuevas = total - cursor
+        if nuevas < 0:
+            nuevas = total  # Cursor de otro ciclo de vida (reinicio): mandar todo
+        disponibles = min(nuevas, n)
+        primero = total - disponibles
+        siguiente = total if limite is None else min(total, primero + limite)
+        ventana = self.rango(primero, siguiente)
+        completo = disponibles == nuevas and len(ventana[0]) == siguiente - primero
+        return ventana, siguiente, completo
+
+
+def reducir(ts, alertas, angulos, puntos):
+    """Reduce una ventana a `puntos` cubetas de igual duración.
+
+    Por cubeta: mínimo, media y máximo de cada ángulo y OR de los bits de alerta,
+    así una alerta de una sola muestra no desaparece al reducir.
+    """
+    if len(ts) <= puntos:
+        return ts, alertas, angulos, angulos, angulos
+    bordes = np.linspace(ts[0], ts[-1], puntos + 1)[:-1]
+    inicios = np.unique(np.searchsorted(ts, bordes, side="left"))
+    cuenta = np.diff(np.append(inicios, len(ts)))
+    angulos64 = angulos.astype(np.float64)
+    return (
+        ts[inicios],
+        np.bitwise_or.reduceat(alertas, inicios),
+        np.add.reduceat(angulos64, inicios, axis=0) / cuenta[:, None],
+        np.minimum.reduceat(angulos, inicios, axis=0),
+        np.maximum.reduceat(angulos, inicios, axis=0),
+    )
+
+
+def columnas(ts, alertas, angulos, minimos=None, maximos=None):
+    """Serialización vectorizada de una ventana: un arreglo por campo"""
+    # Hora local en bloque con datetime64 (desfase horario actual)
+    desfase = datetime.now().astimezone().utcoffset().total_seconds()
+    locales = ((ts + desfase) * 1e6).astype("datetime64[us]")
+    iso = np.datetime_as_string(locales, unit="us")
+    angulos = np.round(angulos.astype(np.float64), 2)
+    cols = {
+        "timestamp": [s[11:19] for s in iso.tolist()],
+        "datetime": iso.tolist(),
+        "postura_mala": (alertas != 0).tolist(),
+        "lumbar_mala": (alertas & ALERTA_LUMBAR).astype(bool).tolist(),
+        "toracico_mala": (alertas & ALERTA_TORACICO).astype(bool).tolist(),
+        "hombro_mala": (alertas & ALERTA_HOMBRO).astype(bool).tolist(),
+        "angulo_lumbar": angulos[:, 0].tolist(),
+        "angulo_toracico": angulos[:, 1].tolist(),
+        "angulo_hombro": angulos[:, 2].tolist(),
+    }
+    if minimos is not None:
+        # Ventana reducida: rango de cada ángulo dentro de la cubeta
+        minimos = np.round(minimos.astype(np.float64), 2)
+        maximos = np.round(maximos.astype(np.float64), 2)
+        for s, sensor in enumerate(("lumbar", "toracico", "hombro")):
+            cols["angulo_" + sensor + "_min"] = minimos[:, s].tolist()
+            cols["angulo_" + sensor + "_max"] = maximos[:, s].tolist()
+    return cols
+
+
+def registros(*ventana):
+    """La misma ventana como lista de dicts (formato clásico de /api/historial)"""
+    cols = columnas(*ventana)
+    claves = list(cols)
+    return [dict(zip(claves, fila)) for fila in zip(*cols.values())]
@@ -37,6 +37,17 @@ const int MUESTRAS_CALIBRACION = 100;
 #define CANAL_TORACICO 1
 #define CANAL_HOMBRO 2
 
+// --- FORMATO DE ENVÍO AL ESP32 ---
+// 0 = JSON (una línea por muestra); 1 = trama binaria compacta de 17 bytes (little-endian):
+// 0xA5 | versión 1 | id u16 | secuencia u32 | 3 ángulos int16 (centésimas de grado) | bits | CRC-16
+#define FORMATO_BINARIO 0
+#define TRAMA_MAGIA 0xA5
+#define TRAMA_VERSION 1
+const uint16_t DISPOSITIVO_ID = 0;     // 0 = el receptor usa su id por defecto
+const uint16_t CADA_TRAMAS_JSON = 30;  // En modo binario, 1 de cada N tramas va en JSON (lleva las referencias)
+uint32_t secuenciaTrama = 0;  // Numera solo las tramas binarias: la JSON intercalada no la lleva
+uint16_t tramaEnCiclo = 0;    // 0 = toca la trama JSON del ciclo de CADA_TRAMAS_JSON
+
 MPU6050 mpuLumbar, mpuToracico, mpuHombro;
 
 // Estado de sensores
@@ -135,7 +146,17 @@ void loop() {
     imprimirEstado("Hombro", UMBRAL_ANGULO_ALERTA_HOMBRO, anguloActualHombro, anguloReferenciaHombro, MOTOR_PIN_HOMBRO);
   }
   
+#if FORMATO_BINARIO
+  if (tramaEnCiclo == 0) {
+    enviarDatosESP32();
+  } else {
+    enviarTramaBinaria();
+    secuenciaTrama++;
+  }
+  tramaEnCiclo = (tramaEnCiclo + 1) % CADA_TRAMAS_JSON;
+#else
   enviarDatosESP32();
+#endif
   delay(1000);
 }
 
@@ -267,3 +288,45 @@ void enviarDatosESP32() {
   Serial3.print(millis());
   Serial3.println("}");
 }
+
+uint16_t crc16(const uint8_t *datos, size_t n) {
+  // CRC-16/XMODEM, polinomio 0x1021 (el mismo que verifica decodificador.py)
+  uint16_t crc = 0;
+  for (size_t i = 0; i < n; i++) {
+    crc ^= (uint16_t)datos[i] << 8;
+    for (uint8_t b = 0; b < 8; b++) crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+  }
+  return crc;
+}
+
+void escribirInt16(uint8_t *destino, float angulo) {
+  long centesimas = lround(angulo * 100.0);
+  int16_t valor = (int16_t)constrain(centesimas, -32768L, 32767L);
+  destino[0] = valor & 0xFF;
+  destino[1] = (valor >> 8) & 0xFF;
+}
+
+void enviarTramaBinaria() {
+  uint8_t trama[17];
+  trama[0] = TRAMA_MAGIA;
+  trama[1] = TRAMA_VERSION;
+  trama[2] = DISPOSITIVO_ID & 0xFF;
+  trama[3] = DISPOSITIVO_ID >> 8;
+  for (uint8_t i = 0; i < 4; i++) trama[4 + i] = (secuenciaTrama >> (8 * i)) & 0xFF;
+  escribirInt16(&trama[8], anguloActualLumbar);
+  escribirInt16(&trama[10], anguloActualToracico);
+  escribirInt16(&trama[12], anguloActualHombro);
+
+  uint8_t bits = 0;
+  if (abs(anguloActualLumbar - anguloReferenciaLumbar) > UMBRAL_ANGULO_ALERTA_LUMBAR) bits |= 1;
+  if (abs(anguloActualToracico - anguloReferenciaToracico) > UMBRAL_ANGULO_ALERTA_TORACICO) bits |= 2;
+  if (abs(anguloActualHombro - anguloReferenciaHombro) > UMBRAL_ANGULO_ALERTA_HOMBRO) bits |= 4;
+  if (digitalRead(MOTOR_PIN_LUMBAR) == HIGH) bits |= 1 << 3;
+  if (digitalRead(MOTOR_PIN_TORACICO) == HIGH) bits |= 2 << 3;
+  if (digitalRead(MOTOR_PIN_HOMBRO) == HIGH) bits |= 4 << 3;
+  trama[14] = bits;
+  uint16_t crc = crc16(trama, 15);
+  trama[15] = crc & 0xFF;
+  trama[16] = crc >> 8;
+  Serial3.write(trama, sizeof(trama));
+}
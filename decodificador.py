@@ -0,0 +1,168 @@
+import math
+import struct
+from binascii import crc_hqx
+from collections import namedtuple
+from typing import Optional
+
+# ⚡ Decodificador validado de las tramas del cinturón
+# {"lumbar":{"angulo":..,"alerta":..}, "toracico":{...}, "hombro":{...}}
+# Con msgspec el esquema se compila una vez y la trama se decodifica y valida en C
+# sin crear diccionarios intermedios; si no está instalado se usa orjson/json + validación manual.
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _ErrorJSON = orjson.JSONDecodeError
+except ImportError:
+    import json
+    _loads = json.loads
+    _ErrorJSON = ValueError
+
+SENSORES = ("lumbar", "toracico", "hombro")
+
+# Lectura compacta: bits de alerta/motor (lumbar=1, toracico=2, hombro=4) y tuplas de floats
+# recibido: epoch en que el puente recibió la trama (None si llegó directo)
+# referencias/secuencia: None cuando la trama no las trae
+Lectura = namedtuple("Lectura", "dispositivo alertas motores angulos referencias recibido secuencia")
+
+
+class ErrorTrama(ValueError):
+    """Trama con JSON inválido, CRC incorrecto o que no cumple el esquema"""
+
+
+# 📦 Trama binaria (little-endian), alternativa compacta al JSON:
+#   v1 (17 B): 0xA5 | versión | id dispositivo u16 | secuencia u32 | 3 ángulos i16 (centésimas de grado)
+#              | bits (0-2 alertas, 3-5 motores) | CRC-16 u16
+#   v2 (25 B): igual que v1 + hora de recepción f64 antes del CRC (la agrega el puente)
+MAGIA = 0xA5
+# Formatos completos (incluido el CRC) para desempaquetar la trama en una sola llamada
+FORMATOS_BINARIOS = {1: struct.Struct("<BBHIhhhBH"), 2: struct.Struct("<BBHIhhhBdH")}
+TAMANOS_BINARIOS = {version: formato.size for version, formato in FORMATOS_BINARIOS.items()}
+CRC = struct.Struct("<H")
+
+
+def crc16(datos):
+    """CRC-16/XMODEM (polinomio 0x1021, inicial 0) calculado en C; el mismo que cinturon.ino"""
+    return crc_hqx(datos, 0)
+
+
+def es_binaria(trama):
+    return len(trama) > 0 and trama[0] == MAGIA if isinstance(trama, (bytes, bytearray)) else False
+
+
+def codificar_binaria(dispositivo, secuencia, angulos, alertas, motores=0, recibido=None):
+    """Arma una trama binaria (v2 si se indica `recibido`)"""
+    campos = [MAGIA, 1 if recibido is None else 2, dispositivo & 0xFFFF, secuencia & 0xFFFFFFFF]
+    campos += [max(-32768, min(32767, round(a * 100))) for a in angulos]
+    campos.append((alertas & 7) | ((motores & 7) << 3))
+    if recibido is not None:
+        campos.append(recibido)
+    cuerpo = FORMATOS_BINARIOS[campos[1]].pack(*campos, 0)[:-CRC.size]
+    return cuerpo + CRC.pack(crc16(cuerpo))
+
+
+def decodificar_binaria(trama):
+    formato = FORMATOS_BINARIOS.get(trama[1]) if len(trama) > 1 else None
+    if formato is None or len(trama) != formato.size:
+        raise ErrorTrama("trama binaria con versión o tamaño inválido")
+    campos = formato.unpack(trama)
+    if crc_hqx(trama[:-2], 0) != campos[-1]:
+        raise ErrorTrama("trama binaria con CRC inválido")
+    bits = campos[7]
+    return Lectura(
+        str(campos[2]) if campos[2] else None,
+        bits & 7,
+        (bits >> 3) & 7,
+        (campos[4] / 100, campos[5] / 100, campos[6] / 100),
+        None,
+        campos[8] if len(campos) == 10 else None,
+        campos[3],
+    )
+
+
+if msgspec is not None:
+    class _Sensor(msgspec.Struct):
+        angulo: float
+        alerta: bool
+        referencia: float = 0.0
+        motor: bool = False
+
+    class _Trama(msgspec.Struct):
+        lumbar: _Sensor
+        toracico: _Sensor
+        hombro: _Sensor
+        dispositivo: Optional[str] = None
+        recibido: Optional[float] = None
+
+    _decoder = msgspec.json.Decoder(_Trama)
+
+    def decodificar(linea):
+        """str/bytes (JSON o binaria) -> Lectura; lanza ErrorTrama si la trama es inválida"""
+        if es_binaria(linea):
+            return decodificar_binaria(linea)
+        try:
+            t = _decoder.decode(linea)
+        except msgspec.DecodeError as e:
+            raise ErrorTrama(str(e)) from None
+        l, to, h = t.lumbar, t.toracico, t.hombro
+        if not (math.isfinite(l.angulo) and math.isfinite(to.angulo) and math.isfinite(h.angulo)):
+            raise ErrorTrama("ángulo no finito")
+        return Lectura(
+            t.dispositivo,
+            (1 if l.alerta else 0) | (2 if to.alerta else 0) | (4 if h.alerta else 0),
+            (1 if l.motor else 0) | (2 if to.motor else 0) | (4 if h.motor else 0),
+            (l.angulo, to.angulo, h.angulo),
+            (l.referencia, to.referencia, h.referencia),
+            t.recibido,
+            None,
+        )
+
+else:
+    def _numero(valor, campo):
+        tipo = type(valor)
+        if tipo is float:
+            if not math.isfinite(valor):
+                raise ErrorTrama(f"{campo}: ángulo no finito")
+            return valor
+        if tipo is int:
+            return float(valor)
+        raise ErrorTrama(f"{campo}: se esperaba un número")
+
+    def decodificar(linea):
+        """str/bytes (JSON o binaria) -> Lectura; lanza ErrorTrama si la trama es inválida"""
+        if es_binaria(linea):
+            return decodificar_binaria(linea)
+        try:
+            data = _loads(linea)
+        except _ErrorJSON as e:
+            raise ErrorTrama(str(e)) from None
+        if type(data) is not dict:
+            raise ErrorTrama("la trama no es un objeto JSON")
+        alertas = motores = 0
+        angulos = []
+        referencias = []
+        for i, sensor in enumerate(SENSORES):
+            s = data.get(sensor)
+            if type(s) is not dict:
+                raise ErrorTrama(f"falta el sensor `{sensor}`")
+            alerta = s.get("alerta")
+            if type(alerta) is not bool:
+                raise ErrorTrama(f"{sensor}.alerta: se esperaba true/false")
+            angulos.append(_numero(s.get("angulo"), f"{sensor}.angulo"))
+            referencias.append(_numero(s.get("referencia", 0.0), f"{sensor}.referencia"))
+            if alerta:
+                alertas |= 1 << i
+            if s.get("motor") is True:
+                motores |= 1 << i
+        dispositivo = data.get("dispositivo")
+        if dispositivo is not None and type(dispositivo) is not str:
+            raise ErrorTrama("dispositivo: se esperaba un texto")
+        recibido = data.get("recibido")
+        if recibido is not None:
+            recibido = _numero(recibido, "recibido")
+        return Lectura(dispositivo, alertas, motores, tuple(angulos), tuple(referencias), recibido, None)
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+# ✍️ Escritor único: el estado de los dispositivos solo se modifica en este hilo.
+# El hilo serial y la ingesta MQTT encolan sus lotes sin esperar (con la política BLOQUEAR
+# el hilo serial sí espera); las rutas que modifican el estado (limpiar) encolan un comando
+# y esperan su resultado. Tras cada ronda el escritor
+# publica instantáneas inmutables que las rutas leen sin locks (ver EstadoDispositivo.publicar
+# en server.py), así una consulta lenta nunca frena la ingesta ni ve un estado a medias.
+# `periodica` (opcional) corre en el mismo hilo cada `intervalo` s, haya o no lotes:
+# sirve para el estado que cambia con el paso del tiempo (ventanas deslizantes).
+# La cola está acotada en tramas (`max_pendientes`): si una ráfaga la llena se aplica la
+# política elegida y se cuenta cada trama descartada o fusionada. Siempre se descartan
+# tramas enteras (ya separadas), nunca bytes sueltos; los comandos no cuentan ni se descartan.
+
+MAX_TRAMAS_RONDA = 512     # Lotes encolados se juntan hasta este tamaño antes de procesarlos
+MAX_PENDIENTES = 50_000    # Tramas encoladas como máximo
+
+# Políticas con la cola llena
+DESCARTAR_ANTIGUAS = "descartar_antiguas"      # Se pierden las tramas más viejas
+ULTIMA_POR_DISPOSITIVO = "ultima_por_dispositivo"  # Lo encolado se reduce a la última trama de cada cinturón
+BLOQUEAR = "bloquear"                          # Quien produce espera a que haya lugar
+POLITICAS = (DESCARTAR_ANTIGUAS, ULTIMA_POR_DISPOSITIVO, BLOQUEAR)
+
+log = logging.getLogger("postura.escritor")
+
+_Comando = namedtuple("_Comando", "funcion argumentos futuro")
+_FIN = object()
+
+
+def _es_lote(item):
+    return item is not _FIN and not isinstance(item, _Comando)
+
+
+class EscritorUnico:
+    """Hilo dueño del estado: `procesar_lote(lote)` se llama siempre desde aquí"""
+
+    def __init__(self, procesar_lote, max_tramas=MAX_TRAMAS_RONDA, periodica=None, intervalo=1.0,
+                 max_pendientes=MAX_PENDIENTES, politica=DESCARTAR_ANTIGUAS):
+        if politica not in POLITICAS:
+            raise ValueError(f"política desconocida: {politica} (válidas: {', '.join(POLITICAS)})")
+        self.procesar_lote = procesar_lote
+        self.max_tramas = max_tramas
+        self.periodica = periodica
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self.politica = politica
+        self.cola = deque()  # Lotes, comandos y _FIN en orden de llegada
+        self.tramas = 0      # Tramas en los lotes de la cola
+        self.descartadas = 0
+        self.coalescidas = 0
+        self.bloqueos = 0    # Veces que un productor tuvo que esperar lugar
+        self.segundos_bloqueado = 0.0
+        self._lock = threading.Lock()
+        self._hay_items = threading.Condition(self._lock)
+        self._hay_lugar = threading.Condition(self._lock)
+        self.hilo = None
+        self.rondas = 0
+
+    @property
+    def activo(self):
+        return self.hilo is not None and self.hilo.is_alive()
+
+    def iniciar(self):
+        if not self.activo:
+            self.hilo = threading.Thread(target=self._bucle, name="escritor", daemon=True)
+            self.hilo.start()
+        return self
+
+    def detener(self, espera=5.0):
+        """Procesa lo que ya estaba encolado y termina el hilo"""
+        if self.activo:
+            self._poner(_FIN)
+            self.hilo.join(espera)
+        self.hilo = None
+
+    def encolar(self, lote, esperar=True):
+        """Entrega un lote [(dispositivo_id, bytes)]. Con la cola llena aplica la política; con
+        BLOQUEAR solo espera si `esperar` (el event loop no debe bloquearse: ahí se descartan
+        las más antiguas)."""
+        if not lote:
+            return
+        with self._lock:
+            if self.tramas + len(lote) > self.max_pendientes:
+                exceso = self._desbordar(len(lote), esperar)
+                if exceso > 0:
+                    # El lote solo ya no entra: se quedan sus últimas tramas
+                    lote = lote[exceso:]
+                    self.descartadas += exceso
+            self.cola.append(lote)
+            self.tramas += len(lote)
+            self._hay_items.notify()
+
+    def ejecutar(self, funcion, *argumentos, timeout=5.0):
+        """Ejecuta `funcion` en el hilo escritor (entre dos lotes) y devuelve su resultado.
+        Sin hilo activo (pruebas, scripts) se ejecuta directamente."""
+        if not self.activo or threading.current_thread() is self.hilo:
+            return funcion(*argumentos)
+        futuro = Future()
+        self._poner(_Comando(funcion, argumentos, futuro))
+        return futuro.result(timeout)
+
+    def pendientes(self):
+        """Tramas esperando en la cola"""
+        return self.tramas
+
+    def _poner(self, item):
+        with self._lock:
+            self.cola.append(item)
+            self._hay_items.notify()
+
+    # --- Cola llena (con el lock tomado) ---
+    def _desbordar(self, n, esperar):
+        """Hace lugar para n tramas según la política; devuelve las que aún sobran"""
+        if self.politica == BLOQUEAR and esperar and self.activo and threading.current_thread() is not self.hilo:
+            self.bloqueos += 1
+            inicio = time.monotonic()
+            while self.tramas and self.tramas + n > self.max_pendientes and self.activo:
+                self._hay_lugar.wait(0.5)
+            self.segundos_bloqueado += time.monotonic() - inicio
+        elif self.politica == ULTIMA_POR_DISPOSITIVO:
+            self._coalescer()
+        return self._descartar(self.tramas + n - self.max_pendientes)
+
+    def _descartar(self, exceso):
+        """Quita `exceso` tramas de los lotes más viejos; devuelve cuántas faltaron quitar"""
+        i = 0
+        while exceso > 0 and i < len(self.cola):
+            lote = self.cola[i]
+            if not _es_lote(lote):
+                i += 1
+                continue
+            quitadas = min(len(lote), exceso)
+            if quitadas == len(lote):
+                del self.cola[i]
+            else:
+                self.cola[i] = lote[quitadas:]  # Copia: la lista es de quien la encoló
+            self.tramas -= quitadas
+            self.descartadas += quitadas
+            exceso -= quitadas
+        return exceso
+
+    def _coalescer(self):
+        """Cada tramo de lotes entre dos comandos se reduce a la última trama de cada dispositivo"""
+        cola, ultimas = deque(), {}
+        for item in self.cola:
+            if _es_lote(item):
+                for dispositivo_id, trama in item:
+                    ultimas.pop(dispositivo_id, None)  # Queda en el orden de su última llegada
+                    ultimas[dispositivo_id] = trama
+                continue
+            if ultimas:
+                cola.append(list(ultimas.items()))
+                ultimas = {}
+            cola.append(item)
+        if ultimas:
+            cola.append(list(ultimas.items()))
+        tramas = sum(len(item) for item in cola if _es_lote(item))
+        self.coalescidas += self.tramas - tramas
+        self.cola, self.tramas = cola, tramas
+
+    # --- Hilo escritor ---
+    def _tomar(self, espera):
+        """Próximo comando, o los lotes que ya estén encolados juntos hasta max_tramas;
+        None si pasa `espera` sin nada"""
+        with self._lock:
+            if not self.cola and not self._hay_items.wait_for(lambda: self.cola, espera):
+                return None
+            item = self.cola.popleft()
+            if not _es_lote(item):
+                return item
+            lote = item
+            while self.cola and len(lote) < self.max_tramas and _es_lote(self.cola[0]):
+                if lote is item:
+                    lote = list(item)  # No modificar la lista de quien la encoló
+                lote.extend(self.cola.popleft())
+            self.tramas -= len(lote)
+            self._hay_lugar.notify_all()
+            return lote
+
+    def _bucle(self):
+        espera = None
+        proxima = time.monotonic() + self.intervalo
+        while True:
+            if self.periodica is not None:
+                espera = proxima - time.monotonic()
+                if espera <= 0:
+                    self._ejecutar_periodica()
+                    proxima = time.monotonic() + self.intervalo
+                    continue
+            item = self._tomar(espera)
+            if item is None:
+                continue
+            if item is _FIN:
+                return
+            if isinstance(item, _Comando):
+                self._ejecutar_comando(item)
+                continue
+            try:
+                self.procesar_lote(item)
+            except Exception:
+                log.exception("❌ Error en el escritor de ingesta")
+            self.rondas += 1
+
+    def _ejecutar_periodica(self):
+        try:
+            self.periodica()
+        except Exception:
+            log.exception("❌ Error en la tarea periódica del escritor")
+
+    def _ejecutar_comando(self, comando):
+        if not comando.futuro.set_running_or_notify_cancel():
+            return
+        try:
+            comando.futuro.set_result(comando.funcion(*comando.argumentos))
+        except BaseException as e:
+            comando.futuro.set_exception(e)
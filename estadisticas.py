@@ -0,0 +1,233 @@
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# 📊 Estadísticas incrementales: O(1) por muestra, sin recorrer eventos ni historial
+# - Contadores del día con cambio de día exacto (se calcula la medianoche local una vez por día)
+# - Ventana móvil de 60 minutos en cubetas de 1 minuto
+# - Tiempo en buena/mala postura ponderado por el intervalo entre muestras
+# reconstruir() deja el mismo estado a partir de un historial ya evaluado, en bloque con NumPy.
+
+SENSORES = ("lumbar", "toracico", "hombro")
+MINUTOS_VENTANA = 60
+MAX_INTERVALO = 5.0  # Segundos: un hueco mayor (cinturón apagado) no cuenta como tiempo de uso
+
+
+def fin_del_dia(epoch):
+    momento = datetime.fromtimestamp(epoch)
+    manana = datetime.combine(momento.date() + timedelta(days=1), datetime.min.time())
+    return manana.timestamp()
+
+
+def inicio_del_dia(epoch):
+    return datetime.combine(datetime.fromtimestamp(epoch).date(), datetime.min.time()).timestamp()
+
+
+class EstadisticasIncrementales:
+    __slots__ = (
+        "total_malas", "malas_hoy", "fin_dia", "segundos_buena_hoy", "segundos_mala_hoy",
+        "sensor_total", "sensor_hoy", "ultimo_epoch", "ultimas_alertas",
+        "cubeta_minuto", "cubeta_sesiones", "cubeta_buena", "cubeta_mala",
+    )
+
+    def __init__(self):
+        self.total_malas = 0
+        self.malas_hoy = 0
+        self.fin_dia = 0.0
+        self.segundos_buena_hoy = 0.0
+        self.segundos_mala_hoy = 0.0
+        self.sensor_total = array('l', (0, 0, 0))  # Sesiones en las que participó cada sensor
+        self.sensor_hoy = array('l', (0, 0, 0))
+        self.ultimo_epoch = 0.0
+        self.ultimas_alertas = 0
+        # Ventana móvil: cubeta i guarda el minuto absoluto que representa y sus acumulados
+        self.cubeta_minuto = array('q', [-1]) * MINUTOS_VENTANA
+        self.cubeta_sesiones = array('l', [0]) * MINUTOS_VENTANA
+        self.cubeta_buena = array('d', [0.0]) * MINUTOS_VENTANA
+        self.cubeta_mala = array('d', [0.0]) * MINUTOS_VENTANA
+
+    def _cubeta(self, epoch):
+        minuto = int(epoch // 60)
+        i = minuto % MINUTOS_VENTANA
+        if self.cubeta_minuto[i] != minuto:
+            # La cubeta pertenecía a un minuto fuera de la ventana: reciclarla
+            self.cubeta_minuto[i] = minuto
+            self.cubeta_sesiones[i] = 0
+            self.cubeta_buena[i] = 0.0
+            self.cubeta_mala[i] = 0.0
+        return i
+
+    def registrar(self, epoch, alertas, nueva_sesion):
+        """Acumula una muestra. nueva_sesion=True si inicia una sesión de mala postura"""
+        if epoch >= self.fin_dia:
+            # Cambio de día (o primera muestra)
+            self.fin_dia = fin_del_dia(epoch)
+            self.malas_hoy = 0
+            self.segundos_buena_hoy = 0.0
+            self.segundos_mala_hoy = 0.0
+            self.sensor_hoy[0] = self.sensor_hoy[1] = self.sensor_hoy[2] = 0
+            self.ultimo_epoch = 0.0  # No arrastrar tiempo del día anterior
+
+        i = self._cubeta(epoch)
+
+        # El intervalo desde la muestra anterior se atribuye al estado anterior
+        if self.ultimo_epoch:
+            dt = epoch - self.ultimo_epoch
+            if 0 < dt <= MAX_INTERVALO:
+                if self.ultimas_alertas:
+                    self.segundos_mala_hoy += dt
+                    self.cubeta_mala[i] += dt
+                else:
+                    self.segundos_buena_hoy += dt
+                    self.cubeta_buena[i] += dt
+        self.ultimo_epoch = epoch
+        self.ultimas_alertas = alertas
+
+        if nueva_sesion:
+            self.total_malas += 1
+            self.malas_hoy += 1
+            self.cubeta_sesiones[i] += 1
+            for s in range(3):
+                if alertas & (1 << s):
+                    self.sensor_total[s] += 1
+                    self.sensor_hoy[s] += 1
+
+    def reconstruir(self, ts, alertas, primeras, quitadas=()):
+        """Rehace el día y la última hora como si registrar() hubiera visto (ts, alertas) en orden.
+
+        `primeras`: índices de las muestras que abren sesión. Los totales históricos se corrigen:
+        restan las sesiones reemplazadas (`quitadas`: bits de alerta con que empezó cada una)
+        y suman las nuevas.
+        """
+        if not len(ts):
+            return
+        alertas = np.asarray(alertas, dtype=np.int64)
+        quitadas = np.asarray(quitadas, dtype=np.int64)
+        nuevas = alertas[primeras]
+        # Sin bajar de cero: lo reemplazado puede ser anterior al arranque (no se había contado)
+        self.total_malas = max(0, self.total_malas - len(quitadas)) + len(nuevas)
+        inicio = inicio_del_dia(ts[-1])
+        k0 = int(np.searchsorted(ts, inicio))
+        hoy = nuevas[primeras >= k0]
+        self.fin_dia = fin_del_dia(ts[-1])
+        self.malas_hoy = len(hoy)
+        for s in range(3):
+            bit = 1 << s
+            self.sensor_total[s] = (max(0, self.sensor_total[s] - int(np.count_nonzero(quitadas & bit)))
+                                    + int(np.count_nonzero(nuevas & bit)))
+            self.sensor_hoy[s] = int(np.count_nonzero(hoy & bit))
+
+        # Intervalo de cada muestra con la anterior, atribuido al estado anterior
+        dt = np.empty(len(ts))
+        dt[0] = np.nan
+        dt[1:] = np.diff(ts)
+        valido = (dt > 0) & (dt <= MAX_INTERVALO)
+        valido[k0] = False  # La primera muestra del día no arrastra tiempo del anterior
+        previa_mala = np.zeros(len(ts), dtype=bool)
+        previa_mala[1:] = alertas[:-1] != 0
+        mala = np.where(valido & previa_mala, dt, 0.0)
+        buena = np.where(valido & ~previa_mala, dt, 0.0)
+        self.segundos_mala_hoy = float(mala[k0:].sum())
+        self.segundos_buena_hoy = float(buena[k0:].sum())
+
+        # Cubetas de la última hora
+        minutos = (ts // 60).astype(np.int64)
+        desde = int(np.searchsorted(minutos, minutos[-1] - MINUTOS_VENTANA, side="right"))
+        presentes, cubeta = np.unique(minutos[desde:], return_inverse=True)
+        sesiones = np.bincount(cubeta[primeras[primeras >= desde] - desde], minlength=len(presentes))
+        buena_minuto = np.bincount(cubeta, buena[desde:], len(presentes))
+        mala_minuto = np.bincount(cubeta, mala[desde:], len(presentes))
+        for i in range(MINUTOS_VENTANA):
+            self.cubeta_minuto[i] = -1
+            self.cubeta_sesiones[i] = 0
+            self.cubeta_buena[i] = self.cubeta_mala[i] = 0.0
+        for minuto, n, b, m in zip(presentes.tolist(), sesiones.tolist(), buena_minuto.tolist(), mala_minuto.tolist()):
+            i = minuto % MINUTOS_VENTANA
+            self.cubeta_minuto[i] = minuto
+            self.cubeta_sesiones[i] = n
+            self.cubeta_buena[i] = b
+            self.cubeta_mala[i] = m
+        self.ultimo_epoch = float(ts[-1])
+        self.ultimas_alertas = int(alertas[-1])
+
+    def copia(self):
+        """Copia independiente (para publicarla en una instantánea de solo lectura)"""
+        nueva = EstadisticasIncrementales.__new__(EstadisticasIncrementales)
+        for campo in self.__slots__:
+            valor = getattr(self, campo)
+            setattr(nueva, campo, valor[:] if type(valor) is array else valor)
+        return nueva
+
+    def volcar(self, destino):
+        """Escribe el estado como TAMANO_VOLCADO números en `destino` (p. ej. memoria compartida)"""
+        i = 0
+        for campo in self.__slots__:
+            valor = getattr(self, campo)
+            if type(valor) is array:
+                destino[i:i + len(valor)] = valor
+                i += len(valor)
+            else:
+                destino[i] = valor
+                i += 1
+
+    @classmethod
+    def restaurar(cls, origen):
+        """Inversa de volcar()"""
+        valores = origen.tolist() if hasattr(origen, "tolist") else list(origen)
+        nueva = cls.__new__(cls)
+        i = 0
+        for campo, molde in zip(cls.__slots__, _MOLDES):
+            if type(molde) is array:
+                n = len(molde)
+                tipo = float if molde.typecode == 'd' else int
+                setattr(nueva, campo, array(molde.typecode, map(tipo, valores[i:i + n])))
+                i += n
+            else:
+                setattr(nueva, campo, type(molde)(valores[i]))
+                i += 1
+        return nueva
+
+    def _ventana(self, ahora):
+        desde = int(ahora // 60) - MINUTOS_VENTANA
+        sesiones, buena, mala = 0, 0.0, 0.0
+        for i in range(MINUTOS_VENTANA):
+            if self.cubeta_minuto[i] > desde:
+                sesiones += self.cubeta_sesiones[i]
+                buena += self.cubeta_buena[i]
+                mala += self.cubeta_mala[i]
+        return sesiones, buena, mala
+
+    def resumen(self, ahora):
+        # Si el día ya cambió pero no han llegado muestras, lo de "hoy" es cero
+        hoy_vigente = ahora < self.fin_dia
+        malas_hoy = self.malas_hoy if hoy_vigente else 0
+        buena_hoy = self.segundos_buena_hoy if hoy_vigente else 0.0
+        mala_hoy = self.segundos_mala_hoy if hoy_vigente else 0.0
+        sesiones_hora, buena_hora, mala_hora = self._ventana(ahora)
+        return {
+            "total_malas": self.total_malas,
+            "malas_hoy": malas_hoy,
+            "porcentaje_buena": porcentaje(buena_hoy, mala_hoy),
+            "segundos_buena_hoy": round(buena_hoy, 1),
+            "segundos_mala_hoy": round(mala_hoy, 1),
+            "malas_ultima_hora": sesiones_hora,
+            "porcentaje_buena_ultima_hora": porcentaje(buena_hora, mala_hora),
+            "por_sensor": {
+                sensor: {
+                    "total": self.sensor_total[s],
+                    "hoy": self.sensor_hoy[s] if hoy_vigente else 0
+                }
+                for s, sensor in enumerate(SENSORES)
+            }
+        }
+
+
+# Números que ocupa volcar(): escalares + arreglos por sensor + cubetas de la ventana
+_MOLDES = [getattr(EstadisticasIncrementales(), c) for c in EstadisticasIncrementales.__slots__]
+TAMANO_VOLCADO = sum(len(v) if type(v) is array else 1 for v in _MOLDES)
+
+
+def porcentaje(buena, mala):
+    total = buena + mala
+    return round(100 * buena / total, 1) if total else 100
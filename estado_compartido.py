@@ -0,0 +1,285 @@
+import logging
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from buffer_circular import BufferCircular
+from estadisticas import EstadisticasIncrementales, TAMANO_VOLCADO
+from analitica import TAMANO_RESUMEN
+
+# 🧠 Estado en memoria compartida: un proceso de ingesta escribe, N procesos de API leen
+# Un segmento `multiprocessing.shared_memory` con una cabecera y un registro de tamaño fijo
+# por dispositivo (último estado publicado, eventos, estadísticas y el historial circular).
+# Cada registro está protegido por un seqlock: el escritor deja la secuencia impar mientras
+# escribe y par al terminar; el lector copia y reintenta si la secuencia cambió entre medio.
+# Los lectores nunca bloquean al escritor (x86 y ARM64 con el GIL: las escrituras numpy son
+# stores simples y cada lectura de la secuencia pasa por el intérprete, que ordena los accesos).
+
+MAGIA = 0x50535431           # "PST1"
+FORMATO = 4
+MAX_DISPOSITIVOS = 10_000    # Registros del segmento (~7,7 KB c/u con 200 muestras; la memoria se ocupa al usarlos)
+MAX_ID = 64                  # Bytes UTF-8 del id de dispositivo
+MAX_REINTENTOS = 1000        # Lecturas fallidas seguidas antes de rendirse (escritor colgado)
+
+FUENTE_BLUETOOTH, FUENTE_MQTT = 1, 2   # Bits del campo `conexion` de la cabecera
+
+log = logging.getLogger("postura.compartido")
+
+CABECERA = np.dtype([
+    ("magia", "<u4"), ("formato", "<u4"), ("max_dispositivos", "<u4"), ("capacidad", "<u4"),
+    ("max_eventos", "<u4"), ("n_dispositivos", "<u4"), ("conexion", "<u4"), ("latido", "<f8"),
+], align=True)
+
+
+class ErrorSegmento(RuntimeError):
+    pass
+
+
+class SeqlockOcupado(ErrorSegmento):
+    """El registro estuvo en escritura durante MAX_REINTENTOS lecturas seguidas"""
+
+
+def diseno_registro(capacidad, max_eventos):
+    return np.dtype([
+        ("secuencia", "<u8"),
+        ("id", f"S{MAX_ID}"),
+        ("version", "<i8"), ("ultima_muestra", "<f8"),
+        ("angulos", "<f4", 3), ("referencias", "<f4", 3),
+        ("alertas", "u1"), ("motores", "u1"), ("mala_postura", "u1"),
+        ("total", "<i8"), ("n", "<i8"), ("tramas_perdidas", "<i8"),
+        # Pedidos de limpieza: los procesos de API suben `limpiar_pedido`, la ingesta iguala `limpiar_atendido`
+        ("limpiar_pedido", "<u8"), ("limpiar_atendido", "<u8"),
+        ("n_eventos", "<i4"), ("eventos_ts", "<f8", max_eventos), ("eventos_bits", "u1", max_eventos),
+        ("stats", "<f8", TAMANO_VOLCADO), ("analitica", "<f8", TAMANO_RESUMEN),
+        # Sesión de mala postura abierta (inicio 0 = ninguna); las cerradas se leen de SQLite
+        ("sesion_inicio", "<f8"), ("sesion_ultima", "<f8"), ("sesion_bits", "u1"), ("sesion_pico", "<f4"),
+        # Sube cuando se reescriben las sesiones guardadas: los lectores vuelven a leerlas de cero
+        ("generacion_sesiones", "<u8"),
+        ("h_ts", "<f8", capacidad), ("h_alertas", "u1", capacidad), ("h_angulos", "<f4", (capacidad, 3)),
+    ], align=True)
+
+
+class SegmentoCompartido:
+    """Cabecera + registros de dispositivos sobre un bloque de memoria compartida"""
+
+    def __init__(self, memoria, creador):
+        self.memoria = memoria
+        self.creador = creador
+        self.cabecera = np.ndarray((), CABECERA, buffer=memoria.buf)
+        if int(self.cabecera["magia"]) != MAGIA or int(self.cabecera["formato"]) != FORMATO:
+            raise ErrorSegmento(f"{memoria.name}: no es un segmento de estado (formato {FORMATO})")
+        self.capacidad = int(self.cabecera["capacidad"])
+        self.max_eventos = int(self.cabecera["max_eventos"])
+        self.max_dispositivos = int(self.cabecera["max_dispositivos"])
+        self.registros = np.ndarray((self.max_dispositivos,), diseno_registro(self.capacidad, self.max_eventos),
+                                    buffer=memoria.buf, offset=CABECERA.itemsize)
+        # Vistas por campo (más rápidas que indexar el arreglo estructurado en cada acceso)
+        self.campos = {nombre: self.registros[nombre] for nombre in self.registros.dtype.names}
+        self.secuencia = self.campos["secuencia"]
+        self.version = self.campos["version"]
+        self.indices = {}       # id -> índice del registro
+        self.espejado = {}      # Solo escritor: índice -> total ya copiado al historial compartido
+
+    @classmethod
+    def crear(cls, capacidad, max_eventos, max_dispositivos=MAX_DISPOSITIVOS, nombre=None):
+        tamano = CABECERA.itemsize + max_dispositivos * diseno_registro(capacidad, max_eventos).itemsize
+        memoria = shared_memory.SharedMemory(name=nombre, create=True, size=tamano)
+        cabecera = np.ndarray((), CABECERA, buffer=memoria.buf)
+        cabecera[()] = (MAGIA, FORMATO, max_dispositivos, capacidad, max_eventos, 0, 0, 0.0)
+        return cls(memoria, creador=True)
+
+    @classmethod
+    def abrir(cls, nombre):
+        return cls(shared_memory.SharedMemory(name=nombre), creador=False)
+
+    @property
+    def nombre(self):
+        return self.memoria.name
+
+    def cerrar(self):
+        # Soltar las vistas numpy antes de cerrar el mmap (si no, BufferError)
+        self.cabecera = self.registros = self.campos = self.secuencia = self.version = None
+        self.memoria.close()
+        if self.creador:
+            self.memoria.unlink()
+
+    # --- Cabecera ---
+    def fijar_conexion(self, bits):
+        """Estado de las fuentes (FUENTE_*) y latido del proceso de ingesta"""
+        self.cabecera["conexion"] = bits
+        self.cabecera["latido"] = time.time()
+
+    def conexion(self):
+        return int(self.cabecera["conexion"])
+
+    def latido(self):
+        return float(self.cabecera["latido"])
+
+    # --- Registro de dispositivos ---
+    def registrar(self, dispositivo_id):
+        """Índice del dispositivo, reservando un registro nuevo si hace falta (solo escritor)"""
+        indice = self.indices.get(dispositivo_id)
+        if indice is not None:
+            return indice
+        clave = dispositivo_id.encode()
+        n = int(self.cabecera["n_dispositivos"])
+        if n >= self.max_dispositivos or len(clave) > MAX_ID:
+            # Los procesos de API no lo ven: responden 503 (segmento lleno) o 404 (id largo)
+            log.error("❌ [%s] No se comparte con los procesos de API: %s", dispositivo_id,
+                      f"segmento lleno ({self.max_dispositivos} dispositivos)" if n >= self.max_dispositivos
+                      else f"id de más de {MAX_ID} bytes")
+            self.indices[dispositivo_id] = -1
+            return -1
+        self.campos["id"][n] = clave
+        self.cabecera["n_dispositivos"] = n + 1  # Después del id: los lectores solo ven registros completos
+        self.indices[dispositivo_id] = n
+        return n
+
+    def lleno(self):
+        return int(self.cabecera["n_dispositivos"]) >= self.max_dispositivos
+
+    def sincronizar(self):
+        """Ids publicados por el escritor que este proceso aún no conocía"""
+        nuevos = []
+        for indice in range(len(self.indices), int(self.cabecera["n_dispositivos"])):
+            dispositivo_id = bytes(self.campos["id"][indice]).decode()
+            self.indices[dispositivo_id] = indice
+            nuevos.append((dispositivo_id, indice))
+        return nuevos
+
+    # --- Escritura (proceso de ingesta) ---
+    def escribir(self, dispositivo):
+        """Copia la Instantanea publicada de `dispositivo` y sus muestras nuevas"""
+        i = self.registrar(dispositivo.dispositivo_id)
+        if i < 0:
+            return
+        inst = dispositivo.publicado
+        historial = dispositivo.historial
+        campos = self.campos
+        # El escritor es dueño del buffer local: se copian sus posiciones directamente.
+        # En el segmento la muestra k va en k % capacidad (el seqlock cubre la escritura)
+        desde = max(self.espejado.get(i, 0), inst.total - inst.n)
+        muestras = np.arange(desde, inst.total) if historial.ts is not None else ()
+
+        self.secuencia[i] += 1  # Impar: escritura en curso
+        if len(muestras):
+            locales, compartidas = muestras % historial.ranuras, muestras % self.capacidad
+            campos["h_ts"][i, compartidas] = historial.ts[locales]
+            campos["h_alertas"][i, compartidas] = historial.alertas[locales]
+            campos["h_angulos"][i, compartidas] = historial.angulos[locales]
+        campos["version"][i] = inst.version
+        campos["ultima_muestra"][i] = inst.ultima_muestra
+        campos["angulos"][i] = inst.angulos
+        campos["referencias"][i] = inst.referencias
+        campos["alertas"][i] = inst.alertas
+        campos["motores"][i] = inst.motores
+        campos["mala_postura"][i] = inst.mala_postura_activa
+        campos["total"][i] = inst.total
+        campos["n"][i] = inst.n
+        campos["tramas_perdidas"][i] = inst.tramas_perdidas
+        eventos = inst.eventos[:self.max_eventos]
+        campos["n_eventos"][i] = len(eventos)
+        if eventos:
+            campos["eventos_ts"][i, :len(eventos)] = [epoch for epoch, _ in eventos]
+            campos["eventos_bits"][i, :len(eventos)] = [bits for _, bits in eventos]
+        inst.stats.volcar(campos["stats"][i])
+        campos["analitica"][i] = inst.analitica
+        abierta = inst.sesion_abierta or (0.0, 0.0, 0, 0.0)
+        campos["sesion_inicio"][i], campos["sesion_ultima"][i], campos["sesion_bits"][i], campos["sesion_pico"][i] = abierta
+        campos["generacion_sesiones"][i] = inst.generacion_sesiones
+        self.secuencia[i] += 1  # Par: registro consistente
+        self.espejado[i] = inst.total
+
+    def reenviar_historial(self, dispositivo_id):
+        """El próximo escribir() copia el historial entero (p. ej. tras recalcular sus alertas)"""
+        self.espejado.pop(self.indices.get(dispositivo_id), None)
+
+    def pedidos_limpieza(self):
+        """[(id, pedido)] con limpiezas pendientes de atender (solo escritor)"""
+        pedido, atendido = self.campos["limpiar_pedido"], self.campos["limpiar_atendido"]
+        return [(dispositivo_id, int(pedido[i])) for dispositivo_id, i in self.indices.items()
+                if i >= 0 and pedido[i] != atendido[i]]
+
+    def atender_limpieza(self, dispositivo_id, pedido):
+        self.campos["limpiar_atendido"][self.indices[dispositivo_id]] = pedido
+
+    # --- Lectura (procesos de API) ---
+    def _leer(self, i, copiar):
+        secuencia = self.secuencia
+        for intento in range(MAX_REINTENTOS):
+            antes = int(secuencia[i])
+            if not antes & 1:
+                resultado = copiar(i)
+                if int(secuencia[i]) == antes:
+                    return resultado
+            if intento > 10:
+                time.sleep(0)  # Ceder el procesador al escritor
+        raise SeqlockOcupado(f"registro {i} ocupado")
+
+    def leer(self, i, instantanea):
+        """Instantanea del registro `i` (mismos campos que la publicada por el escritor)"""
+        campos = self.campos
+
+        def copiar(i):
+            n_eventos = int(campos["n_eventos"][i])
+            return instantanea(
+                int(campos["version"][i]), float(campos["ultima_muestra"][i]),
+                tuple(campos["angulos"][i].tolist()), tuple(campos["referencias"][i].tolist()),
+                int(campos["alertas"][i]), int(campos["motores"][i]), bool(campos["mala_postura"][i]),
+                tuple(zip(campos["eventos_ts"][i, :n_eventos].tolist(),
+                          campos["eventos_bits"][i, :n_eventos].tolist())),
+                campos["stats"][i].copy(),
+                int(campos["total"][i]), int(campos["n"][i]), int(campos["tramas_perdidas"][i]),
+                tuple(campos["analitica"][i].tolist()),
+                None,  # sesiones: los procesos de API llevan su propio índice
+                (float(campos["sesion_inicio"][i]), float(campos["sesion_ultima"][i]),
+                 int(campos["sesion_bits"][i]), float(campos["sesion_pico"][i]))
+                if campos["sesion_inicio"][i] else None,
+                int(campos["generacion_sesiones"][i]))
+
+        inst = self._leer(i, copiar)
+        # Reconstruir las estadísticas fuera del seqlock (es lo más lento y ya es una copia)
+        return inst._replace(stats=EstadisticasIncrementales.restaurar(inst.stats))
+
+    def leer_rango(self, i, primero, ultimo):
+        """Copia de las muestras [primero, ultimo) del historial compartido, ya validada"""
+        campos = self.campos
+        posiciones = np.arange(primero, ultimo) % self.capacidad
+
+        def copiar(i):
+            return (campos["h_ts"][i, posiciones], campos["h_alertas"][i, posiciones],
+                    campos["h_angulos"][i, posiciones], int(campos["total"][i]))
+
+        ts, alertas, angulos, total = self._leer(i, copiar)
+        # Las muestras más viejas que total - capacidad ya se sobrescribieron
+        vigente = total - self.capacidad
+        if primero < vigente:
+            corte = min(vigente - primero, ultimo - primero)
+            ts, alertas, angulos = ts[corte:], alertas[corte:], angulos[corte:]
+        return ts, alertas, angulos
+
+    def pedir_limpieza(self, i):
+        """Marca el pedido y devuelve el número a esperar con limpieza_atendida()"""
+        pedido = int(self.campos["limpiar_pedido"][i]) + 1
+        self.campos["limpiar_pedido"][i] = pedido
+        return pedido
+
+    def limpieza_atendida(self, i, pedido):
+        return int(self.campos["limpiar_atendido"][i]) >= pedido
+
+
+class HistorialCompartido(BufferCircular):
+    """Vista de solo lectura del historial de un registro; ventana()/desde_cursor() de
+    BufferCircular funcionan igual (siempre con el total/n de una instantánea)"""
+    __slots__ = ("segmento", "indice")
+
+    def __init__(self, segmento, indice):
+        super().__init__(segmento.capacidad)
+        self.segmento = segmento
+        self.indice = indice
+
+    def rango(self, primero, ultimo):
+        if ultimo <= primero:
+            return (np.empty(0, np.float64), np.empty(0, np.uint8), np.empty((0, 3), np.float32))
+        return self.segmento.leer_rango(self.indice, primero, ultimo)
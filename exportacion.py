@@ -0,0 +1,195 @@
+import csv
+import io
+
+import numpy as np
+
+from particiones import DIA
+from reglas import SENSORES
+
+# 📤 Exportación masiva del historial en streaming: CSV, Arrow IPC (stream) o Parquet
+# Una cadena de generadores: bloques() lee las particiones día por día (o los agregados de
+# retencion.py) y arma columnas de a lo sumo FILAS_BLOQUE filas; a_csv()/a_arrow()/a_parquet()
+# serializan cada bloque y lo entregan apenas está listo. En memoria nunca hay más que un día
+# de un cinturón, sin importar el largo del rango.
+# Arrow y Parquet requieren pyarrow (opcional); sin él solo está CSV.
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+FILAS_BLOQUE = 65_536  # Filas por bloque (un record batch de Arrow / un row group de Parquet)
+
+# formato -> (tipo de contenido, extensión del archivo)
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def disponible(formato):
+    return formato == "csv" or pa is not None
+
+
+def campos(sensores, nivel=None):
+    """[(nombre, dtype)] de las columnas exportadas para esos sensores (nivel None = crudas)"""
+    lista = [("dispositivo", np.dtype(object)), ("timestamp", np.dtype("datetime64[ms]"))]
+    if nivel is not None:
+        lista.append(("muestras", np.dtype(np.uint32)))
+    lista.append(("alertas", np.dtype(np.uint8)))
+    for sensor in sensores:
+        if nivel is not None:
+            lista += [(f"angulo_{sensor}_min", np.dtype(np.float32)), (f"angulo_{sensor}", np.dtype(np.float32)),
+                      (f"angulo_{sensor}_max", np.dtype(np.float32))]
+        else:
+            lista.append((f"angulo_{sensor}", np.dtype(np.float32)))
+        lista.append((f"{sensor}_mala", np.dtype(bool)))
+    if nivel is not None:
+        lista += [("segundos_mala", np.dtype(np.float32)), ("segundos_buena", np.dtype(np.float32))]
+    return lista
+
+
+def _bloque(dispositivo_id, sensores, ts, alertas, angulos=None, registros=None):
+    """Columnas {nombre: arreglo} de un tramo (muestras crudas o registros agregados)"""
+    bloque = {
+        "dispositivo": np.full(len(ts), dispositivo_id, dtype=object),
+        "timestamp": (ts * 1000).astype("datetime64[ms]"),
+    }
+    if registros is not None:
+        bloque["muestras"] = registros["n"]
+    bloque["alertas"] = alertas
+    for sensor in sensores:
+        s = SENSORES.index(sensor)
+        if registros is not None:
+            bloque[f"angulo_{sensor}_min"] = registros["minimo"][:, s]
+            bloque[f"angulo_{sensor}"] = registros["media"][:, s]
+            bloque[f"angulo_{sensor}_max"] = registros["maximo"][:, s]
+        else:
+            bloque[f"angulo_{sensor}"] = angulos[:, s]
+        bloque[f"{sensor}_mala"] = (alertas & (1 << s)) != 0
+    if registros is not None:
+        bloque["segundos_mala"] = registros["segundos_mala"]
+        bloque["segundos_buena"] = registros["segundos_buena"]
+    return bloque
+
+
+def bloques(particiones, dispositivos, sensores, desde, hasta, compactador=None, nivel=None,
+            filas=FILAS_BLOQUE):
+    """Bloques de columnas de cada cinturón (uno tras otro) en [desde, hasta], en orden cronológico"""
+    for dispositivo_id in dispositivos:
+        if nivel is None:
+            dias = [dia for dia in particiones.dias(dispositivo_id) if desde // DIA <= dia <= hasta // DIA]
+        else:
+            primero = compactador.primero(dispositivo_id)
+            dias = [] if primero is None else range(int(max(desde, primero) // DIA), int(hasta // DIA) + 1)
+        for dia in dias:
+            # Un día por lectura; el borde final queda en el día siguiente
+            inicio, fin = max(desde, dia * DIA), min(hasta, np.nextafter((dia + 1) * DIA, 0))
+            if nivel is None:
+                ts, alertas, angulos = particiones.consultar(dispositivo_id, inicio, fin)
+                registros = None
+            else:
+                registros = compactador.consultar(dispositivo_id, nivel, inicio, fin)
+                registros = registros[registros["ts"] >= dia * DIA]  # La cubeta del borde ya salió el día anterior
+                ts, alertas, angulos = registros["ts"], registros["alertas"], None
+            for i in range(0, len(ts), filas):
+                parte = slice(i, i + filas)
+                yield _bloque(dispositivo_id, sensores, ts[parte], alertas[parte],
+                              None if angulos is None else angulos[parte],
+                              None if registros is None else registros[parte])
+
+
+def a_csv(bloques, campos):
+    """CSV con encabezado; timestamp en ISO 8601 UTC, ángulos con 2 decimales y booleanos 0/1"""
+    texto = io.StringIO()
+    escritor = csv.writer(texto, lineterminator="\n")
+    escritor.writerow([nombre for nombre, _ in campos])
+    yield texto.getvalue().encode()
+    for bloque in bloques:
+        texto.seek(0)
+        texto.truncate()
+        columnas = []
+        for nombre, tipo in campos:
+            valores = bloque[nombre]
+            if tipo.kind == "M":
+                valores = np.datetime_as_string(valores, unit="ms", timezone="UTC")
+            elif tipo.kind == "f":
+                valores = np.round(valores.astype(np.float64), 2)
+            elif tipo.kind == "b":
+                valores = valores.astype(np.uint8)
+            columnas.append(valores.tolist())
+        escritor.writerows(zip(*columnas))
+        yield texto.getvalue().encode()
+
+
+class _Tubo:
+    """Archivo de solo escritura que guarda lo escrito hasta el próximo vaciar()"""
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self.partes.append(datos)
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes.clear()
+        return datos
+
+
+def _esquema(campos):
+    return pa.schema([
+        (nombre, pa.string() if tipo.kind == "O" else
+         pa.timestamp("ms", tz="UTC") if tipo.kind == "M" else pa.from_numpy_dtype(tipo))
+        for nombre, tipo in campos
+    ])
+
+
+def _lote(bloque, esquema):
+    # Las columnas de los registros agregados son vistas con salto: se copian contiguas
+    return pa.record_batch([pa.array(np.ascontiguousarray(bloque[campo.name]), type=campo.type) for campo in esquema],
+                           schema=esquema)
+
+
+def a_arrow(bloques, campos):
+    """Arrow IPC en formato stream: un record batch por bloque"""
+    tubo, esquema = _Tubo(), _esquema(campos)
+    with pa.ipc.new_stream(pa.PythonFile(tubo, mode="w"), esquema) as escritor:
+        for bloque in bloques:
+            escritor.write_batch(_lote(bloque, esquema))
+            yield tubo.vaciar()
+    yield tubo.vaciar()  # Marca de fin del stream
+
+
+def a_parquet(bloques, campos):
+    """Parquet con un row group por bloque; el pie (metadatos) sale al final"""
+    tubo, esquema = _Tubo(), _esquema(campos)
+    with pq.ParquetWriter(pa.PythonFile(tubo, mode="w"), esquema, compression="zstd") as escritor:
+        for bloque in bloques:
+            escritor.write_table(pa.Table.from_batches([_lote(bloque, esquema)]))
+            yield tubo.vaciar()
+    yield tubo.vaciar()
+
+
+SERIALIZADORES = {"csv": a_csv, "arrow": a_arrow, "parquet": a_parquet}
+
+
+def exportar(formato, bloques, campos):
+    """Generador de bytes del formato pedido (para StreamingResponse)"""
+    return SERIALIZADORES[formato](bloques, campos)
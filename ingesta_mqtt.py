@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import paho.mqtt.client as mqtt
+
+# 📡 Ingesta MQTT dentro del event loop de uvicorn (sin hilos de paho)
+# El socket del cliente se registra en el loop con add_reader/add_writer,
+# igual que el ejemplo "loop_asyncio" de paho-mqtt.
+
+TOPICOS_POR_DEFECTO = ("cinturon/sensores", "cinturon/+/sensores")
+LOTE_MAX = 256          # Mensajes leídos por ráfaga antes de procesar el lote
+REINTENTO_SEGUNDOS = 5
+
+log = logging.getLogger("postura.mqtt")
+
+
+def dispositivo_desde_topico(topico, por_defecto):
+    """cinturon/<id>/sensores -> <id>; cinturon/sensores -> dispositivo por defecto"""
+    partes = topico.split("/")
+    if len(partes) == 3 and partes[2] == "sensores":
+        return partes[1]
+    return por_defecto
+
+
+def crear_cliente(client_id=""):
+    # paho-mqtt 2.x exige elegir la versión de la API de callbacks
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
+
+class IngestaMQTT:
+    """Suscriptor MQTT que entrega lotes de (dispositivo_id, payload) a `procesar_lote`"""
+
+    def __init__(self, broker, puerto, procesar_lote, topicos=TOPICOS_POR_DEFECTO,
+                 dispositivo_por_defecto="cinturon", qos=0, client_id=""):
+        self.broker = broker
+        self.puerto = puerto
+        self.procesar_lote = procesar_lote
+        self.topicos = tuple(topicos)
+        self.dispositivo_por_defecto = dispositivo_por_defecto
+        self.qos = qos
+        self.conectado = False
+        self.mensajes_recibidos = 0
+        self.reconexiones = 0
+        self.lote = []
+        self.loop = None
+        self._tarea_misc = None
+        self._tarea_reconexion = None
+        self._detenido = False
+
+        self.client = crear_cliente(client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    # --- Ciclo de vida ---
+    async def iniciar(self):
+        self.loop = asyncio.get_running_loop()
+        self._detenido = False
+        self._tarea_reconexion = self.loop.create_task(self._conectar())
+
+    async def detener(self):
+        self._detenido = True
+        if self._tarea_reconexion:
+            self._tarea_reconexion.cancel()
+        if self.conectado or self.client.socket() is not None:
+            self.client.disconnect()
+        if self._tarea_misc:
+            self._tarea_misc.cancel()
+
+    async def _conectar(self):
+        while not self._detenido:
+            try:
+                log.info("🔄 Conectando a MQTT: %s:%s", self.broker, self.puerto)
+                self.client.connect(self.broker, self.puerto, keepalive=60)
+                return
+            except OSError as e:
+                log.error("❌ Error conectando MQTT: %s", e)
+                log.warning("🔄 Reintentando MQTT en %s segundos...", REINTENTO_SEGUNDOS)
+                self.reconexiones += 1
+                await asyncio.sleep(REINTENTO_SEGUNDOS)
+
+    # --- Callbacks de paho ---
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if reason_code != 0:
+            log.error("❌ MQTT rechazó la conexión: %s", reason_code)
+            return
+        self.conectado = True
+        client.subscribe([(topico, self.qos) for topico in self.topicos])
+        log.info("✅ MQTT conectado: %s:%s -> %s", self.broker, self.puerto, ", ".join(self.topicos))
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.conectado = False
+
+    def _on_message(self, client, userdata, msg):
+        self.lote.append((dispositivo_desde_topico(msg.topic, self.dispositivo_por_defecto), msg.payload))
+
+    # --- Integración del socket con asyncio ---
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, self._leer)
+        self._tarea_misc = self.loop.create_task(self._loop_misc())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.conectado = False
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        if self._tarea_misc:
+            self._tarea_misc.cancel()
+            self._tarea_misc = None
+        if not self._detenido:
+            log.warning("❌ Conexión MQTT perdida")
+            self._tarea_reconexion = self.loop.create_task(self._reconectar())
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    def _leer(self):
+        # Leer paquetes mientras sigan llegando publicaciones y procesarlas en un solo lote
+        for _ in range(LOTE_MAX):
+            antes = len(self.lote)
+            if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS or len(self.lote) == antes:
+                break
+        if self.lote:
+            lote, self.lote = self.lote, []
+            self.mensajes_recibidos += len(lote)
+            self.procesar_lote(lote)
+
+    async def _loop_misc(self):
+        # Keepalive (PINGREQ) y reintentos de QoS
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    async def _reconectar(self):
+        await asyncio.sleep(REINTENTO_SEGUNDOS)
+        while not self._detenido:
+            try:
+                log.info("🔄 Reintentando MQTT...")
+                self.reconexiones += 1
+                self.client.reconnect()
+                return
+            except OSError as e:
+                log.error("❌ Error reconectando MQTT: %s", e)
+                await asyncio.sleep(REINTENTO_SEGUNDOS)
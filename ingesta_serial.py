@@ -0,0 +1,220 @@
+import asyncio
+import fnmatch
+import glob
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from tramas import SeparadorTramas, leer_disponible
+
+# 🔌 Ingesta de varios puertos serie/Bluetooth en un solo event loop
+# Los puertos se configuran como lista o texto separado por comas, con comodines
+# ('/dev/rfcomm*', 'COM*') y 'puerto=id' para fijar el cinturón de cada uno. En POSIX cada
+# puerto se abre sin bloqueo y su descriptor se registra en el loop con add_reader (como el
+# socket en ingesta_mqtt.py): un solo hilo atiende decenas de enlaces SPP. En Windows el loop
+# no admite add_reader sobre puertos COM: cada puerto lee en un hilo de un pool propio con
+# leer_disponible() y el loop solo junta los resultados.
+# Cada puerto tiene su SeparadorTramas y entrega lotes [(dispositivo_id, trama)]; los
+# comodines se vuelven a buscar cada REVISION_PUERTOS s (puertos enchufados después).
+
+REINTENTO_SEGUNDOS = 5
+ESPERA_APERTURA = 2.0    # Segundos que el módulo Bluetooth tarda en reiniciarse al abrir el puerto
+REVISION_PUERTOS = 10.0  # Segundos entre búsquedas de puertos nuevos que coincidan con un comodín
+MAX_HILOS = 64           # Sin add_reader: hilos del pool de lectura como máximo
+
+log = logging.getLogger("postura.serial")
+
+try:
+    from serial.tools import list_ports
+except ImportError:
+    list_ports = None
+
+
+def parsear(puertos):
+    """'COM9' | 'COM9,COM10' | ['/dev/rfcomm*', 'COM7=cinturon-2'] -> [(patrón, id o None)]"""
+    if isinstance(puertos, str):
+        puertos = puertos.split(",")
+    especificacion = []
+    for entrada in puertos:
+        patron, _, dispositivo_id = entrada.strip().partition("=")
+        if patron.strip():
+            especificacion.append((patron.strip(), dispositivo_id.strip() or None))
+    return especificacion
+
+
+def es_comodin(patron):
+    return any(caracter in patron for caracter in "*?[")
+
+
+def resolver(especificacion, dispositivo_por_defecto=None):
+    """{ruta: dispositivo_id} de los puertos a leer ahora.
+
+    Un único puerto sin id usa `dispositivo_por_defecto`; con varios, cada uno se identifica
+    con el nombre del puerto (rfcomm0, COM7). Los comodines se buscan en el sistema de archivos
+    y en la lista de puertos de pyserial (los COM de Windows no son archivos).
+    """
+    unico = len(especificacion) == 1 and not es_comodin(especificacion[0][0])
+    rutas = {}
+    for patron, dispositivo_id in especificacion:
+        if es_comodin(patron):
+            encontrados = set(glob.glob(patron))
+            if list_ports is not None:
+                encontrados.update(p.device for p in list_ports.comports() if fnmatch.fnmatch(p.device, patron))
+        else:
+            encontrados = {patron}
+        for ruta in sorted(encontrados):
+            rutas.setdefault(ruta, dispositivo_id or (dispositivo_por_defecto if unico else os.path.basename(ruta)))
+    return rutas
+
+
+class PuertoSerial:
+    __slots__ = ("ruta", "dispositivo_id", "comodin", "serial", "separador", "conectado", "reconexiones", "tramas")
+
+    def __init__(self, ruta, dispositivo_id, comodin):
+        self.ruta = ruta
+        self.dispositivo_id = dispositivo_id
+        self.comodin = comodin  # Encontrado por un comodín: si desaparece se deja de reintentar
+        self.serial = None
+        self.separador = SeparadorTramas()
+        self.conectado = False
+        self.reconexiones = 0
+        self.tramas = 0
+
+
+class IngestaSerial:
+    """Lee todos los puertos configurados y entrega lotes [(dispositivo_id, trama)] a `procesar_lote`"""
+
+    def __init__(self, puertos, baudios, procesar_lote, dispositivo_por_defecto=None, hilos=None):
+        self.especificacion = parsear(puertos)
+        self.baudios = baudios
+        self.procesar_lote = procesar_lote
+        self.dispositivo_por_defecto = dispositivo_por_defecto
+        # add_reader solo existe con descriptores POSIX (y no en el ProactorEventLoop de Windows)
+        self.hilos = os.name != "posix" if hilos is None else hilos
+        self.puertos = {}  # ruta -> PuertoSerial
+        self.loop = None
+        self._parar = None
+        self._pool = None
+
+    # --- Estado (cualquier hilo) ---
+    def conectados(self):
+        return sum(puerto.conectado for puerto in list(self.puertos.values()))
+
+    def descartadas(self):
+        return sum(puerto.separador.descartadas for puerto in list(self.puertos.values()))
+
+    def reconexiones(self):
+        return sum(puerto.reconexiones for puerto in list(self.puertos.values()))
+
+    def estado(self):
+        return [{"puerto": p.ruta, "dispositivo": p.dispositivo_id, "conectado": p.conectado, "tramas": p.tramas}
+                for p in list(self.puertos.values())]
+
+    # --- Ciclo de vida ---
+    async def correr(self):
+        """Atiende los puertos hasta detener(); cada puerto se reconecta solo"""
+        self.loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        if self.hilos:
+            self._pool = ThreadPoolExecutor(MAX_HILOS, thread_name_prefix="serial")
+        tareas = {}
+        try:
+            while not self._parar.is_set():
+                literales = {patron for patron, _ in self.especificacion if not es_comodin(patron)}
+                for ruta, dispositivo_id in resolver(self.especificacion, self.dispositivo_por_defecto).items():
+                    if ruta not in tareas or tareas[ruta].done():
+                        puerto = self.puertos.get(ruta) or PuertoSerial(ruta, dispositivo_id, ruta not in literales)
+                        self.puertos[ruta] = puerto
+                        tareas[ruta] = self.loop.create_task(self._atender(puerto))
+                if not any(es_comodin(patron) for patron, _ in self.especificacion):
+                    await self._parar.wait()  # Lista fija: no hace falta volver a buscar
+                    break
+                try:
+                    await asyncio.wait_for(self._parar.wait(), REVISION_PUERTOS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for tarea in tareas.values():
+                tarea.cancel()
+            await asyncio.gather(*tareas.values(), return_exceptions=True)
+            if self._pool:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def detener(self):
+        """Desde cualquier hilo"""
+        if self.loop is not None and self._parar is not None:
+            self.loop.call_soon_threadsafe(self._parar.set)
+
+    # --- Un puerto ---
+    async def _atender(self, puerto):
+        while True:
+            try:
+                log.info("🔄 Conectando a Bluetooth: %s", puerto.ruta)
+                # La apertura de un enlace rfcomm puede tardar: fuera del loop
+                puerto.serial = await self.loop.run_in_executor(self._pool, self._abrir, puerto.ruta)
+                await asyncio.sleep(ESPERA_APERTURA)
+                puerto.separador.reiniciar()  # Descartar restos de una conexión anterior
+                puerto.conectado = True
+                log.info("✅ Bluetooth conectado: %s (%s)", puerto.ruta, puerto.dispositivo_id)
+                if self.hilos:
+                    await self._leer_con_hilo(puerto)
+                else:
+                    await self._leer_con_loop(puerto)
+            except (serial.SerialException, OSError) as e:
+                log.error("❌ Error serial en %s: %s", puerto.ruta, e)
+            except Exception:
+                log.exception("❌ Error Bluetooth en %s", puerto.ruta)
+            finally:
+                puerto.conectado = False
+                if puerto.serial is not None:
+                    puerto.serial.close()
+                    puerto.serial = None
+            if puerto.comodin and not os.path.exists(puerto.ruta) and puerto.ruta not in self._presentes():
+                log.warning("🔌 %s ya no está; se vuelve a buscar con el comodín", puerto.ruta)
+                return
+            puerto.reconexiones += 1
+            log.warning("🔄 Reintentando %s en %d segundos...", puerto.ruta, REINTENTO_SEGUNDOS)
+            await asyncio.sleep(REINTENTO_SEGUNDOS)
+
+    def _abrir(self, ruta):
+        # Sin hilos: lectura sin bloqueo (timeout=0), el loop avisa cuando hay datos
+        return serial.Serial(ruta, self.baudios, timeout=1 if self.hilos else 0)
+
+    @staticmethod
+    def _presentes():
+        return {p.device for p in list_ports.comports()} if list_ports is not None else set()
+
+    async def _leer_con_loop(self, puerto):
+        perdido = self.loop.create_future()
+        descriptor = puerto.serial.fileno()
+        self.loop.add_reader(descriptor, self._leer, puerto, perdido)
+        try:
+            await perdido  # Lanza la excepción del corte
+        finally:
+            self.loop.remove_reader(descriptor)
+
+    def _leer(self, puerto, perdido):
+        try:
+            datos = puerto.serial.read(max(1, puerto.serial.in_waiting))
+            if not datos:
+                # Listo para leer pero sin datos: el dispositivo se desconectó
+                raise serial.SerialException("el puerto no devolvió datos (¿desconectado?)")
+        except (serial.SerialException, OSError) as e:
+            if not perdido.done():
+                perdido.set_exception(e)
+            return
+        self._entregar(puerto, datos)
+
+    async def _leer_con_hilo(self, puerto):
+        while True:
+            self._entregar(puerto, await self.loop.run_in_executor(self._pool, leer_disponible, puerto.serial))
+
+    def _entregar(self, puerto, datos):
+        tramas = puerto.separador.alimentar(datos)
+        if tramas:
+            puerto.tramas += len(tramas)
+            dispositivo_id = puerto.dispositivo_id
+            self.procesar_lote([(dispositivo_id, trama) for trama in tramas])
@@ -0,0 +1,145 @@
+import bisect
+import math
+import threading
+
+# 📈 Métricas en formato de texto de Prometheus (0.0.4), sin dependencias externas
+# Contadores e histogramas se actualizan desde el hilo serial, MQTT y el event loop;
+# cada métrica tiene su propio lock (una suma bajo lock cuesta ~100 ns).
+# Los medidores se calculan al momento del scrape con una función.
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos: de decenas de µs (una trama) a segundos (long-poll)
+BUCKETS_LATENCIA = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def cabecera(self):
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.valores = {} if etiquetas else {(): 0}
+
+    def inc(self, *valores_etiquetas, n=1):
+        with self._lock:
+            self.valores[valores_etiquetas] = self.valores.get(valores_etiquetas, 0) + n
+
+    def exponer(self):
+        lineas = self.cabecera()
+        with self._lock:
+            valores = list(self.valores.items())
+        for clave, valor in valores:
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}")
+        return lineas
+
+
+class Medidor(_Metrica):
+    """Valor calculado al exponer: `funcion()` devuelve un número o [(valores_etiquetas, número)]"""
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=(), tipo=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+        if tipo:
+            self.tipo = tipo  # p. ej. "counter" para contadores que lleva otro módulo
+
+    def exponer(self):
+        lineas = self.cabecera()
+        resultado = self.funcion()
+        if resultado is None:
+            return lineas
+        if not self.etiquetas:
+            resultado = [((), resultado)]
+        for clave, valor in resultado:
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}")
+        return lineas
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # valores_etiquetas -> [conteos por bucket..., suma, total]
+
+    def observar(self, valor, *valores_etiquetas):
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self.series.get(valores_etiquetas)
+            if serie is None:
+                serie = self.series[valores_etiquetas] = [0] * (len(self.buckets) + 3)
+            serie[i] += 1  # Conteo no acumulado; se acumula al exponer
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exponer(self):
+        lineas = self.cabecera()
+        with self._lock:
+            series = [(clave, list(serie)) for clave, serie in self.series.items()]
+        for clave, serie in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (math.inf,), serie):
+                acumulado += conteo
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(serie[-2])}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {serie[-1]}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = []
+
+    def agregar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self.agregar(Contador(nombre, ayuda, etiquetas))
+
+    def medidor(self, nombre, ayuda, funcion, etiquetas=(), tipo=None):
+        return self.agregar(Medidor(nombre, ayuda, funcion, etiquetas, tipo))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        return self.agregar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def exponer(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
@@ -20,6 +20,12 @@ PubSubClient mqtt_client(espClient);
 String buffer_serial = "";
 unsigned long ultimo_heartbeat = 0;
 
+// Tramas binarias del cinturón (0xA5 | versión 1 | ... | CRC): se publican tal cual
+const uint8_t TRAMA_MAGIA = 0xA5;
+const size_t TAM_TRAMA_BINARIA = 17;
+uint8_t trama_binaria[TAM_TRAMA_BINARIA];
+size_t idx_binaria = 0;
+
 void setup() {
   Serial.begin(115200);
   Serial2.begin(115200, SERIAL_8N1, 16, 17); // RX=16, TX=17
@@ -49,7 +55,18 @@ void loop() {
   
   // Leer Arduino
   while (Serial2.available()) {
-    char c = Serial2.read();
+    uint8_t b = Serial2.read();
+    if (idx_binaria > 0 || (buffer_serial.length() == 0 && b == TRAMA_MAGIA)) {
+      trama_binaria[idx_binaria++] = b;
+      if (idx_binaria == TAM_TRAMA_BINARIA) {
+        if (mqtt_client.connected()) {
+          mqtt_client.publish("cinturon/sensores", trama_binaria, TAM_TRAMA_BINARIA);
+        }
+        idx_binaria = 0;
+      }
+      continue;
+    }
+    char c = (char)b;
     if (c == '\n') {
       if (buffer_serial.length() > 0) {
         procesar_datos(buffer_serial);
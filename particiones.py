@@ -0,0 +1,277 @@
+import calendar
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+# 🗂️ Historial completo en archivos binarios particionados por día
+# <directorio>/<dispositivo>/<AAAAMMDD>.seg: registros de ancho fijo (epoch float64, bits uint8,
+# 3 ángulos float32 = 21 B) en orden de tiempo, solo se agregan al final. Una consulta abre con
+# mmap únicamente los días del rango y ubica sus bordes con búsqueda binaria sobre el archivo,
+# así un día dentro de meses de datos solo toca las páginas que devuelve.
+# Muestras atrasadas (p. ej. el diario del puente) van a corridas extra del mismo día
+# (<AAAAMMDD>.1.seg, ...) para no reescribir nada; la lectura las mezcla por tiempo.
+# Un hilo escritor agrega por lotes; los lectores (también otros procesos) no toman locks:
+# un registro a medio escribir al final del archivo simplemente no se cuenta.
+# recalcular_alertas() reescribe en su lugar los bits de alerta (p. ej. al cambiar los umbrales).
+# Los días vencidos los borra el compactador (ver retencion.py) una vez agregados.
+
+REGISTRO = np.dtype([("ts", "<f8"), ("alertas", "u1"), ("angulos", "<f4", 3)])  # 21 B, sin relleno
+DIA = 86400                 # Particiones por día UTC (sin saltos por horario de verano)
+INTERVALO_ESCRITURA = 1.0   # Segundos máximos que una muestra espera en memoria
+MAX_PENDIENTES = 100_000    # Si el disco no da abasto se descartan las más antiguas
+MAX_PARTICIONES_ABIERTAS = 1024  # Finales de corrida recordados por el escritor
+
+log = logging.getLogger("postura.particiones")
+
+
+def _vacio():
+    return np.empty(0, np.float64), np.empty(0, np.uint8), np.empty((0, 3), np.float32)
+
+
+def _nombre(dia, corrida):
+    fecha = time.strftime("%Y%m%d", time.gmtime(dia * DIA))
+    return f"{fecha}.seg" if corrida == 0 else f"{fecha}.{corrida}.seg"
+
+
+def _dia(nombre):
+    """Día (epoch // DIA) de un archivo de partición, o None si no lo es"""
+    if not nombre.endswith(".seg"):
+        return None
+    try:
+        return calendar.timegm(time.strptime(nombre[:8], "%Y%m%d")) // DIA
+    except ValueError:
+        return None
+
+
+class HistorialParticionado:
+    """Cola de muestras + hilo escritor; consultar() lee los archivos con mmap"""
+
+    def __init__(self, directorio, intervalo=INTERVALO_ESCRITURA):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.activo = False
+        self.pendientes = []
+        self.escritas = 0
+        self.descartadas = 0
+        self.finales = {}   # (dispositivo, día) -> epoch final de cada corrida (solo el escritor)
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()  # Un solo _vaciar()/recalculo a la vez sobre los archivos
+        self._hay_lote = threading.Event()
+        self._hilo = None
+
+    def carpeta(self, dispositivo_id):
+        return os.path.join(self.directorio, quote(dispositivo_id, safe=""))
+
+    def iniciar(self):
+        os.makedirs(self.directorio, exist_ok=True)
+        self.activo = True
+        self._hilo = threading.Thread(target=self._escritor, name="historial-particionado", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self.activo = False
+        self._hay_lote.set()
+        if self._hilo:
+            self._hilo.join()
+            self._hilo = None
+
+    def guardar(self, dispositivo_id, muestra):
+        """muestra = (epoch, bits_alerta, ang_lumbar, ang_toracico, ang_hombro); no bloquea"""
+        with self._lock:
+            self.pendientes.append((dispositivo_id, muestra))
+            n = len(self.pendientes)
+            if n > MAX_PENDIENTES:
+                del self.pendientes[:n - MAX_PENDIENTES]
+                self.descartadas += n - MAX_PENDIENTES
+
+    # --- Escritura (hilo propio) ---
+    def _escritor(self):
+        while self.activo:
+            self._hay_lote.wait(self.intervalo)
+            with self._escritura:
+                self._vaciar()
+        with self._escritura:
+            self._vaciar()  # Último lote al apagar
+
+    def _vaciar(self):
+        with self._lock:
+            lote, self.pendientes = self.pendientes, []
+        por_dispositivo = {}
+        for dispositivo_id, muestra in lote:
+            por_dispositivo.setdefault(dispositivo_id, []).append(muestra)
+        for dispositivo_id, muestras in por_dispositivo.items():
+            # Conversión en bloque: filas (epoch, bits, 3 ángulos) -> registros ordenados por tiempo
+            filas = np.array(muestras, dtype=np.float64)
+            if len(filas) > 1 and np.any(filas[1:, 0] < filas[:-1, 0]):
+                filas = filas[np.argsort(filas[:, 0], kind="stable")]
+            registros = np.empty(len(filas), REGISTRO)
+            registros["ts"] = filas[:, 0]
+            registros["alertas"] = filas[:, 1]
+            registros["angulos"] = filas[:, 2:]
+            dias = (filas[:, 0] // DIA).astype(np.int64)
+            cortes = np.flatnonzero(np.diff(dias)) + 1
+            for parte in np.split(registros, cortes):
+                try:
+                    self._agregar(dispositivo_id, int(parte["ts"][0] // DIA), parte)
+                    self.escritas += len(parte)
+                except OSError as e:
+                    log.error("❌ Error guardando historial particionado (%d muestras perdidas): %s", len(parte), e)
+                    self.descartadas += len(parte)
+
+    def _agregar(self, dispositivo_id, dia, registros):
+        finales = self._finales(dispositivo_id, dia)
+        primero = float(registros["ts"][0])
+        # La corrida más avanzada que siga en orden con este lote; si ninguna, una nueva
+        corrida = max((k for k, final in enumerate(finales) if final <= primero),
+                      key=finales.__getitem__, default=len(finales))
+        if corrida == len(finales):
+            finales.append(0.0)
+        carpeta = self.carpeta(dispositivo_id)
+        os.makedirs(carpeta, exist_ok=True)
+        with open(os.path.join(carpeta, _nombre(dia, corrida)), "ab") as archivo:
+            archivo.write(registros.tobytes())
+        finales[corrida] = float(registros["ts"][-1])
+
+    def _finales(self, dispositivo_id, dia):
+        """Epoch final de cada corrida del día (se lee del disco la primera vez)"""
+        clave = (dispositivo_id, dia)
+        finales = self.finales.get(clave)
+        if finales is None:
+            if len(self.finales) >= MAX_PARTICIONES_ABIERTAS:
+                self.finales.clear()
+            finales = self.finales[clave] = []
+            carpeta = self.carpeta(dispositivo_id)
+            while os.path.exists(ruta := os.path.join(carpeta, _nombre(dia, len(finales)))):
+                n, sobrante = divmod(os.path.getsize(ruta), REGISTRO.itemsize)
+                if sobrante:
+                    # Escritura cortada (caída del proceso): descartar el registro incompleto
+                    os.truncate(ruta, n * REGISTRO.itemsize)
+                finales.append(float(np.fromfile(ruta, REGISTRO, 1, offset=(n - 1) * REGISTRO.itemsize)["ts"][0])
+                               if n else 0.0)
+        return finales
+
+    def recalcular_alertas(self, dispositivo_id, desde, calcular):
+        """Reescribe los bits de alerta de las muestras de un dispositivo con epoch >= desde.
+
+        calcular(ts, alertas, angulos) recibe esas muestras en orden cronológico y devuelve los
+        bits nuevos; se escriben en los mismos archivos y se devuelve (ts, bits, angulos).
+        Las muestras que seguían en la cola se escriben antes.
+        """
+        with self._escritura:
+            self._vaciar()
+            carpeta = self.carpeta(dispositivo_id)
+            try:
+                nombres = sorted(os.listdir(carpeta))
+            except FileNotFoundError:
+                nombres = []
+            tramos = []  # (mmap, primera posición >= desde)
+            for nombre in nombres:
+                dia = _dia(nombre)
+                ruta = os.path.join(carpeta, nombre)
+                n = os.path.getsize(ruta) // REGISTRO.itemsize
+                if dia is None or dia < desde // DIA or not n:
+                    continue
+                mapa = np.memmap(ruta, REGISTRO, "r+", shape=(n,))
+                tramos.append((mapa, bisect_left(mapa["ts"], desde)))
+            if not tramos:
+                ts, _, angulos = _vacio()
+                return ts, calcular(ts, np.empty(0, np.uint8), angulos), angulos
+            datos = np.concatenate([mapa[i:] for mapa, i in tramos])
+            orden = np.argsort(datos["ts"], kind="stable")  # Días y corridas mezclados por tiempo
+            ts, angulos = datos["ts"][orden], datos["angulos"][orden]
+            bits = np.asarray(calcular(ts, datos["alertas"][orden], angulos), dtype=np.uint8)
+            nuevos = np.empty_like(bits)
+            nuevos[orden] = bits
+            k = 0
+            for mapa, i in tramos:
+                mapa["alertas"][i:] = nuevos[k:k + len(mapa) - i]
+                mapa.flush()
+                k += len(mapa) - i
+            return ts, bits, angulos
+
+    def eliminar_anteriores(self, dispositivo_id, antes_de):
+        """Borra los días (todas sus corridas) que terminan antes de `antes_de`; devuelve cuántos archivos"""
+        with self._escritura:
+            carpeta = self.carpeta(dispositivo_id)
+            try:
+                nombres = os.listdir(carpeta)
+            except FileNotFoundError:
+                return 0
+            borrados = 0
+            for nombre in nombres:
+                dia = _dia(nombre)
+                if dia is not None and (dia + 1) * DIA <= antes_de:
+                    os.remove(os.path.join(carpeta, nombre))
+                    self.finales.pop((dispositivo_id, dia), None)
+                    borrados += 1
+            return borrados
+
+    def dias(self, dispositivo_id):
+        """Días (epoch // DIA) con archivos en disco, en orden"""
+        try:
+            nombres = os.listdir(self.carpeta(dispositivo_id))
+        except FileNotFoundError:
+            return []
+        return sorted({dia for dia in map(_dia, nombres) if dia is not None})
+
+    def primer_dia(self, dispositivo_id):
+        """Día (epoch // DIA) más antiguo que queda en disco, o None"""
+        dias = self.dias(dispositivo_id)
+        return dias[0] if dias else None
+
+    def dispositivos(self):
+        """Ids con historial en disco"""
+        try:
+            nombres = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return []
+        return [unquote(nombre) for nombre in nombres if os.path.isdir(os.path.join(self.directorio, nombre))]
+
+    # --- Lectura (cualquier hilo o proceso) ---
+    def consultar(self, dispositivo_id, desde, hasta, limite=None):
+        """(ts, alertas, angulos) de un dispositivo en [desde, hasta], en orden cronológico.
+
+        Con `limite` devuelve solo las primeras `limite` muestras del rango.
+        """
+        carpeta = self.carpeta(dispositivo_id)
+        try:
+            nombres = os.listdir(carpeta)
+        except FileNotFoundError:
+            return _vacio()
+        primero, ultimo = int(desde // DIA), int(hasta // DIA)
+        corridas = {}
+        for nombre in nombres:
+            dia = _dia(nombre)
+            if dia is not None and primero <= dia <= ultimo:
+                corridas.setdefault(dia, []).append(os.path.join(carpeta, nombre))
+        partes, total = [], 0
+        for dia in sorted(corridas):
+            parte = [self._leer(ruta, desde, hasta) for ruta in corridas[dia]]
+            parte = parte[0] if len(parte) == 1 else np.concatenate(parte)
+            if len(corridas[dia]) > 1:
+                parte = parte[np.argsort(parte["ts"], kind="stable")]  # Mezclar corridas del día
+            partes.append(parte)
+            total += len(parte)
+            if limite is not None and total >= limite:
+                break  # Los días siguientes ya no entran
+        if not total:
+            return _vacio()
+        datos = np.concatenate(partes)[:limite]
+        return datos["ts"], datos["alertas"], datos["angulos"]
+
+    @staticmethod
+    def _leer(ruta, desde, hasta, tipo=REGISTRO):
+        n = os.path.getsize(ruta) // tipo.itemsize  # Un registro incompleto al final no cuenta
+        if not n:
+            return np.empty(0, tipo)
+        mapa = np.memmap(ruta, tipo, "r", shape=(n,))
+        ts = mapa["ts"]
+        # bisect lee ~log2(n) registros; np.searchsorted copiaría la columna entera
+        i = bisect_left(ts, desde)
+        j = bisect_right(ts, hasta, i)
+        return np.array(mapa[i:j])
@@ -0,0 +1,71 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from fastapi.responses import Response
+
+# 📦 Recursos estáticos precomprimidos: se arman una sola vez al arrancar
+# Por recurso: bytes originales, gzip y brotli (si está instalado) y un ETag fuerte por
+# variante (el hash del contenido + la codificación). Cada solicitud solo elige la variante
+# según Accept-Encoding y compara If-None-Match; nada se comprime ni se concatena por pedido.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_COMPRIMIR = 256  # Bytes: más chico que esto no vale la pena comprimir
+
+
+class RecursoEstatico:
+    __slots__ = ("tipo", "version", "variantes", "cache")
+
+    def __init__(self, contenido, tipo, cache="no-cache"):
+        if isinstance(contenido, str):
+            contenido = contenido.encode()
+        self.tipo = tipo
+        self.cache = cache
+        self.version = hashlib.sha256(contenido).hexdigest()[:16]
+        # codificación -> (bytes, etag); la de mayor preferencia primero
+        self.variantes = {}
+        if len(contenido) >= MIN_COMPRIMIR:
+            if brotli is not None:
+                self._agregar("br", brotli.compress(contenido, quality=11))
+            self._agregar("gzip", gzip.compress(contenido, compresslevel=9, mtime=0))
+        self._agregar("identity", contenido)
+
+    def _agregar(self, codificacion, cuerpo):
+        self.variantes[codificacion] = (cuerpo, f'"{self.version}-{codificacion}"')
+
+    def elegir(self, aceptadas):
+        """Codificación a enviar según el encabezado Accept-Encoding"""
+        aceptadas = {parte.split(";")[0].strip() for parte in aceptadas.lower().split(",")
+                     if not parte.replace(" ", "").endswith(";q=0")}
+        for codificacion in self.variantes:
+            if codificacion in aceptadas:
+                return codificacion
+        return "identity"
+
+    def respuesta(self, request):
+        codificacion = self.elegir(request.headers.get("accept-encoding", ""))
+        cuerpo, etag = self.variantes[codificacion]
+        headers = {"ETag": etag, "Cache-Control": self.cache, "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        if codificacion != "identity":
+            headers["Content-Encoding"] = codificacion
+        return Response(content=cuerpo, media_type=self.tipo, headers=headers)
+
+
+def cargar_directorio(directorio, cache="public, max-age=31536000, immutable"):
+    """nombre -> RecursoEstatico de cada archivo de `directorio` (se piden con ?v=<version>)"""
+    recursos = {}
+    if os.path.isdir(directorio):
+        for nombre in sorted(os.listdir(directorio)):
+            ruta = os.path.join(directorio, nombre)
+            if os.path.isfile(ruta):
+                tipo = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+                with open(ruta, "rb") as archivo:
+                    recursos[nombre] = RecursoEstatico(archivo.read(), tipo, cache)
+    return recursos
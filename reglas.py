@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# 📐 Reglas de alerta evaluadas en el servidor a partir de los ángulos crudos
+# Por sensor: alerta cuando |ángulo - referencia| supera `umbral`; con `histeresis` la alerta
+# se mantiene hasta bajar de umbral - histeresis, y con `confirmacion` (segundos) solo se
+# dispara si la desviación se sostuvo ese tiempo (como TIEMPO_CONFIRMACION_MALA_POSTURA del
+# Arduino para los motores). Se evalúa un lote entero con NumPy; el estado entre lotes
+# (histéresis y desde cuándo) viaja en EstadoReglas.
+# Sin reglas configuradas para un cinturón se usa el bit `alerta` que manda el Arduino.
+
+Regla = namedtuple("Regla", "umbral histeresis confirmacion")
+
+SENSORES = ("lumbar", "toracico", "hombro")
+# Mismos umbrales que cinturon.ino (UMBRAL_ANGULO_ALERTA_*): sin histéresis ni confirmación
+# reproducen exactamente el bit `alerta` de las tramas
+FIRMWARE = {
+    "lumbar": Regla(15.0, 0.0, 0.0),
+    "toracico": Regla(10.0, 0.0, 0.0),
+    "hombro": Regla(12.0, 0.0, 0.0),
+}
+PESOS = np.array([1, 2, 4], dtype=np.uint8)  # Bits ALERTA_* por columna
+
+log = logging.getLogger("postura.reglas")
+
+
+def validar(datos):
+    """{sensor: {umbral, histeresis, confirmacion}} (parcial) -> {sensor: Regla}; ValueError si no es válido"""
+    if not isinstance(datos, dict):
+        raise ValueError("se esperaba un objeto {sensor: {umbral, histeresis, confirmacion}}")
+    reglas = {}
+    for sensor, valores in datos.items():
+        if sensor not in SENSORES:
+            raise ValueError(f"sensor desconocido: {sensor}")
+        if not isinstance(valores, dict) or set(valores) - set(Regla._fields):
+            raise ValueError(f"{sensor}: campos válidos: {', '.join(Regla._fields)}")
+        base = FIRMWARE[sensor]._asdict()
+        base.update(valores)
+        try:
+            regla = Regla(*(float(base[campo]) for campo in Regla._fields))
+        except (TypeError, ValueError):
+            raise ValueError(f"{sensor}: los valores deben ser números") from None
+        if not (regla.umbral > 0 and 0 <= regla.histeresis < regla.umbral and regla.confirmacion >= 0):
+            raise ValueError(f"{sensor}: se requiere umbral > 0, 0 <= histeresis < umbral y confirmacion >= 0")
+        reglas[sensor] = regla
+    return reglas
+
+
+class ReglasSensores:
+    """Reglas de los tres sensores en arreglos (una columna por sensor)"""
+    __slots__ = ("reglas", "umbral", "salida", "confirmacion")
+
+    def __init__(self, reglas):
+        self.reglas = tuple(reglas.get(sensor, FIRMWARE[sensor]) for sensor in SENSORES)
+        self.umbral = np.array([r.umbral for r in self.reglas])
+        self.salida = self.umbral - [r.histeresis for r in self.reglas]
+        self.confirmacion = np.array([r.confirmacion for r in self.reglas])
+
+    def __eq__(self, otras):
+        return isinstance(otras, ReglasSensores) and self.reglas == otras.reglas
+
+    def como_dict(self):
+        return {sensor: regla._asdict() for sensor, regla in zip(SENSORES, self.reglas)}
+
+
+class EstadoReglas:
+    """Lo que un lote le deja al siguiente: estado con histéresis y desde cuándo está en alerta"""
+    __slots__ = ("activo", "desde")
+
+    def __init__(self):
+        self.activo = np.zeros(3, dtype=bool)
+        self.desde = np.zeros(3)
+
+
+def evaluar(reglas, estado, ts, desviacion):
+    """Bits de alerta (uint8) de n muestras: ts (n,) y desviacion (n, 3) = |ángulo - referencia|.
+
+    Actualiza `estado` para el próximo lote.
+    """
+    n = len(ts)
+    if not n:
+        return np.empty(0, np.uint8)
+    filas = np.arange(n)[:, None]
+    # Histéresis: arriba del umbral entra, por debajo de la salida sale, en la banda se mantiene
+    decision = np.where(desviacion > reglas.umbral, 1, np.where(desviacion <= reglas.salida, 0, -1))
+    ultima = np.maximum.accumulate(np.where(decision >= 0, filas, -1), axis=0)
+    crudo = np.where(ultima >= 0, np.take_along_axis(decision, np.maximum(ultima, 0), axis=0) == 1,
+                     estado.activo)
+    # Confirmación: desde qué muestra viene sostenida cada racha (o desde el lote anterior)
+    previo = np.vstack((estado.activo[None, :], crudo[:-1]))
+    subida = np.maximum.accumulate(np.where(crudo & ~previo, filas, -1), axis=0)
+    desde = np.where(subida >= 0, ts[np.maximum(subida, 0)], estado.desde)
+    alerta = crudo & (ts[:, None] - desde >= reglas.confirmacion)
+    estado.activo = crudo[-1].copy()
+    estado.desde = np.where(crudo[-1], desde[-1], 0.0)
+    return (alerta * PESOS).sum(axis=1).astype(np.uint8)
+
+
+def desviaciones(angulos, referencias):
+    """|ángulo - referencia| por sensor, como arreglo (n, 3) de float64"""
+    return np.abs(np.asarray(angulos, dtype=np.float64) - np.asarray(referencias, dtype=np.float64))
+
+
+class ConfiguracionReglas:
+    """Reglas por defecto y por cinturón, guardadas en un JSON (lo comparten todos los procesos)"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.por_defecto = None   # {sensor: Regla} o None (usar el bit del Arduino)
+        self.dispositivos = {}    # id -> {sensor: Regla}
+        self.recalcular = True    # Al aplicar un cambio, reevaluar también el historial guardado
+        self.modificado = None    # mtime del archivo leído
+
+    def cargar(self):
+        """Relee el archivo si cambió; True si hay que volver a aplicar las reglas"""
+        try:
+            modificado = os.stat(self.ruta).st_mtime_ns
+        except (FileNotFoundError, TypeError):
+            modificado = None
+        if modificado == self.modificado:
+            return False
+        self.modificado = modificado
+        self.por_defecto, self.dispositivos, self.recalcular = None, {}, True
+        if modificado is None:
+            return True
+        try:
+            with open(self.ruta, encoding="utf-8") as archivo:
+                datos = json.load(archivo)
+            if datos.get("por_defecto") is not None:
+                self.por_defecto = validar(datos["por_defecto"])
+            self.dispositivos = {dispositivo_id: validar(reglas)
+                                 for dispositivo_id, reglas in datos.get("dispositivos", {}).items()}
+            self.recalcular = bool(datos.get("recalcular", True))
+        except (OSError, ValueError, AttributeError) as e:
+            log.error("❌ Reglas inválidas en %s (se usan las del Arduino): %s", self.ruta, e)
+        return True
+
+    def como_dict(self):
+        return {
+            "por_defecto": None if self.por_defecto is None else
+            {sensor: regla._asdict() for sensor, regla in self.por_defecto.items()},
+            "dispositivos": {dispositivo_id: {sensor: regla._asdict() for sensor, regla in reglas.items()}
+                             for dispositivo_id, reglas in self.dispositivos.items()},
+            "recalcular": self.recalcular,
+        }
+
+    def guardar(self):
+        """Escritura atómica: otro proceso nunca lee un archivo a medias"""
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(self.como_dict(), archivo, indent=2)
+        os.replace(temporal, self.ruta)
+        self.modificado = os.stat(self.ruta).st_mtime_ns
+
+    def efectivas(self, dispositivo_id):
+        """ReglasSensores del cinturón, o None si se confía en el bit del Arduino"""
+        reglas = self.dispositivos.get(dispositivo_id)
+        if reglas is None and self.por_defecto is None:
+            return None
+        combinadas = dict(self.por_defecto or {})
+        combinadas.update(reglas or {})
+        return ReglasSensores(combinadas)
@@ -0,0 +1,339 @@
+import calendar
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+import numpy as np
+
+from analitica import MAX_INTERVALO
+from particiones import DIA, HistorialParticionado, _dia
+
+# 🧊 Retención por niveles: muestras crudas -> agregados de 1 minuto -> agregados de 1 hora
+# Por cubeta: muestras, OR de los bits de alerta, mínimo/media/máximo de cada ángulo y segundos
+# en mala y buena postura (mismo criterio que analitica.py: el intervalo hasta cada muestra se
+# cuenta con el estado de la anterior y los huecos > MAX_INTERVALO no cuentan).
+# Los agregados van junto a las particiones crudas, en <dispositivo>/minutos/<AAAAMMDD>.seg (un
+# archivo por día) y <dispositivo>/horas/<AAAAMM01>.seg (uno por mes), con el mismo formato de
+# ancho fijo y solo-agregar; <nivel>/progreso guarda hasta qué epoch está completo el nivel.
+# Un hilo compactador avanza cada nivel por tramos acotados (un archivo por vez, dejando
+# MARGEN segundos para muestras atrasadas) y después borra lo vencido: días crudos con más de
+# `dias_crudas` ya agregados en minutos, y minutos con más de `dias_minutos` ya agregados en
+# horas. La ingesta nunca lo espera: solo comparte el lock de escritura de las particiones
+# mientras se borran archivos. Las horas no vencen.
+
+AGREGADO = np.dtype([
+    ("ts", "<f8"), ("n", "<u4"), ("alertas", "u1"),
+    ("minimo", "<f4", 3), ("media", "<f4", 3), ("maximo", "<f4", 3),
+    ("segundos_mala", "<f4"), ("segundos_buena", "<f4"),
+])  # 57 B, sin relleno
+
+Nivel = namedtuple("Nivel", "nombre resolucion")
+MINUTOS = Nivel("minutos", 60)
+HORAS = Nivel("horas", 3600)
+NIVELES = (MINUTOS, HORAS)  # Del más fino al más grueso; cada uno se arma con el anterior
+
+DIAS_CRUDAS = 30             # Días de muestras crudas que se conservan
+DIAS_MINUTOS = 365           # Días de agregados por minuto (None: no vencen)
+INTERVALO_COMPACTACION = 60.0  # Segundos entre pasadas del compactador
+MARGEN = 300                 # Segundos: lo más reciente se agrega recién en la pasada siguiente
+PAUSA = 0.01                 # Segundos entre tramos, para ceder la CPU a la ingesta
+
+log = logging.getLogger("postura.retencion")
+
+
+def agregar(ts, alertas, angulos, resolucion, desde):
+    """Muestras crudas en orden -> un registro AGREGADO por cubeta de `resolucion` s con datos.
+
+    Las muestras anteriores a `desde` solo aportan el intervalo hasta la primera que entra.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    alertas = np.asarray(alertas, dtype=np.uint8)
+    dt = np.zeros(len(ts))
+    dt[1:] = np.diff(ts)
+    valido = (dt > 0) & (dt <= MAX_INTERVALO)
+    previa = np.zeros(len(ts), dtype=bool)
+    previa[1:] = alertas[:-1] != 0
+    k = int(np.searchsorted(ts, desde))
+    if k == len(ts):
+        return np.empty(0, AGREGADO)
+    ts, alertas, angulos, dt, valido, previa = ts[k:], alertas[k:], angulos[k:], dt[k:], valido[k:], previa[k:]
+    cubetas = (ts // resolucion).astype(np.int64)
+    inicios = np.concatenate(([0], np.flatnonzero(np.diff(cubetas)) + 1))
+    n = np.diff(np.append(inicios, len(ts)))
+    registros = np.empty(len(inicios), AGREGADO)
+    registros["ts"] = cubetas[inicios] * resolucion
+    registros["n"] = n
+    registros["alertas"] = np.bitwise_or.reduceat(alertas, inicios)
+    registros["minimo"] = np.minimum.reduceat(angulos, inicios, axis=0)
+    registros["maximo"] = np.maximum.reduceat(angulos, inicios, axis=0)
+    registros["media"] = np.add.reduceat(angulos.astype(np.float64), inicios, axis=0) / n[:, None]
+    registros["segundos_mala"] = np.add.reduceat(np.where(valido & previa, dt, 0.0), inicios)
+    registros["segundos_buena"] = np.add.reduceat(np.where(valido & ~previa, dt, 0.0), inicios)
+    return registros
+
+
+def _combinar(registros, inicios, ts):
+    """Une los registros de cada grupo que empieza en `inicios`; `ts` es el epoch de cada grupo"""
+    n = np.add.reduceat(registros["n"].astype(np.int64), inicios)
+    combinados = np.empty(len(inicios), AGREGADO)
+    combinados["ts"] = ts
+    combinados["n"] = n
+    combinados["alertas"] = np.bitwise_or.reduceat(registros["alertas"], inicios)
+    combinados["minimo"] = np.minimum.reduceat(registros["minimo"], inicios, axis=0)
+    combinados["maximo"] = np.maximum.reduceat(registros["maximo"], inicios, axis=0)
+    # Media ponderada por la cantidad de muestras de cada registro
+    sumas = registros["media"].astype(np.float64) * registros["n"][:, None]
+    combinados["media"] = np.add.reduceat(sumas, inicios, axis=0) / n[:, None]
+    combinados["segundos_mala"] = np.add.reduceat(registros["segundos_mala"].astype(np.float64), inicios)
+    combinados["segundos_buena"] = np.add.reduceat(registros["segundos_buena"].astype(np.float64), inicios)
+    return combinados
+
+
+def combinar(registros, resolucion):
+    """Agregados de un nivel fino -> cubetas de `resolucion` s (p. ej. minutos -> horas)"""
+    if not len(registros):
+        return registros
+    cubetas = (registros["ts"] // resolucion).astype(np.int64)
+    inicios = np.concatenate(([0], np.flatnonzero(np.diff(cubetas)) + 1))
+    return _combinar(registros, inicios, cubetas[inicios] * resolucion)
+
+
+def reducir(registros, puntos):
+    """Como buffer_circular.reducir, pero sobre agregados: `puntos` cubetas de igual duración"""
+    if len(registros) <= puntos:
+        return registros
+    ts = registros["ts"]
+    bordes = np.linspace(ts[0], ts[-1], puntos + 1)[:-1]
+    inicios = np.unique(np.searchsorted(ts, bordes, side="left"))
+    return _combinar(registros, inicios, ts[inicios])
+
+
+def _periodo(nivel, epoch):
+    """[inicio, fin) del archivo del nivel que contiene `epoch`: un día (minutos) o un mes (horas)"""
+    if nivel.resolucion < 3600:
+        inicio = epoch // DIA * DIA
+        return inicio, inicio + DIA
+    t = time.gmtime(epoch)
+    anio, mes = divmod(t.tm_mon, 12)
+    return (calendar.timegm((t.tm_year, t.tm_mon, 1, 0, 0, 0)),
+            calendar.timegm((t.tm_year + anio, mes + 1, 1, 0, 0, 0)))
+
+
+class Compactador:
+    """Hilo que agrega las particiones crudas en minutos y horas y borra lo vencido"""
+
+    def __init__(self, particiones, almacen=None, dias_crudas=DIAS_CRUDAS, dias_minutos=DIAS_MINUTOS,
+                 intervalo=INTERVALO_COMPACTACION):
+        self.particiones = particiones
+        self.almacen = almacen
+        self.dias_crudas = dias_crudas
+        self.dias_minutos = dias_minutos
+        self.intervalo = intervalo
+        self.agregados = 0   # Registros escritos en los niveles
+        self.borrados = 0    # Archivos vencidos borrados (crudos y de minutos)
+        self._lock = threading.Lock()  # Un tramo o una invalidación a la vez
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._compactador, name="compactador", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+        if self._hilo:
+            self._hilo.join()
+            self._hilo = None
+
+    def _compactador(self):
+        while not self._parar.is_set():
+            try:
+                self.compactar()
+            except Exception:
+                log.exception("❌ Error compactando el historial")
+            self._parar.wait(self.intervalo)
+
+    # --- Archivos de cada nivel ---
+    def carpeta(self, dispositivo_id, nivel):
+        return os.path.join(self.particiones.carpeta(dispositivo_id), nivel.nombre)
+
+    def progreso(self, dispositivo_id, nivel):
+        """Epoch hasta el que el nivel está completo, o None si todavía no se compactó nada"""
+        try:
+            return float(np.fromfile(os.path.join(self.carpeta(dispositivo_id, nivel), "progreso"), "<f8", 1)[0])
+        except (FileNotFoundError, IndexError):
+            return None
+
+    def _fijar_progreso(self, dispositivo_id, nivel, epoch):
+        ruta = os.path.join(self.carpeta(dispositivo_id, nivel), "progreso")
+        np.array([epoch], "<f8").tofile(f"{ruta}.tmp")
+        os.replace(f"{ruta}.tmp", ruta)  # Los lectores nunca ven un progreso a medias
+
+    def _archivos(self, dispositivo_id, nivel):
+        """[(inicio, fin, ruta)] de los archivos del nivel, en orden"""
+        carpeta = self.carpeta(dispositivo_id, nivel)
+        try:
+            nombres = os.listdir(carpeta)
+        except FileNotFoundError:
+            return []
+        archivos = []
+        for nombre in nombres:
+            dia = _dia(nombre)
+            if dia is not None:
+                archivos.append(_periodo(nivel, dia * DIA) + (os.path.join(carpeta, nombre),))
+        return sorted(archivos)
+
+    def _leer(self, dispositivo_id, nivel, desde, hasta):
+        """Registros del nivel con desde <= ts <= hasta (solo lo ya escrito)"""
+        partes = [HistorialParticionado._leer(ruta, desde, hasta, AGREGADO)
+                  for inicio, fin, ruta in self._archivos(dispositivo_id, nivel) if inicio <= hasta and fin > desde]
+        return np.concatenate(partes) if partes else np.empty(0, AGREGADO)
+
+    def _escribir(self, dispositivo_id, nivel, registros):
+        """Agrega al archivo del período; lo que ya hubiera desde el primer registro se reemplaza
+        (tramo repetido tras una caída o una invalidación)"""
+        carpeta = self.carpeta(dispositivo_id, nivel)
+        os.makedirs(carpeta, exist_ok=True)
+        inicio = _periodo(nivel, registros["ts"][0])[0]
+        ruta = os.path.join(carpeta, time.strftime("%Y%m%d", time.gmtime(inicio)) + ".seg")
+        self._truncar(ruta, registros["ts"][0])
+        with open(ruta, "ab") as archivo:
+            archivo.write(registros.tobytes())
+        self.agregados += len(registros)
+
+    @staticmethod
+    def _truncar(ruta, desde):
+        """Deja en el archivo solo los registros completos con ts < desde"""
+        try:
+            n = os.path.getsize(ruta) // AGREGADO.itemsize
+        except FileNotFoundError:
+            return
+        k = bisect_left(np.memmap(ruta, AGREGADO, "r", shape=(n,))["ts"], desde) if n else 0
+        os.truncate(ruta, k * AGREGADO.itemsize)
+
+    # --- Compactación ---
+    def compactar(self, ahora=None):
+        """Una pasada completa: avanza los niveles de cada cinturón y borra lo vencido"""
+        ahora = time.time() if ahora is None else ahora
+        for dispositivo_id in self.particiones.dispositivos():
+            for nivel in NIVELES:
+                self._avanzar(dispositivo_id, nivel, ahora)
+            if not self._parar.is_set():
+                self._vencer(dispositivo_id, ahora)
+
+    def _avanzar(self, dispositivo_id, nivel, ahora):
+        while not self._parar.is_set():
+            with self._lock:
+                hecho = self.progreso(dispositivo_id, nivel)
+                if nivel is MINUTOS:
+                    limite = (ahora - MARGEN) // nivel.resolucion * nivel.resolucion
+                    if hecho is None:
+                        dia = self.particiones.primer_dia(dispositivo_id)
+                        hecho = None if dia is None else dia * DIA
+                else:
+                    fino = self.progreso(dispositivo_id, MINUTOS)
+                    limite = None if fino is None else fino // nivel.resolucion * nivel.resolucion
+                    if hecho is None:
+                        archivos = self._archivos(dispositivo_id, MINUTOS)
+                        hecho = archivos[0][0] if archivos else None
+                if hecho is None or limite is None or hecho >= limite:
+                    return
+                fin = min(limite, _periodo(nivel, hecho)[1])  # Un archivo del nivel por tramo
+                registros = self._tramo(dispositivo_id, nivel, hecho, fin)
+                if len(registros):
+                    self._escribir(dispositivo_id, nivel, registros)
+                self._fijar_progreso(dispositivo_id, nivel, fin)
+            time.sleep(PAUSA)
+
+    def _tramo(self, dispositivo_id, nivel, desde, hasta):
+        """Registros del nivel con desde <= ts < hasta, armados con el nivel anterior"""
+        if nivel is MINUTOS:
+            ts, alertas, angulos = self.particiones.consultar(dispositivo_id, desde - MAX_INTERVALO, hasta)
+            corte = int(np.searchsorted(ts, hasta))
+            return agregar(ts[:corte], alertas[:corte], angulos[:corte], nivel.resolucion, desde)
+        fino = self._leer(dispositivo_id, NIVELES[NIVELES.index(nivel) - 1], desde, hasta)
+        return combinar(fino[fino["ts"] < hasta], nivel.resolucion)
+
+    def _vencer(self, dispositivo_id, ahora):
+        with self._lock:
+            minutos = self.progreso(dispositivo_id, MINUTOS)
+            if minutos is not None and self.dias_crudas is not None:
+                limite = min(ahora - self.dias_crudas * DIA, minutos)
+                self.borrados += self.particiones.eliminar_anteriores(dispositivo_id, limite)
+                if self.almacen:
+                    self.almacen.purgar(dispositivo_id, limite)
+            horas = self.progreso(dispositivo_id, HORAS)
+            if horas is not None and self.dias_minutos is not None:
+                limite = min(ahora - self.dias_minutos * DIA, horas)
+                for inicio, fin, ruta in self._archivos(dispositivo_id, MINUTOS):
+                    if fin <= limite:
+                        os.remove(ruta)
+                        self.borrados += 1
+
+    def invalidar(self, dispositivo_id, desde):
+        """Descarta los agregados desde `desde` (p. ej. tras recalcular las alertas) para que la
+        próxima pasada los rehaga; nunca antes de la muestra cruda más antigua que queda"""
+        with self._lock:
+            dia = self.particiones.primer_dia(dispositivo_id)
+            if dia is None:
+                return
+            desde = max(desde, dia * DIA)
+            for nivel in NIVELES:
+                inicio = desde // nivel.resolucion * nivel.resolucion
+                hecho = self.progreso(dispositivo_id, nivel)
+                if hecho is None or hecho <= inicio:
+                    continue
+                for comienzo, fin, ruta in self._archivos(dispositivo_id, nivel):
+                    if comienzo >= inicio:
+                        os.remove(ruta)
+                    elif fin > inicio:
+                        self._truncar(ruta, inicio)
+                self._fijar_progreso(dispositivo_id, nivel, inicio)
+
+    # --- Lectura (cualquier hilo o proceso) ---
+    def primero(self, dispositivo_id):
+        """Epoch del dato más antiguo en algún nivel (crudas, minutos u horas), o None"""
+        dia = self.particiones.primer_dia(dispositivo_id)
+        inicios = [] if dia is None else [dia * DIA]
+        for nivel in NIVELES:
+            archivos = self._archivos(dispositivo_id, nivel)
+            if archivos:
+                inicios.append(archivos[0][0])
+        return min(inicios, default=None)
+
+    def elegir(self, resolucion, desde, ahora=None):
+        """Nivel más grueso cuya resolución no supera la pedida (None: muestras crudas).
+
+        Si el rango empieza antes de lo que se conserva de un nivel se usa el siguiente.
+        """
+        ahora = time.time() if ahora is None else ahora
+        elegido, vence = None, None if self.dias_crudas is None else ahora - self.dias_crudas * DIA
+        for nivel, dias in zip(NIVELES, (self.dias_minutos, None)):
+            if nivel.resolucion > resolucion and (vence is None or desde >= vence):
+                break
+            elegido, vence = nivel, None if dias is None else ahora - dias * DIA
+        return elegido
+
+    def consultar(self, dispositivo_id, nivel, desde, hasta):
+        """Agregados de `nivel` con desde <= ts <= hasta, en orden; lo que el compactador todavía
+        no alcanzó se arma al vuelo con el nivel anterior (o con las muestras crudas)"""
+        desde = desde // nivel.resolucion * nivel.resolucion
+        hecho = self.progreso(dispositivo_id, nivel)
+        hecho = desde if hecho is None else hecho
+        partes = []
+        if hecho > desde:
+            guardados = self._leer(dispositivo_id, nivel, desde, hasta)
+            partes.append(guardados[guardados["ts"] < hecho])
+        if hasta >= hecho:
+            inicio = max(desde, hecho)
+            i = NIVELES.index(nivel)
+            if i:
+                partes.append(combinar(self.consultar(dispositivo_id, NIVELES[i - 1], inicio, hasta), nivel.resolucion))
+            else:
+                ts, alertas, angulos = self.particiones.consultar(dispositivo_id, inicio - MAX_INTERVALO, hasta)
+                partes.append(agregar(ts, alertas, angulos, nivel.resolucion, inicio))
+        return np.concatenate(partes) if partes else np.empty(0, AGREGADO)
@@ -1,170 +1,1046 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-import serial
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
 import json
+import sqlite3
 from datetime import datetime
-from collections import deque
+from collections import deque, namedtuple
+from array import array
+from bisect import bisect_left
+import numpy as np
 import uvicorn
+from ingesta_mqtt import IngestaMQTT
+from almacenamiento import AlmacenHistorial
+from particiones import HistorialParticionado
+import retencion
+from retencion import Compactador
+import exportacion
+from estadisticas import EstadisticasIncrementales
+from analitica import AnaliticaPostura
+import analitica
+from sesiones import IndiceSesiones, detectar as detectar_sesiones
+import reglas
+from reglas import ConfiguracionReglas, EstadoReglas, ReglasSensores
+from decodificador import decodificar, ErrorTrama
+from ingesta_serial import IngestaSerial
+from escritor import EscritorUnico
+from estado_compartido import SegmentoCompartido, HistorialCompartido, FUENTE_BLUETOOTH, FUENTE_MQTT
+from buffer_circular import BufferCircular, ALERTA_LUMBAR, ALERTA_TORACICO, ALERTA_HOMBRO
+import buffer_circular
+import bitacora
+from metricas import Registro, TIPO_CONTENIDO, BUCKETS_LATENCIA
+from recursos import RecursoEstatico
+import recursos
 import threading
 import time
 
 # 🔧 CONFIGURACIÓN SIMPLE
-BT_PORT = 'COM9'           # Puerto Bluetooth
+FUENTE_DATOS = 'mqtt'      # 'mqtt' (broker, ver bluetooth_conexion.py) o 'serial' (puerto Bluetooth directo)
+PUERTOS_SERIAL = ['COM9']  # Puertos Bluetooth: lista con comodines ('/dev/rfcomm*', 'COM*') y 'puerto=id' (ver ingesta_serial.py)
 BAUD_RATE = 115200
+MQTT_BROKER = 'localhost'
+MQTT_PORT = 1883
+MQTT_TOPICOS = ("cinturon/sensores", "cinturon/+/sensores")  # cinturon/<id>/sensores -> dispositivo <id>
 WEB_PORT = 8000
+ALMACEN_RUTA = 'posturas.db'  # Historial persistente (SQLite); None para desactivarlo
+PARTICIONES_RUTA = 'historial'  # Historial completo en archivos por día para /api/historial/rango; None para desactivarlo
+RETENCION_CRUDAS_DIAS = 30    # Días de muestras crudas en las particiones (y en SQLite); None = para siempre
+RETENCION_MINUTOS_DIAS = 365  # Días de agregados por minuto; los de 1 hora no vencen (ver retencion.py)
+REGLAS_RUTA = 'reglas.json'   # Umbrales de alerta del servidor (ver reglas.py); sin archivo se usa el bit del Arduino
+NIVEL_LOG = 'INFO'         # 'DEBUG' muestra una línea por muestra (solo para depurar)
+API_WORKERS = 1            # >1: un proceso de ingesta + N procesos de API con el estado en memoria compartida
+MAX_DISPOSITIVOS_COMPARTIDOS = 10_000  # Con API_WORKERS > 1: cinturones visibles para los procesos de API
 
-# 📊 Variables globales para datos
-current_data = None
-eventos_malas_posturas = deque(maxlen=100)  # Últimos 100 eventos
-historial_posturas = deque(maxlen=200)  # Historial para gráfica tiempo vs postura
-estadisticas = {
-    "total_malas": 0,
-    "malas_hoy": 0,
-    "porcentaje_buena": 100
-}
+# 📊 Modelo por dispositivo
+DISPOSITIVO_POR_DEFECTO = 'cinturon'  # Id usado para el cinturón conectado por el puerto serial
+MAX_HISTORIAL = 200   # Historial para gráfica tiempo vs postura
+MAX_EVENTOS = 100     # Últimos 100 eventos
+TIEMPO_INACTIVO = 10  # Segundos sin muestras para considerar un dispositivo desconectado
+MAX_ADELANTO_RELOJ = 5  # Segundos: una hora de recepción más adelantada que esto se ignora
+MAX_HUECO_SECUENCIA = 1000  # Tramas binarias: un salto de secuencia mayor se toma como reinicio
+MAX_SESIONES_RESPUESTA = 1000  # Sesiones por respuesta de /api/sesiones
+MAX_MUESTRAS_RANGO = 100_000   # Muestras por respuesta de /api/historial/rango
+ARRANQUE = int(time.time())  # Distingue los ETag de distintos arranques del servidor
+MAX_COLA_INGESTA = 50_000  # Tramas esperando al hilo escritor como máximo (ver escritor.py)
+POLITICA_COLA_INGESTA = 'descartar_antiguas'  # Con la cola llena: 'descartar_antiguas', 'ultima_por_dispositivo' o 'bloquear'
+REFRESCO_ANALITICA = 1.0  # Segundos entre recálculos de las ventanas (también sin muestras nuevas)
+DIAS_RECALCULO = 30       # Al cambiar las reglas se reevalúan los últimos días del historial particionado
+
+SENSORES = ("lumbar", "toracico", "hombro")
+NOMBRES_SENSORES = ("Lumbar", "Torácico", "Hombro")
+# Bits de alerta por sensor: ALERTA_LUMBAR=1, ALERTA_TORACICO=2, ALERTA_HOMBRO=4 (ver buffer_circular.py)
+
+
+# Estado publicado de un dispositivo: inmutable, se reemplaza entero con una sola asignación.
+# El escritor (ver escritor.py) modifica los campos vivos de EstadoDispositivo y publica una
+# Instantanea por lote; las rutas leen `dispositivo.publicado` una vez y trabajan sobre ella.
+Instantanea = namedtuple("Instantanea", (
+    "version", "ultima_muestra", "angulos", "referencias", "alertas", "motores",
+    "mala_postura_activa", "eventos", "stats", "total", "n", "tramas_perdidas", "analitica",
+    "sesiones", "sesion_abierta", "generacion_sesiones",
+))
+
+
+class EstadoDispositivo:
+    """Estado compacto de un cinturón: arreglos y bits en lugar de diccionarios anidados.
+    Los campos vivos son del hilo escritor; los lectores usan solo `publicado`."""
+    __slots__ = (
+        "dispositivo_id", "ultima_muestra", "angulos", "referencias", "alertas", "motores",
+        "historial", "eventos", "stats", "mala_postura_registrada", "version", "cache_snapshot",
+        "secuencia", "tramas_perdidas", "publicado", "eventos_publicados", "analitica",
+        "analitica_publicada", "sesiones", "sesion_abierta", "generacion_sesiones", "reglas", "estado_reglas",
+    )
+
+    def __init__(self, dispositivo_id):
+        self.dispositivo_id = dispositivo_id
+        self.ultima_muestra = 0.0          # Epoch de la última muestra (0 = sin datos)
+        self.angulos = array('f', (0.0, 0.0, 0.0))
+        self.referencias = array('f', (0.0, 0.0, 0.0))
+        self.alertas = 0                   # Bits ALERTA_* de la última muestra
+        self.motores = 0                   # Mismos bits para el estado de los motores
+        # Historial columnar: epoch, bits de alerta y los tres ángulos (~21 bytes por muestra)
+        self.historial = BufferCircular(MAX_HISTORIAL)
+        # Eventos: tuplas (epoch, bits_alerta), el más reciente primero
+        self.eventos = deque(maxlen=MAX_EVENTOS)
+        self.stats = EstadisticasIncrementales()
+        # Ventanas deslizantes de 5 min / 1 h / 24 h (ver analitica.py)
+        self.analitica = AnaliticaPostura()
+        # Flag para saber si ya registramos esta sesión de mala postura
+        self.mala_postura_registrada = False
+        # Sesiones cerradas (ver sesiones.py) y la abierta: [inicio, bits, pico] o None
+        self.sesiones = IndiceSesiones()
+        self.sesion_abierta = None
+        self.generacion_sesiones = 0  # Sube cuando las sesiones se reemplazan (ver reconstruir)
+        # Reglas de alerta del servidor (ReglasSensores) o None para usar el bit del Arduino
+        self.reglas = None
+        self.estado_reglas = EstadoReglas()
+        # Versión: sube con cada muestra/limpieza; el snapshot JSON se cachea por versión
+        self.version = 0
+        self.cache_snapshot = None
+        # Número de secuencia de la última trama binaria y huecos detectados en la numeración
+        self.secuencia = None
+        self.tramas_perdidas = 0
+        # Tupla de eventos ya publicada; None cuando `eventos` cambió desde la última publicación
+        self.eventos_publicados = None
+        # Resumen de las ventanas ya publicado; se recalcula como mucho cada REFRESCO_ANALITICA s
+        self.analitica_publicada = None
+        self.publicar()
+
+    def publicar(self):
+        """Congela el estado vivo en una Instantanea (solo desde el hilo escritor)"""
+        if self.eventos_publicados is None:
+            self.eventos_publicados = tuple(self.eventos)
+        ahora = time.time()
+        if self.analitica_publicada is None or ahora - self.analitica_publicada[0] >= REFRESCO_ANALITICA:
+            self.analitica_publicada = self.analitica.resumen(ahora)
+        self.publicado = Instantanea(
+            self.version, self.ultima_muestra, tuple(self.angulos), tuple(self.referencias),
+            self.alertas, self.motores, self.mala_postura_registrada, self.eventos_publicados,
+            self.stats.copia(), self.historial.total, self.historial.n, self.tramas_perdidas,
+            self.analitica_publicada, (self.sesiones, len(self.sesiones)),
+            (self.sesion_abierta[0], self.ultima_muestra, self.sesion_abierta[1], self.sesion_abierta[2])
+            if self.sesion_abierta else None, self.generacion_sesiones)
+
+    def conectado(self, inst=None):
+        ultima = (inst or self.publicado).ultima_muestra
+        return ultima > 0 and time.time() - ultima < TIEMPO_INACTIVO
+
+    def datos_actuales(self):
+        inst = self.publicado
+        return formatear_datos(inst.ultima_muestra, inst.angulos, inst.referencias, inst.alertas, inst.motores)
+
+    def historial_dicts(self, ultimos=None, inst=None):
+        inst = inst or self.publicado
+        return buffer_circular.registros(*self.historial.ventana(ultimos, inst.total, inst.n))
+
+    def consultar_historial(self, since=None, limit=None, puntos=None, formato="registros"):
+        """Historial incremental (since=cursor), limitado y/o reducido a `puntos` cubetas"""
+        inst = self.publicado
+        completo = True
+        if since is None:
+            ventana = self.historial.ventana(limit, inst.total, inst.n)
+            cursor = inst.total
+        else:
+            ventana, cursor, completo = self.historial.desde_cursor(since, limit, inst.total, inst.n)
+        if puntos:
+            ventana = buffer_circular.reducir(*ventana, puntos)
+        serializar = buffer_circular.columnas if formato == "columnas" else buffer_circular.registros
+        return {"historial": serializar(*ventana), "cursor": cursor, "completo": completo}
+
+    def eventos_dicts(self, limite=20, inst=None):
+        return formatear_eventos((inst or self.publicado).eventos[:limite])
+
+    def estadisticas(self, inst=None):
+        return (inst or self.publicado).stats.resumen(time.time())
+
+    def resumen_analitica(self):
+        return analitica.formatear(self.publicado.analitica)
+
+    def indice_sesiones(self, inst):
+        """(índice, n) de sesiones cerradas visibles para la instantánea `inst`"""
+        return inst.sesiones
+
+    def consultar_sesiones(self, desde=None, hasta=None, limite=MAX_SESIONES_RESPUESTA):
+        """Sesiones que tocan [desde, hasta] (las `limite` más recientes) y el tiempo total en mala postura"""
+        inst = self.publicado
+        indice, n = self.indice_sesiones(inst)
+        desde = 0.0 if desde is None else desde
+        hasta = time.time() if hasta is None else hasta
+        i, j = indice.solapadas(desde, hasta, n)
+        segundos = indice.tiempo(desde, hasta, n)
+        sesiones = [formatear_sesion(*indice[k]) for k in range(max(i, j - limite), j)]
+        total = j - i
+        abierta = inst.sesion_abierta  # (inicio, última muestra, bits, pico)
+        if abierta is not None and abierta[0] <= hasta and abierta[1] >= desde:
+            segundos += min(abierta[1], hasta) - max(abierta[0], desde)
+            sesiones.append(formatear_sesion(*abierta, en_curso=self.conectado(inst)))
+            total += 1
+            del sesiones[:-limite]
+        return {
+            "desde": desde,
+            "hasta": hasta,
+            "total": total,
+            "segundos_mala": round(segundos, 1),
+            "sesiones": sesiones
+        }
+
+    def cerrar_sesion(self, fin):
+        """Cierra la sesión de mala postura abierta (solo desde el hilo escritor)"""
+        inicio, bits, pico = self.sesion_abierta
+        self.sesion_abierta = None
+        self.mala_postura_registrada = False
+        self.sesiones.agregar(inicio, fin, bits, pico)
+        if almacen:
+            almacen.guardar_sesion(self.dispositivo_id, inicio, fin, bits, pico)
+
+    def snapshot(self):
+        """(etag, bytes JSON) del estado consolidado; se serializa una sola vez por versión"""
+        inst = self.publicado
+        conectado = self.conectado(inst)
+        clave = (inst.version, conectado)  # "conectado" también cambia por inactividad
+        cache = self.cache_snapshot
+        if cache is not None and cache[0] == clave:
+            return cache[1], cache[2]
+        etag = f'"{ARRANQUE}-{inst.version}-{int(conectado)}"'
+        cuerpo = json.dumps({
+            "version": inst.version,
+            "datos": formatear_datos(inst.ultima_muestra, inst.angulos, inst.referencias,
+                                     inst.alertas, inst.motores) if conectado else None,
+            "estadisticas": self.estadisticas(inst),
+            "eventos": self.eventos_dicts(inst=inst),
+            "status": {
+                "conectado": conectado,
+                "ultima_muestra": inst.ultima_muestra or None,
+                "mala_postura_activa": inst.mala_postura_activa
+            },
+            "cursor": inst.total
+        }).encode()
+        self.cache_snapshot = (clave, etag, cuerpo)  # Una asignación: carreras entre lectores son inocuas
+        return etag, cuerpo
+
+    def limpiar(self):
+        """Solo desde el hilo escritor (ver limpiar_dispositivo). Las sesiones cerradas se conservan"""
+        if self.sesion_abierta:
+            self.cerrar_sesion(self.ultima_muestra)
+        self.historial.limpiar()
+        self.eventos.clear()
+        self.eventos_publicados = None
+        self.stats = EstadisticasIncrementales()
+        self.analitica = AnaliticaPostura()
+        self.analitica_publicada = None
+        self.mala_postura_registrada = False
+        self.version += 1
+        self.publicar()
+
+    def reconstruir(self, ts, viejas, alertas, angulos, desviacion, desde):
+        """Rehace sesiones, estadísticas, ventanas y eventos a partir de las muestras desde `desde`
+        con sus alertas recalculadas (`viejas`: las de antes; ts ordenado; solo desde el hilo escritor)"""
+        detectadas = detectar_sesiones(ts, alertas, desviacion, TIEMPO_INACTIVO)
+        # Sesiones que las estadísticas contaron con las alertas viejas (bits con que empezó cada una)
+        quitadas = viejas[detectar_sesiones(ts, viejas, desviacion, TIEMPO_INACTIVO).primeras]
+        # Las sesiones que empezaron antes de `desde` se conservan; el resto se reemplaza
+        corte = bisect_left(self.sesiones.inicios, desde)
+        nuevas = list(zip(detectadas.inicios.tolist(), detectadas.fines.tolist(),
+                          detectadas.sensores.tolist(), detectadas.picos.tolist()))
+        sesiones = self.sesiones.recortar(corte)  # Objeto nuevo: las instantáneas ya publicadas no cambian
+        for sesion in nuevas:
+            sesiones.agregar(*sesion)
+        self.sesiones = sesiones
+        self.generacion_sesiones += 1
+        if almacen:
+            almacen.reemplazar_sesiones(self.dispositivo_id, desde, nuevas)
+        self.sesion_abierta = list(detectadas.abierta) if detectadas.abierta else None
+        self.mala_postura_registrada = detectadas.abierta is not None
+
+        primeras = detectadas.primeras
+        self.stats.reconstruir(ts, alertas, primeras, quitadas)
+        self.analitica = AnaliticaPostura.desde_historial(ts, alertas, angulos)
+        self.analitica_publicada = None
+        ultimas = primeras[-MAX_EVENTOS:][::-1]
+        self.eventos = deque(list(zip(ts[ultimas].tolist(), alertas[ultimas].tolist()))
+                             + [evento for evento in self.eventos if evento[0] < desde], maxlen=MAX_EVENTOS)
+        self.eventos_publicados = None
+
+        # Bits de las muestras que siguen en el buffer circular (se ubican por su epoch)
+        historial = self.historial
+        if historial.ts is not None and historial.n:
+            posiciones = np.arange(historial.total - historial.n, historial.total) % historial.ranuras
+            epochs = historial.ts[posiciones]
+            k = np.minimum(np.searchsorted(ts, epochs), len(ts) - 1)
+            encontradas = ts[k] == epochs
+            historial.alertas[posiciones[encontradas]] = alertas[k[encontradas]]
+        if ts[-1] == self.ultima_muestra:
+            self.alertas = int(alertas[-1])
+        self.version += 1
+        self.publicar()
+
+
+def formatear_datos(ultima_muestra, angulos, referencias, alertas, motores):
+    """Formato de /api/datos a partir del estado compacto"""
+    if not ultima_muestra:
+        return None
+    momento = datetime.fromtimestamp(ultima_muestra)
+    datos = {}
+    for i, sensor in enumerate(SENSORES):
+        bit = 1 << i
+        datos[sensor] = {
+            "angulo": round(angulos[i], 2),  # float32 -> 2 decimales como el Arduino
+            "referencia": round(referencias[i], 2),
+            "alerta": bool(alertas & bit),
+            "motor": bool(motores & bit),
+        }
+    datos["timestamp"] = momento.strftime("%H:%M:%S")
+    datos["fecha"] = momento.strftime("%Y-%m-%d")
+    return datos
+
+def formatear_sesion(inicio, fin, sensores, pico, en_curso=False):
+    return {
+        "inicio": inicio,
+        "fin": fin,
+        "duracion": round(fin - inicio, 1),
+        "sensores": nombres_sensores(sensores),
+        "pico": round(pico, 2),
+        "en_curso": en_curso
+    }
+
+def formatear_eventos(eventos):
+    resultado = []
+    for epoch, bits in eventos:
+        momento = datetime.fromtimestamp(epoch)
+        resultado.append({
+            "timestamp": momento.strftime("%H:%M:%S"),
+            "fecha": momento.strftime("%Y-%m-%d"),
+            "sensores": nombres_sensores(bits)
+        })
+    return resultado
+
+def punto_historial(epoch, bits, lumbar, toracico, hombro):
+    """Entrada del historial en el formato que consume la gráfica"""
+    momento = datetime.fromtimestamp(epoch)
+    return {
+        "timestamp": momento.strftime("%H:%M:%S"),
+        "datetime": momento.isoformat(),
+        "postura_mala": bits != 0,
+        "lumbar_mala": bool(bits & ALERTA_LUMBAR),
+        "toracico_mala": bool(bits & ALERTA_TORACICO),
+        "hombro_mala": bool(bits & ALERTA_HOMBRO),
+        "angulo_lumbar": lumbar,
+        "angulo_toracico": toracico,
+        "angulo_hombro": hombro
+    }
+
+def nombres_sensores(bits):
+    return ", ".join(nombre for i, nombre in enumerate(NOMBRES_SENSORES) if bits & (1 << i))
+
+
+class DispositivoCompartido(EstadoDispositivo):
+    """Dispositivo visto desde un proceso de API: lee su registro del segmento compartido.
+    Los métodos de lectura de EstadoDispositivo funcionan igual sobre `publicado`."""
+    __slots__ = ("indice", "leida", "secuencia_leida", "fila_sesiones", "sesiones_lock")
+    # generacion_sesiones: la del índice local; si la publicada cambia se relee de SQLite desde cero
+
+    def __init__(self, dispositivo_id, indice):
+        self.dispositivo_id = dispositivo_id
+        self.indice = indice
+        self.historial = HistorialCompartido(segmento, indice)
+        self.cache_snapshot = None
+        self.leida = None
+        self.secuencia_leida = None
+        # Las sesiones cerradas no entran en el segmento: se leen de SQLite a medida que se guardan
+        self.sesiones = IndiceSesiones()
+        self.fila_sesiones = 0
+        self.generacion_sesiones = 0
+        self.sesiones_lock = threading.Lock()
+
+    def indice_sesiones(self, inst):
+        if almacen:
+            with self.sesiones_lock:
+                if inst.generacion_sesiones != self.generacion_sesiones:
+                    self.sesiones = IndiceSesiones()
+                    self.fila_sesiones = 0
+                    self.generacion_sesiones = inst.generacion_sesiones
+                try:
+                    filas = almacen.sesiones(self.dispositivo_id, self.fila_sesiones)
+                except sqlite3.Error:
+                    filas = ()  # La ingesta aún no creó la base
+                for fila, *sesion in filas:
+                    self.sesiones.agregar(*sesion)
+                    self.fila_sesiones = fila
+                return self.sesiones, len(self.sesiones)
+        return self.sesiones, len(self.sesiones)
+
+    @property
+    def publicado(self):
+        # La secuencia se mira sin seqlock: solo decide si hace falta volver a copiar el registro.
+        # No basta la versión: la analítica se re-publica sin muestras nuevas (ver refrescar_analitica)
+        secuencia = int(segmento.secuencia[self.indice])
+        leida = self.leida
+        if leida is None or secuencia != self.secuencia_leida:
+            leida = self.leida = segmento.leer(self.indice, Instantanea)
+            self.secuencia_leida = secuencia
+        return leida
+
+
+# Registro de dispositivos: id -> EstadoDispositivo (DispositivoCompartido en los procesos de API)
+dispositivos = {}
+registro_lock = threading.Lock()
+
+# 🧠 Memoria compartida (solo con API_WORKERS > 1, ver estado_compartido.py)
+VARIABLE_SEGMENTO = "POSTURA_SEGMENTO"  # Nombre del segmento para los procesos de API
+INTERVALO_COMPARTIDO = 0.05  # Segundos entre revisiones del segmento (long-poll, SSE, limpiezas)
+MAX_LATIDO = 2.0             # Sin latido del proceso de ingesta en este tiempo: fuentes desconectadas
+segmento = None              # Escritor en el proceso de ingesta, lector en los procesos de API
+modo_lector = False
+
+# 💾 Historial persistente: las muestras se escriben por lotes en un hilo aparte
+almacen = AlmacenHistorial(ALMACEN_RUTA) if ALMACEN_RUTA else None
+# 🗂️ Historial completo particionado por día (ver particiones.py); también se lee desde los procesos de API
+particiones = HistorialParticionado(PARTICIONES_RUTA) if PARTICIONES_RUTA else None
+# 🧊 Agregados de 1 min y 1 h y retención de las particiones (ver retencion.py); el hilo corre en la ingesta
+compactador = Compactador(particiones, almacen, RETENCION_CRUDAS_DIAS, RETENCION_MINUTOS_DIAS) if particiones else None
+# 📐 Reglas de alerta por cinturón (ver reglas.py); el archivo lo comparten todos los procesos
+configuracion_reglas = ConfiguracionReglas(REGLAS_RUTA)
+configuracion_reglas.cargar()
+reglas_lock = threading.Lock()
+
+def obtener_dispositivo(dispositivo_id, crear=True):
+    dispositivo = dispositivos.get(dispositivo_id)
+    if dispositivo is None and modo_lector:
+        sincronizar_dispositivos()
+        dispositivo = dispositivos.get(dispositivo_id)
+        if dispositivo is None and crear:
+            return EstadoDispositivo(dispositivo_id)  # Aún sin datos en el segmento: vacío, no se registra
+        return dispositivo
+    if dispositivo is None and crear:
+        with registro_lock:
+            dispositivo = dispositivos.get(dispositivo_id)
+            if dispositivo is None:
+                dispositivo = EstadoDispositivo(dispositivo_id)
+                dispositivo.reglas = configuracion_reglas.efectivas(dispositivo_id)
+                if almacen and almacen.activo:
+                    # Recuperar la cola en memoria tras un reinicio
+                    dispositivo.historial.extender(almacen.ultimas(dispositivo_id, MAX_HISTORIAL))
+                    for _, *sesion in almacen.sesiones(dispositivo_id):
+                        dispositivo.sesiones.agregar(*sesion)
+                    dispositivo.publicar()  # Aún no es visible para el escritor ni los lectores
+                    compartir(dispositivo)
+                dispositivos[dispositivo_id] = dispositivo
+    return dispositivo
+
+def sincronizar_dispositivos():
+    """Procesos de API: agrega los dispositivos que el proceso de ingesta registró en el segmento"""
+    with registro_lock:
+        for dispositivo_id, indice in segmento.sincronizar():
+            dispositivos[dispositivo_id] = DispositivoCompartido(dispositivo_id, indice)
+
+def compartir(dispositivo):
+    """Proceso de ingesta: copia la instantanea publicada al segmento compartido"""
+    if segmento is not None and not modo_lector:
+        segmento.escribir(dispositivo)
 
 # Estado de conexión
-conexion_bt_activa = False
-bt_serial = None
+lector_serial = None
+ingesta_mqtt = None
 
-# Estado de postura para evitar registros duplicados
-mala_postura_registrada = False  # Flag para saber si ya registramos esta sesión de mala postura
+def fuentes_conectadas():
+    """Bits FUENTE_* conectados; en los procesos de API, según el último latido de la ingesta"""
+    if modo_lector:
+        return segmento.conexion() if time.time() - segmento.latido() < MAX_LATIDO else 0
+    return ((FUENTE_BLUETOOTH if lector_serial and lector_serial.conectados() else 0)
+            | (FUENTE_MQTT if ingesta_mqtt and ingesta_mqtt.conectado else 0))
 
-app = FastAPI(title="Monitor Postura Bluetooth")
+def conexion_activa():
+    return bool(fuentes_conectadas())
 
-# 🔌 Conexión Bluetooth
-def init_bluetooth():
-    global bt_serial, conexion_bt_activa
-    
+# 📡 Suscriptores del stream (SSE): id de dispositivo -> colas asyncio de cada pestaña abierta
+MAX_COLA_STREAM = 100
+PUNTOS_GRAFICA = 50  # La gráfica del dashboard solo muestra los últimos 50 puntos
+REINTENTO_STREAM = 5  # Segundos antes de que el dashboard vuelva a abrir un stream cerrado
+suscriptores = {}
+esperas = {}  # Long-poll de /api/snapshot: id de dispositivo -> asyncio.Event
+loop_principal = None
+
+# 📝 Logging (ver bitacora.py) y 📈 métricas para /metrics (ver metricas.py)
+log = logging.getLogger("postura")
+metricas = Registro()
+M_INVALIDAS = metricas.contador("postura_tramas_invalidas_total",
+                                "Tramas rechazadas (esquema = formato/campos, error = excepción al procesar)",
+                                ("motivo",))
+M_SESIONES = metricas.contador("postura_sesiones_mala_total", "Sesiones de mala postura iniciadas",
+                               ("dispositivo",))
+M_STREAM_DESCARTES = metricas.contador("postura_stream_descartados_total",
+                                       "Mensajes SSE descartados por clientes lentos")
+# Se mide por lote y no por trama: un histograma por muestra costaría ~1 µs de ~10
+M_PROCESAMIENTO = metricas.histograma("postura_lote_segundos", "Tiempo de procesar un lote de ingesta completo")
+M_LOTE = metricas.histograma("postura_lote_tramas", "Tramas por lote de ingesta (serial o MQTT)",
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+M_HTTP = metricas.histograma("postura_http_solicitud_segundos",
+                             "Latencia hasta el inicio de la respuesta por ruta (long-poll incluye la espera)",
+                             ("metodo", "ruta", "codigo"), BUCKETS_LATENCIA)
+metricas.medidor("postura_dispositivos", "Dispositivos registrados", lambda: len(dispositivos))
+metricas.medidor("postura_memoria_compartida_llena",
+                 "1 si la memoria compartida no admite más dispositivos (ver MAX_DISPOSITIVOS_COMPARTIDOS)",
+                 lambda: int(segmento is not None and segmento.lleno()))
+metricas.medidor("postura_muestras_total", "Muestras ingeridas",
+                 lambda: [((d.dispositivo_id,), d.publicado.total) for d in list(dispositivos.values())],
+                 ("dispositivo",), tipo="counter")
+metricas.medidor("postura_historial_ocupacion", "Muestras en el buffer circular de cada dispositivo",
+                 lambda: [((d.dispositivo_id,), d.publicado.n) for d in list(dispositivos.values())],
+                 ("dispositivo",))
+metricas.medidor("postura_historial_capacidad", "Capacidad del buffer circular por dispositivo",
+                 lambda: MAX_HISTORIAL)
+metricas.medidor("postura_tramas_perdidas_total", "Huecos en la secuencia de tramas binarias",
+                 lambda: [((d.dispositivo_id,), d.publicado.tramas_perdidas) for d in list(dispositivos.values())],
+                 ("dispositivo",), tipo="counter")
+metricas.medidor("postura_suscriptores_stream", "Pestañas conectadas al stream SSE",
+                 lambda: sum(len(c) for c in list(suscriptores.values())))
+metricas.medidor("postura_conexion_activa", "1 si el puerto serial o el broker MQTT están conectados",
+                 lambda: int(conexion_activa()))
+metricas.medidor("postura_serial_basura_total", "Líneas o bytes descartados por el separador de tramas",
+                 lambda: lector_serial.descartadas() if lector_serial else 0, tipo="counter")
+metricas.medidor("postura_reconexiones_serial_total", "Intentos de reconexión de los puertos serie",
+                 lambda: lector_serial.reconexiones() if lector_serial else 0, tipo="counter")
+metricas.medidor("postura_puertos_serial_conectados", "Puertos serie/Bluetooth conectados",
+                 lambda: lector_serial.conectados() if lector_serial else 0)
+metricas.medidor("postura_mqtt_mensajes_total", "Mensajes MQTT recibidos",
+                 lambda: ingesta_mqtt.mensajes_recibidos if ingesta_mqtt else 0, tipo="counter")
+metricas.medidor("postura_reconexiones_mqtt_total", "Intentos de reconexión al broker MQTT",
+                 lambda: ingesta_mqtt.reconexiones if ingesta_mqtt else 0, tipo="counter")
+metricas.medidor("postura_cola_ingesta", "Tramas esperando al hilo escritor",
+                 lambda: escritor.pendientes())
+metricas.medidor("postura_cola_ingesta_capacidad", "Tramas que entran en la cola del hilo escritor",
+                 lambda: escritor.max_pendientes)
+metricas.medidor("postura_cola_descartadas_total", "Tramas descartadas con la cola de ingesta llena",
+                 lambda: escritor.descartadas, tipo="counter")
+metricas.medidor("postura_cola_coalescidas_total",
+                 "Tramas reemplazadas por una más nueva del mismo cinturón con la cola llena",
+                 lambda: escritor.coalescidas, tipo="counter")
+metricas.medidor("postura_cola_bloqueos_total", "Veces que la lectura esperó lugar en la cola de ingesta",
+                 lambda: escritor.bloqueos, tipo="counter")
+metricas.medidor("postura_cola_bloqueo_segundos_total", "Tiempo que la lectura pasó esperando lugar en la cola",
+                 lambda: escritor.segundos_bloqueado, tipo="counter")
+metricas.medidor("postura_almacen_pendientes", "Muestras esperando el próximo commit a SQLite",
+                 lambda: len(almacen.pendientes) if almacen else 0)
+metricas.medidor("postura_almacen_escritas_total", "Muestras escritas en SQLite",
+                 lambda: almacen.escritas if almacen else 0, tipo="counter")
+metricas.medidor("postura_agregados_escritos_total", "Registros de 1 min y 1 h escritos por el compactador",
+                 lambda: compactador.agregados if compactador else 0, tipo="counter")
+metricas.medidor("postura_archivos_vencidos_total", "Archivos de historial borrados por la retención",
+                 lambda: compactador.borrados if compactador else 0, tipo="counter")
+metricas.medidor("postura_almacen_descartadas_total", "Muestras descartadas por no alcanzar a escribirlas",
+                 lambda: almacen.descartadas if almacen else 0, tipo="counter")
+
+@asynccontextmanager
+async def ciclo_vida(app):
+    global loop_principal, ingesta_mqtt, segmento, modo_lector
+    loop_principal = asyncio.get_running_loop()
+    nombre_segmento = os.environ.get(VARIABLE_SEGMENTO)
+    if nombre_segmento:
+        # Proceso de API (API_WORKERS > 1): la ingesta corre en proceso_ingesta
+        segmento, modo_lector = SegmentoCompartido.abrir(nombre_segmento), True
+        vigilancia = asyncio.create_task(vigilar_segmento())
+        yield
+        vigilancia.cancel()
+        return
+    if almacen:
+        almacen.iniciar()
+    if particiones:
+        particiones.iniciar()
+        compactador.iniciar()
+    escritor.iniciar()
+    if FUENTE_DATOS == 'mqtt':
+        ingesta_mqtt = IngestaMQTT(MQTT_BROKER, MQTT_PORT, encolar_sin_esperar, topicos=MQTT_TOPICOS,
+                                   dispositivo_por_defecto=DISPOSITIVO_POR_DEFECTO)
+        await ingesta_mqtt.iniciar()
+    yield
+    if ingesta_mqtt:
+        await ingesta_mqtt.detener()
+    if lector_serial:
+        lector_serial.detener()
+    escritor.detener()  # Procesa los lotes que quedaban en la cola
+    if almacen:
+        almacen.detener()  # Escribe el último lote pendiente
+    if particiones:
+        compactador.detener()
+        particiones.detener()
+
+app = FastAPI(title="Monitor Postura Bluetooth", lifespan=ciclo_vida)
+
+class MedicionSolicitudes:
+    """Middleware ASGI: latencia de cada solicitud hasta que empieza la respuesta.
+    Se etiqueta con la plantilla de la ruta (/api/dispositivos/{dispositivo_id}/...) para
+    no crear una serie por id, y no envuelve el cuerpo, así el stream SSE no se ve afectado."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                ruta = scope.get("route")
+                M_HTTP.observar(time.perf_counter() - inicio, scope["method"],
+                                ruta.path if ruta is not None else "(sin ruta)", str(mensaje["status"]))
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
+
+app.add_middleware(MedicionSolicitudes)
+
+def publicar_stream(dispositivo_id, tipo, payload):
+    """Envía un cambio a las pestañas suscritas (se puede llamar desde el hilo Bluetooth)"""
+    if not suscriptores.get(dispositivo_id) or loop_principal is None:
+        return
+    mensaje = f"event: {tipo}\ndata: {json.dumps(payload)}\n\n"
+    loop_principal.call_soon_threadsafe(_entregar_stream, dispositivo_id, mensaje)
+
+def _entregar_stream(dispositivo_id, mensaje):
+    for cola in list(suscriptores.get(dispositivo_id, ())):
+        if cola.full():
+            # Cliente lento: descartar el mensaje más antiguo en lugar de bloquear
+            cola.get_nowait()
+            M_STREAM_DESCARTES.inc()
+        cola.put_nowait(mensaje)
+
+def notificar_cambio(dispositivo_id):
+    """Despierta los long-poll de /api/snapshot que esperan a este dispositivo"""
+    if dispositivo_id in esperas and loop_principal is not None:
+        loop_principal.call_soon_threadsafe(_despertar, dispositivo_id)
+
+def _despertar(dispositivo_id):
+    evento = esperas.pop(dispositivo_id, None)
+    if evento:
+        evento.set()
+
+async def vigilar_segmento():
+    """Procesos de API: despierta los long-poll y arma los eventos SSE comparando instantáneas
+    del segmento compartido (el proceso de ingesta no puede llamar a publicar_stream aquí)"""
+    vistas = {}  # id -> última Instantanea revisada
     while True:
-        try:
-            print(f"🔄 Conectando a Bluetooth: {BT_PORT}")
-            bt_serial = serial.Serial(BT_PORT, BAUD_RATE, timeout=1)
-            time.sleep(2)  # Esperar inicialización
-            conexion_bt_activa = True
-            print(f"✅ Bluetooth conectado: {BT_PORT}")
-            
-            # Leer datos continuamente
-            while conexion_bt_activa:
-                try:
-                    line = bt_serial.readline().decode('utf-8').strip()
-                    if line:
-                        print(f"📱 BT recibido: {line}")
-                        procesar_datos_bluetooth(line)
-                        
-                except serial.SerialException as e:
-                    print(f"❌ Error serial: {e}")
-                    break
-                except Exception as e:
-                    print(f"❌ Error leyendo BT: {e}")
-                    
-        except serial.SerialException as e:
-            print(f"❌ Error conectando Bluetooth: {e}")
-            conexion_bt_activa = False
-            
-        except Exception as e:
-            print(f"❌ Error Bluetooth: {e}")
-            conexion_bt_activa = False
-            
-        # Si se desconecta, cerrar puerto y reintentar
-        if bt_serial:
-            bt_serial.close()
-            bt_serial = None
-        print("🔄 Reintentando Bluetooth en 5 segundos...")
-        time.sleep(5)
-
-def procesar_datos_bluetooth(json_string):
-    global current_data, eventos_malas_posturas, estadisticas, historial_posturas, mala_postura_registrada
-    
+        await asyncio.sleep(INTERVALO_COMPARTIDO)
+        sincronizar_dispositivos()
+        vigilados = set(esperas) | {d for d, colas in suscriptores.items() if colas}
+        for dispositivo_id in list(vistas):
+            if dispositivo_id not in vigilados:
+                del vistas[dispositivo_id]
+        for dispositivo_id in vigilados:
+            dispositivo = dispositivos.get(dispositivo_id)
+            if not isinstance(dispositivo, DispositivoCompartido):
+                continue
+            inst = dispositivo.publicado
+            anterior = vistas.get(dispositivo_id)
+            if anterior is not None and anterior.version == inst.version:
+                continue
+            vistas[dispositivo_id] = inst
+            _despertar(dispositivo_id)
+            if anterior is not None and suscriptores.get(dispositivo_id):
+                emitir_cambios(dispositivo, anterior, inst)
+
+def emitir_cambios(dispositivo, anterior, inst):
+    """Eventos SSE equivalentes a los que emite procesar_datos_bluetooth entre dos instantáneas"""
+    dispositivo_id = dispositivo.dispositivo_id
+    nuevas = inst.total - anterior.total
+    # Una limpieza deja n en 0: hay menos muestras de las que debería haber
+    limpiado = inst.n < min(anterior.n + nuevas, MAX_HISTORIAL)
+    if limpiado:
+        publicar_stream(dispositivo_id, "limpiar", {})
+        nuevas = min(nuevas, inst.n)
+    desde = inst.total - min(nuevas, inst.n, MAX_COLA_STREAM)
+    ts, alertas, angulos = dispositivo.historial.rango(desde, inst.total)
+    puntos = buffer_circular.registros(ts, alertas, angulos)
+    for epoch, bits, angulos_muestra, punto in zip(ts.tolist(), alertas.tolist(), angulos.tolist(), puntos):
+        # Los motores solo se conocen para la última muestra publicada
+        publicar_stream(dispositivo_id, "muestra", {
+            "datos": formatear_datos(epoch, angulos_muestra, inst.referencias, bits, inst.motores),
+            "punto": punto
+        })
+    if inst.eventos != anterior.eventos and not limpiado:
+        publicar_stream(dispositivo_id, "eventos", {"eventos": formatear_eventos(inst.eventos[:20])})
+        publicar_stream(dispositivo_id, "estadisticas", inst.stats.resumen(time.time()))
+    if inst.mala_postura_activa != anterior.mala_postura_activa:
+        publicar_stream(dispositivo_id, "status", {"mala_postura_activa": inst.mala_postura_activa})
+
+# 🔌 Conexión Bluetooth
+def init_bluetooth(puertos=None):
+    """Lee todos los puertos serie en un event loop propio (en este hilo) y encola sus tramas"""
+    global lector_serial
+    lector_serial = IngestaSerial(puertos or PUERTOS_SERIAL, BAUD_RATE, escritor.encolar,
+                                   dispositivo_por_defecto=DISPOSITIVO_POR_DEFECTO)
+    asyncio.run(lector_serial.correr())
+
+_hora_cache = (0, "")
+
+def hora_local(epoch):
+    """HH:MM:SS con caché por segundo (evita un strftime por muestra)"""
+    global _hora_cache
+    segundo = int(epoch)
+    if _hora_cache[0] != segundo:
+        _hora_cache = (segundo, time.strftime("%H:%M:%S", time.localtime(segundo)))
+    return _hora_cache[1]
+
+def procesar_datos_bluetooth(json_string, dispositivo_id=DISPOSITIVO_POR_DEFECTO):
+    """Procesa una trama suelta (procesar_lote hace lo mismo con un lote entero)"""
+    leida = leer_trama(json_string, dispositivo_id)
+    if leida is not None:
+        if configuracion_reglas.por_defecto is not None or configuracion_reglas.dispositivos:
+            return aplicar_lectura(*leida, evaluar_reglas([leida])[0])
+        return aplicar_lectura(*leida)
+
+def leer_trama(json_string, dispositivo_id):
+    """(dispositivo_id, lectura, epoch) de una trama, o None si no es válida"""
     try:
-        # Parsear datos JSON
-        data = json.loads(json_string)
-        
+        # Decodificar y validar la trama (JSON en str/bytes o binaria compacta)
+        lectura = decodificar(json_string)
+    except ErrorTrama as e:
+        M_INVALIDAS.inc("esquema")
+        log.warning("❌ Trama inválida: %s", e)
+        log.debug("📝 Datos recibidos: %r", json_string)
+        return None
+    except Exception:
+        M_INVALIDAS.inc("error")
+        log.exception("❌ Error procesando datos")
+        return None
+    # Por el canal por defecto el cinturón se identifica en el propio mensaje; un tópico
+    # cinturon/<id>/sensores o un puerto con id propio mandan sobre el id de la trama
+    if lectura.dispositivo is not None and dispositivo_id == DISPOSITIVO_POR_DEFECTO:
+        dispositivo_id = lectura.dispositivo
+    now = time.time()
+    if lectura.recibido is not None and lectura.recibido <= now + MAX_ADELANTO_RELOJ:
+        # Trama reenviada por el puente (p. ej. desde su diario): conservar la hora real
+        now = lectura.recibido
+    return dispositivo_id, lectura, now
+
+def evaluar_reglas(leidas):
+    """Bits de alerta del servidor para cada (dispositivo_id, lectura, epoch), en bloque por
+    cinturón; None donde el cinturón no tiene reglas (se usa el bit del Arduino)"""
+    alertas = [None] * len(leidas)
+    por_dispositivo = {}
+    for k, (dispositivo_id, _, _) in enumerate(leidas):
+        por_dispositivo.setdefault(dispositivo_id, []).append(k)
+    for dispositivo_id, indices in por_dispositivo.items():
+        dispositivo = obtener_dispositivo(dispositivo_id)
+        if dispositivo.reglas is None:
+            continue
+        filas = [leidas[k] for k in indices]
+        # Las tramas binarias no traen referencias: vale la última conocida
+        referencia = tuple(dispositivo.referencias)
+        referencias = []
+        for _, lectura, _ in filas:
+            if lectura.referencias is not None:
+                referencia = lectura.referencias
+            referencias.append(referencia)
+        ts = np.array([epoch for _, _, epoch in filas])
+        angulos = [lectura.angulos for _, lectura, _ in filas]
+        bits = reglas.evaluar(dispositivo.reglas, dispositivo.estado_reglas, ts,
+                              reglas.desviaciones(angulos, referencias))
+        for k, valor in zip(indices, bits.tolist()):
+            alertas[k] = valor
+    return alertas
+
+def aplicar_lectura(dispositivo_id, lectura, now, alertas=None):
+    """Aplica una lectura decodificada al estado del cinturón; `alertas` reemplaza los bits
+    del Arduino cuando hay reglas del servidor (ver evaluar_reglas)"""
+    try:
+        dispositivo = obtener_dispositivo(dispositivo_id)
+        if alertas is None:
+            alertas = lectura.alertas
+        angulos = lectura.angulos
+
         # Actualizar datos actuales
-        now = datetime.now()
-        current_data = {
-            "lumbar": data["lumbar"],
-            "toracico": data["toracico"], 
-            "hombro": data["hombro"],
-            "timestamp": now.strftime("%H:%M:%S"),
-            "fecha": now.strftime("%Y-%m-%d")
-        }
-        
+        previa = dispositivo.ultima_muestra
+        dispositivo.ultima_muestra = now
+        dispositivo.alertas = alertas
+        dispositivo.motores = lectura.motores
+        dispositivo.angulos[0], dispositivo.angulos[1], dispositivo.angulos[2] = angulos
+        if lectura.referencias is not None:  # Las tramas binarias no traen referencias
+            dispositivo.referencias[0], dispositivo.referencias[1], dispositivo.referencias[2] = lectura.referencias
+        if lectura.secuencia is not None:  # Solo se numeran las binarias; las JSON intercaladas no cuentan
+            if dispositivo.secuencia is not None:
+                hueco = (lectura.secuencia - dispositivo.secuencia - 1) & 0xFFFFFFFF
+                if hueco < MAX_HUECO_SECUENCIA:  # Un salto mayor es un reinicio del cinturón
+                    dispositivo.tramas_perdidas += hueco
+            dispositivo.secuencia = lectura.secuencia
+
         # Verificar si hay mala postura
-        mala_postura = (
-            data["lumbar"]["alerta"] or 
-            data["toracico"]["alerta"] or 
-            data["hombro"]["alerta"]
-        )
+        mala_postura = alertas != 0
 
         # Agregar al historial para gráfica (tiempo vs postura) - SIEMPRE
-        historial_posturas.append({
-            "timestamp": now.strftime("%H:%M:%S"),
-            "datetime": now.isoformat(),
-            "postura_mala": mala_postura,
-            "lumbar_mala": data["lumbar"]["alerta"],
-            "toracico_mala": data["toracico"]["alerta"],
-            "hombro_mala": data["hombro"]["alerta"],
-            "angulo_lumbar": data["lumbar"]["angulo"],
-            "angulo_toracico": data["toracico"]["angulo"],
-            "angulo_hombro": data["hombro"]["angulo"]
-        })
-        
+        muestra = (now, alertas) + angulos
+        dispositivo.historial.agregar(*muestra)
+        if almacen:
+            almacen.guardar(dispositivo_id, muestra)
+        if particiones:
+            particiones.guardar(dispositivo_id, muestra)
+        if suscriptores.get(dispositivo_id):
+            publicar_stream(dispositivo_id, "muestra", {
+                "datos": formatear_datos(now, dispositivo.angulos, dispositivo.referencias,
+                                         alertas, dispositivo.motores),
+                "punto": punto_historial(*muestra)
+            })
+
+        if dispositivo.sesion_abierta and now - previa > TIEMPO_INACTIVO:
+            # El cinturón estuvo desconectado: la sesión terminó con la última muestra recibida
+            dispositivo.cerrar_sesion(previa)
+            if not mala_postura:
+                publicar_stream(dispositivo_id, "status", {"mala_postura_activa": False})
+
+        # Actualizar estadísticas (contadores incrementales, O(1) por muestra)
+        nueva_sesion = mala_postura and not dispositivo.mala_postura_registrada
+        dispositivo.stats.registrar(now, alertas, nueva_sesion)
+        dispositivo.analitica.registrar(now, alertas, angulos)
+
+        if mala_postura:
+            # Desviación respecto de la referencia de los sensores en alerta (pico de la sesión)
+            referencias = dispositivo.referencias
+            desviacion = max(abs(angulos[s] - referencias[s]) for s in range(3) if alertas & (1 << s))
+
         # NUEVA LÓGICA: Solo registrar evento si es una nueva sesión de mala postura
-        if mala_postura and not mala_postura_registrada:
+        if nueva_sesion:
             # Primera detección de mala postura - REGISTRAR
-            sensores_afectados = []
-            if data["lumbar"]["alerta"]:
-                sensores_afectados.append("Lumbar")
-            if data["toracico"]["alerta"]:
-                sensores_afectados.append("Torácico")
-            if data["hombro"]["alerta"]:
-                sensores_afectados.append("Hombro")
-            
-            evento = {
-                "timestamp": current_data["timestamp"],
-                "fecha": current_data["fecha"],
-                "sensores": ", ".join(sensores_afectados)
-            }
-            eventos_malas_posturas.appendleft(evento)
-            
-            # Actualizar estadísticas
-            estadisticas["total_malas"] += 1
-            
-            # Contar malas posturas de hoy
-            hoy = datetime.now().strftime("%Y-%m-%d")
-            estadisticas["malas_hoy"] = sum(1 for e in eventos_malas_posturas if e["fecha"] == hoy)
-            
+            dispositivo.eventos.appendleft((now, alertas))
+            dispositivo.eventos_publicados = None
+            dispositivo.sesion_abierta = [now, alertas, desviacion]
+
             # Marcar que ya registramos esta sesión de mala postura
-            mala_postura_registrada = True
-            
-            print(f"🚨 NUEVA mala postura registrada: {', '.join(sensores_afectados)} - {current_data['timestamp']}")
-            
-        elif not mala_postura and mala_postura_registrada:
-            # La postura se corrigió - resetear flag para permitir futuras detecciones
-            mala_postura_registrada = False
-            print(f"✅ Postura corregida - Sistema listo para detectar nuevas malas posturas - {current_data['timestamp']}")
-            
-        elif mala_postura and mala_postura_registrada:
-            # Sigue en mala postura - NO registrar
-            print(f"⏳ Continúa en mala postura (no se registra) - {current_data['timestamp']}")
+            dispositivo.mala_postura_registrada = True
+
+            # Solo se empujan eventos/estadísticas cuando cambian
+            if suscriptores.get(dispositivo_id):
+                publicar_stream(dispositivo_id, "eventos",
+                                {"eventos": formatear_eventos(list(dispositivo.eventos)[:20])})
+                publicar_stream(dispositivo_id, "estadisticas", dispositivo.stats.resumen(now))
+            publicar_stream(dispositivo_id, "status", {"mala_postura_activa": True})
+
+            M_SESIONES.inc(dispositivo_id)
+            log.info("🚨 [%s] NUEVA mala postura registrada: %s - %s",
+                     dispositivo_id, nombres_sensores(alertas), hora_local(now))
+
+        elif not mala_postura and dispositivo.mala_postura_registrada:
+            # La postura se corrigió - cerrar la sesión y resetear flag para permitir futuras detecciones
+            if dispositivo.sesion_abierta:
+                dispositivo.cerrar_sesion(now)
+            dispositivo.mala_postura_registrada = False
+            publicar_stream(dispositivo_id, "status", {"mala_postura_activa": False})
+            log.info("✅ [%s] Postura corregida - Sistema listo para detectar nuevas malas posturas - %s",
+                     dispositivo_id, hora_local(now))
+
         else:
-            # Postura buena - todo normal
-            print(f"📊 Postura buena - {current_data['timestamp']}")
-        
-    except json.JSONDecodeError as e:
-        print(f"❌ Error JSON: {e}")
-        print(f"📝 Datos recibidos: {json_string}")
-    except KeyError as e:
-        print(f"❌ Error clave faltante: {e}")
-        print(f"📝 Datos recibidos: {data}")
-    except Exception as e:
-        print(f"❌ Error procesando datos: {e}")
+            sesion = dispositivo.sesion_abierta
+            if sesion:
+                # Sesión en curso: acumular sensores y desviación máxima
+                sesion[1] |= alertas
+                if desviacion > sesion[2]:
+                    sesion[2] = desviacion
+            if log.isEnabledFor(logging.DEBUG):
+                # Una línea por muestra: solo con NIVEL_LOG = 'DEBUG'
+                if mala_postura:
+                    log.debug("⏳ [%s] Continúa en mala postura (no se registra) - %s", dispositivo_id, hora_local(now))
+                else:
+                    log.debug("📊 [%s] Postura buena - %s", dispositivo_id, hora_local(now))
+
+        dispositivo.version += 1
+        return dispositivo
+
+    except Exception:
+        M_INVALIDAS.inc("error")
+        log.exception("❌ Error procesando datos")
+
+def procesar_lote(lote):
+    """Procesa un lote de tramas [(dispositivo_id, bytes)] y publica los dispositivos que cambiaron.
+    Solo desde el hilo escritor (o un único hilo que haga de escritor, como en los benchmarks)."""
+    inicio = time.perf_counter()
+    modificados = {}
+    # El decodificador trabaja directamente sobre los bytes de la trama
+    leidas = [leida for leida in (leer_trama(payload, dispositivo_id) for dispositivo_id, payload in lote)
+              if leida is not None]
+    if configuracion_reglas.por_defecto is not None or configuracion_reglas.dispositivos:
+        # Reglas del servidor: todo el lote de cada cinturón se evalúa de una vez con NumPy
+        alertas = evaluar_reglas(leidas)
+    else:
+        alertas = [None] * len(leidas)
+    for leida, bits in zip(leidas, alertas):
+        dispositivo = aplicar_lectura(*leida, bits)
+        if dispositivo is not None:
+            modificados[dispositivo.dispositivo_id] = dispositivo
+    for dispositivo_id, dispositivo in modificados.items():
+        dispositivo.publicar()
+        compartir(dispositivo)
+        notificar_cambio(dispositivo_id)
+    M_PROCESAMIENTO.observar(time.perf_counter() - inicio)
+    M_LOTE.observar(len(lote))
+
+def refrescar_analitica():
+    """Tarea periódica del escritor: las ventanas avanzan aunque un cinturón deje de enviar"""
+    ahora = time.time()
+    for dispositivo in list(dispositivos.values()):
+        inst = dispositivo.publicado
+        # Con la ventana de 24 h ya vacía no hay nada que expirar
+        if inst.analitica[0] <= ahora - REFRESCO_ANALITICA and inst.ultima_muestra > ahora - 86400:
+            dispositivo.publicar()
+            compartir(dispositivo)
+
+def revisar_reglas():
+    """Tarea periódica del escritor: aplica los cambios de REGLAS_RUTA (a mano o desde un proceso de API)"""
+    if configuracion_reglas.cargar():
+        recalculados = aplicar_reglas(configuracion_reglas.recalcular)
+        if recalculados:
+            log.info("📐 Reglas de alerta actualizadas: %s", ", ".join(recalculados))
+
+def tareas_periodicas():
+    refrescar_analitica()
+    revisar_reglas()
+
+# ✍️ Hilo escritor: único que modifica el estado de los dispositivos (ver escritor.py)
+escritor = EscritorUnico(procesar_lote, periodica=tareas_periodicas, intervalo=REFRESCO_ANALITICA,
+                         max_pendientes=MAX_COLA_INGESTA, politica=POLITICA_COLA_INGESTA)
+
+def encolar_sin_esperar(lote):
+    """Para la ingesta MQTT: corre en el event loop, que nunca debe quedar bloqueado"""
+    escritor.encolar(lote, esperar=False)
+
+def limpiar(dispositivo_id):
+    """Limpia en el hilo escritor; en un proceso de API se lo pide a la ingesta y espera"""
+    if not modo_lector:
+        return escritor.ejecutar(limpiar_dispositivo, dispositivo_id)
+    dispositivo = obtener_dispositivo(dispositivo_id, crear=False)
+    if dispositivo is None:
+        return  # Sin datos en el segmento: no hay nada que limpiar
+    pedido = segmento.pedir_limpieza(dispositivo.indice)
+    limite = time.monotonic() + 5
+    while not segmento.limpieza_atendida(dispositivo.indice, pedido):
+        if time.monotonic() > limite:
+            raise HTTPException(status_code=503, detail="El proceso de ingesta no respondió")
+        time.sleep(INTERVALO_COMPARTIDO / 2)
+
+def limpiar_dispositivo(dispositivo_id):
+    """Comando del escritor: limpia y publica sin mezclarse con un lote a medias"""
+    dispositivo = obtener_dispositivo(dispositivo_id)
+    dispositivo.limpiar()
+    compartir(dispositivo)
+    publicar_stream(dispositivo_id, "limpiar", {})
+    notificar_cambio(dispositivo_id)
+
+def cambiar_reglas(dispositivo_id, configuradas, recalcular):
+    """Guarda las reglas de un cinturón (o las por defecto si dispositivo_id es None; None las quita).
+    En el hilo escritor también las aplica y devuelve lo recalculado; en un proceso de API, None:
+    la ingesta ve el archivo nuevo y las aplica en su próxima tarea periódica"""
+    with reglas_lock:
+        configuracion_reglas.cargar()
+        if dispositivo_id is None:
+            configuracion_reglas.por_defecto = configuradas
+        elif configuradas is None:
+            configuracion_reglas.dispositivos.pop(dispositivo_id, None)
+        else:
+            configuracion_reglas.dispositivos[dispositivo_id] = configuradas
+        configuracion_reglas.recalcular = recalcular
+        configuracion_reglas.guardar()
+    if modo_lector:
+        return None
+    return aplicar_reglas(recalcular)
+
+def aplicar_reglas(recalcular=True):
+    """Comando del escritor: asigna las reglas vigentes a cada cinturón y, si cambiaron,
+    reevalúa su historial. Devuelve {id: resumen de recalcular_historial} de los que cambiaron"""
+    cambiados = {}
+    for dispositivo in list(dispositivos.values()):
+        efectivas = configuracion_reglas.efectivas(dispositivo.dispositivo_id)
+        if efectivas == dispositivo.reglas:
+            continue
+        dispositivo.reglas = efectivas
+        dispositivo.estado_reglas = EstadoReglas()
+        cambiados[dispositivo.dispositivo_id] = recalcular_historial(dispositivo) if recalcular else None
+    return cambiados
+
+def recalcular_historial(dispositivo):
+    """Reevalúa con las reglas actuales las alertas de los últimos DIAS_RECALCULO días en una pasada
+    y rehace sesiones, estadísticas y ventanas (solo desde el hilo escritor).
+
+    Fuente: el historial particionado (los bits se reescriben en los archivos) o, si está
+    desactivado, el buffer circular. Las desviaciones se miden contra las referencias actuales:
+    el historial no guarda las de cada muestra. Las muestras de SQLite conservan sus bits.
+    """
+    efectivas = dispositivo.reglas or ReglasSensores({})  # Sin reglas: los umbrales del Arduino
+    referencias = np.array(dispositivo.referencias, dtype=np.float64)
+    estado = EstadoReglas()
+    medidas = []  # Bits anteriores y |ángulo - referencia| de las muestras evaluadas
+
+    def calcular(ts, alertas, angulos):
+        medidas.extend((alertas, reglas.desviaciones(angulos, referencias)))
+        return reglas.evaluar(efectivas, estado, ts, medidas[1])
+
+    inicio = time.perf_counter()
+    if particiones:
+        desde = time.time() - DIAS_RECALCULO * 86400
+        ts, alertas, angulos = particiones.recalcular_alertas(dispositivo.dispositivo_id, desde, calcular)
+        compactador.invalidar(dispositivo.dispositivo_id, desde)  # Minutos y horas con los bits nuevos
+    else:
+        ts, viejas, angulos = dispositivo.historial.ventana()
+        desde = float(ts[0]) if len(ts) else time.time()
+        alertas = calcular(ts, viejas, angulos)
+    dispositivo.estado_reglas = estado  # Las muestras que lleguen siguen desde la última evaluada
+    if len(ts):
+        dispositivo.reconstruir(ts, medidas[0], alertas, angulos, medidas[1], desde)
+        if segmento is not None and not modo_lector:
+            segmento.reenviar_historial(dispositivo.dispositivo_id)
+        compartir(dispositivo)
+        dispositivo_id = dispositivo.dispositivo_id
+        inst = dispositivo.publicado
+        if suscriptores.get(dispositivo_id):
+            publicar_stream(dispositivo_id, "eventos", {"eventos": formatear_eventos(inst.eventos[:20])})
+            publicar_stream(dispositivo_id, "estadisticas", inst.stats.resumen(time.time()))
+        publicar_stream(dispositivo_id, "status", {"mala_postura_activa": inst.mala_postura_activa})
+        notificar_cambio(dispositivo_id)
+    return {
+        "desde": desde,
+        "muestras": len(ts),
+        "muestras_en_alerta": int(np.count_nonzero(alertas)),
+        "sesiones": len(dispositivo.sesiones) - bisect_left(dispositivo.sesiones.inicios, desde),
+        "segundos": round(time.perf_counter() - inicio, 3)
+    }
 
 # 🌐 Rutas Web
-@app.get("/", response_class=HTMLResponse)
-def dashboard():
-    """Dashboard principal - Todo en un solo archivo"""
+# Archivos de static/ (gráfica, etc.) precomprimidos al arrancar. Para usar Chart.js sin CDN,
+# copiar chart.min.js (3.x) a static/; si no está se usa static/grafica.js, compatible con lo que usa el dashboard.
+DIRECTORIO_ESTATICO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+estaticos = recursos.cargar_directorio(DIRECTORIO_ESTATICO)
+SCRIPT_GRAFICA = "chart.min.js" if "chart.min.js" in estaticos else "grafica.js"
+
+def url_estatico(nombre):
+    """URL versionada por contenido: el navegador la cachea para siempre y cambia si cambia el archivo"""
+    recurso = estaticos.get(nombre)
+    return f"/static/{nombre}" + (f"?v={recurso.version}" if recurso else "")
+
+def pagina_dashboard():
+    """HTML del dashboard - Todo en un solo archivo; se arma una sola vez al arrancar (ver DASHBOARD)"""
     return '''
 <!DOCTYPE html>
 <html lang="es">
@@ -260,7 +1136,8 @@ def dashboard():
         <div class="status" id="status">Conectando...</div>
         <div class="status-deteccion" id="statusDeteccion">Sistema de detección: Listo</div>
         <div class="connection-info">
-            Puerto Bluetooth: ''' + BT_PORT + ''' | Velocidad: ''' + str(BAUD_RATE) + ''' bps
+            ''' + (f"Broker MQTT: {MQTT_BROKER}:{MQTT_PORT}" if FUENTE_DATOS == 'mqtt'
+                   else f"Puertos Bluetooth: {', '.join(PUERTOS_SERIAL)} | Velocidad: {BAUD_RATE} bps") + '''
         </div>
     </div>
 
@@ -304,11 +1181,18 @@ def dashboard():
         </div>
     </div>
 
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/Chart.js/3.9.1/chart.min.js"></script>
+    <script src="''' + url_estatico(SCRIPT_GRAFICA) + '''"></script>
     <script>
         let actualizando = true;
         let posturaChart = null;
 
+        // Cinturón a mostrar: /?dispositivo=<id> (por defecto el del puerto serial)
+        const DISPOSITIVO = new URLSearchParams(window.location.search).get('dispositivo');
+        const API = DISPOSITIVO ? '/api/dispositivos/' + encodeURIComponent(DISPOSITIVO) : '/api';
+        const PUNTOS_GRAFICA = ''' + str(PUNTOS_GRAFICA) + ''';
+        const TIEMPO_INACTIVO_MS = ''' + str(TIEMPO_INACTIVO * 1000) + ''';
+        const REINTENTO_STREAM_MS = ''' + str(REINTENTO_STREAM * 1000) + ''';
+
         // Inicializar gráfica
         function initChart() {
             const ctx = document.getElementById('posturaChart').getContext('2d');
@@ -425,68 +1309,72 @@ def dashboard():
             });
         }
 
-        async function cargarDatos() {
-            try {
-                const resp = await fetch('/api/datos');
-                const data = await resp.json();
-                
-                if (data.success) {
-                    document.getElementById('status').textContent = 'Conectado Bluetooth 📱';
-                    document.getElementById('status').className = 'status';
-                    mostrarDatos(data.data);
-                } else {
-                    document.getElementById('status').textContent = 'Sin datos Bluetooth ❌';
-                    document.getElementById('status').className = 'status desconectado';
-                }
-            } catch (error) {
-                document.getElementById('status').textContent = 'Error conexión ❌';
+        function mostrarConexion(data) {
+            if (data) {
+                document.getElementById('status').textContent = 'Conectado Bluetooth 📱';
+                document.getElementById('status').className = 'status';
+                mostrarDatos(data);
+            } else {
+                document.getElementById('status').textContent = 'Sin datos Bluetooth ❌';
                 document.getElementById('status').className = 'status desconectado';
-                console.error('Error:', error);
             }
         }
 
-        async function cargarStatus() {
-            try {
-                const resp = await fetch('/api/status');
-                const status = await resp.json();
-                
-                // Actualizar estado de detección
-                const statusDeteccion = document.getElementById('statusDeteccion');
-                if (status.mala_postura_activa) {
-                    statusDeteccion.textContent = 'Sesión de mala postura activa - Esperando corrección';
-                    statusDeteccion.style.background = 'rgba(239, 68, 68, 0.3)';
-                } else {
-                    statusDeteccion.textContent = 'Sistema de detección: Listo para detectar';
-                    statusDeteccion.style.background = 'rgba(21, 154, 104, 0.3)';
-                }
-            } catch (error) {
-                console.error('Error cargando status:', error);
+        function mostrarStatus(malaPosturaActiva) {
+            // Actualizar estado de detección
+            const statusDeteccion = document.getElementById('statusDeteccion');
+            if (malaPosturaActiva) {
+                statusDeteccion.textContent = 'Sesión de mala postura activa - Esperando corrección';
+                statusDeteccion.style.background = 'rgba(239, 68, 68, 0.3)';
+            } else {
+                statusDeteccion.textContent = 'Sistema de detección: Listo para detectar';
+                statusDeteccion.style.background = 'rgba(21, 154, 104, 0.3)';
             }
         }
 
+        function mostrarHistorial(historial) {
+            // Reinicio completo (carga inicial, limpieza o cursor perdido): vaciar y volver a llenar
+            if (!posturaChart) return;
+            posturaChart.data.labels.length = 0;
+            posturaChart.data.datasets.forEach(dataset => dataset.data.length = 0);
+            // Mantener solo los últimos 50 puntos para mejor rendimiento
+            agregarPuntos(historial.slice(-PUNTOS_GRAFICA));
+            if (!historial.length) posturaChart.update('none'); // Actualizar sin animación
+        }
+
+        function agregarPuntos(items) {
+            // Añadir puntos nuevos sin reconstruir la gráfica: un solo redibujado por tanda
+            if (!posturaChart || !items.length) return;
+            const datos = posturaChart.data;
+            items.forEach(item => {
+                const valores = [item.postura_mala, item.lumbar_mala, item.toracico_mala, item.hombro_mala];
+                datos.labels.push(item.timestamp);
+                datos.datasets.forEach((dataset, i) => dataset.data.push(valores[i] ? 1 : 0));
+            });
+            const sobran = datos.labels.length - PUNTOS_GRAFICA;
+            if (sobran > 0) {
+                datos.labels.splice(0, sobran);
+                datos.datasets.forEach(dataset => dataset.data.splice(0, sobran));
+            }
+            posturaChart.update('none');
+        }
+
+        let cursorHistorial = null;  // Cursor del servidor: solo se piden muestras nuevas
+
         async function cargarHistorial() {
             try {
-                const resp = await fetch('/api/historial');
+                const consulta = cursorHistorial === null
+                    ? '?limit=' + PUNTOS_GRAFICA
+                    : '?since=' + cursorHistorial;
+                const resp = await fetch(API + '/historial' + consulta);
                 const data = await resp.json();
-                
-                if (posturaChart && data.historial) {
-                    // Mantener solo los últimos 50 puntos para mejor rendimiento
-                    const historial = data.historial.slice(-50);
-                    
-                    const labels = historial.map(item => item.timestamp);
-                    const posturaGeneral = historial.map(item => item.postura_mala ? 1 : 0);
-                    const lumbar = historial.map(item => item.lumbar_mala ? 1 : 0);
-                    const toracico = historial.map(item => item.toracico_mala ? 1 : 0);
-                    const hombro = historial.map(item => item.hombro_mala ? 1 : 0);
-
-                    posturaChart.data.labels = labels;
-                    posturaChart.data.datasets[0].data = posturaGeneral;
-                    posturaChart.data.datasets[1].data = lumbar;
-                    posturaChart.data.datasets[2].data = toracico;
-                    posturaChart.data.datasets[3].data = hombro;
-                    
-                    posturaChart.update('none'); // Actualizar sin animación
+                if (!data.historial) return;
+                if (cursorHistorial === null || !data.completo) {
+                    mostrarHistorial(data.historial);
+                } else {
+                    agregarPuntos(data.historial);
                 }
+                cursorHistorial = data.cursor;
             } catch (error) {
                 console.error('Error cargando historial:', error);
             }
@@ -528,134 +1416,637 @@ def dashboard():
             }
         }
 
-        async function cargarEstadisticas() {
-            try {
-                const resp = await fetch('/api/estadisticas');
-                const data = await resp.json();
-                
-                document.getElementById('totalMalas').textContent = data.total_malas;
-                document.getElementById('malasHoy').textContent = data.malas_hoy;
-            } catch (error) {
-                console.log('Error cargando estadísticas');
-            }
+        function mostrarEstadisticas(data) {
+            document.getElementById('totalMalas').textContent = data.total_malas;
+            document.getElementById('malasHoy').textContent = data.malas_hoy;
         }
 
-        async function cargarEventos() {
-            try {
-                const resp = await fetch('/api/eventos');
-                const data = await resp.json();
-                
-                const timeline = document.getElementById('timeline');
-                if (data.eventos.length === 0) {
-                    timeline.innerHTML = '<div class="loading">Sin eventos recientes</div>';
-                } else {
-                    timeline.innerHTML = data.eventos.map(evento => `
-                        <div class="evento">
-                            <div class="evento-icon">⚠️</div>
-                            <div>
-                                <div style="font-size: 0.8rem; color: var(--color2);">${evento.timestamp}</div>
-                                <div style="color: var(--color1); font-weight: 500;">Mala postura: ${evento.sensores}</div>
-                            </div>
+        function mostrarEventos(eventos) {
+            const timeline = document.getElementById('timeline');
+            if (eventos.length === 0) {
+                timeline.innerHTML = '<div class="loading">Sin eventos recientes</div>';
+            } else {
+                timeline.innerHTML = eventos.map(evento => `
+                    <div class="evento">
+                        <div class="evento-icon">⚠️</div>
+                        <div>
+                            <div style="font-size: 0.8rem; color: var(--color2);">${evento.timestamp}</div>
+                            <div style="color: var(--color1); font-weight: 500;">Mala postura: ${evento.sensores}</div>
                         </div>
-                    `).join('');
-                }
-            } catch (error) {
-                console.log('Error cargando eventos');
+                    </div>
+                `).join('');
             }
         }
 
         async function limpiarEventos() {
             try {
-                await fetch('/api/limpiar', { method: 'POST' });
-                cargarEventos();
-                cargarEstadisticas();
-                cargarHistorial(); // También actualizar gráfica
+                await fetch(API + '/limpiar', { method: 'POST' });
+                cursorHistorial = null;
+                if (!stream) {
+                    cargarSnapshot(); // También actualiza la gráfica
+                }
                 alert('Todos los datos limpiados');
             } catch (error) {
                 alert('Error al limpiar');
             }
         }
 
+        let versionSnapshot = null;
+
+        async function cargarSnapshot() {
+            try {
+                // Un solo pedido con datos, estadísticas, eventos y status.
+                // El navegador revalida con ETag y el servidor responde 304 si no hubo cambios.
+                const resp = await fetch(API + '/snapshot');
+                if (!resp.ok) throw new Error('HTTP ' + resp.status);
+                const snap = await resp.json();
+                mostrarConexion(snap.datos);
+                if (snap.version === versionSnapshot && cursorHistorial !== null) return;
+                versionSnapshot = snap.version;
+                mostrarEstadisticas(snap.estadisticas);
+                mostrarEventos(snap.eventos);
+                mostrarStatus(snap.status.mala_postura_activa);
+                if (snap.cursor !== cursorHistorial) {
+                    cargarHistorial(); // Actualizar gráfica solo si hay muestras nuevas
+                }
+            } catch (error) {
+                document.getElementById('status').textContent = 'Error conexión ❌';
+                document.getElementById('status').className = 'status desconectado';
+                console.error('Error:', error);
+            }
+        }
+
         function actualizar() {
-            if (actualizando) {
-                cargarDatos();
-                cargarEstadisticas();
-                cargarEventos();
-                cargarHistorial(); // Actualizar gráfica
-                cargarStatus(); // Actualizar estado de detección
+            if (actualizando && !stream) {
+                cargarSnapshot();
             }
         }
 
+        // 📡 Stream en tiempo real (SSE): el servidor empuja solo los cambios
+        let stream = null;
+        let ultimaMuestra = 0;
+
+        function conectarStream() {
+            if (!window.EventSource) return false;
+            stream = new EventSource(API + '/stream');
+            stream.addEventListener('inicial', e => {
+                const inicial = JSON.parse(e.data);
+                ultimaMuestra = inicial.datos ? Date.now() : 0;
+                mostrarConexion(inicial.datos);
+                mostrarEstadisticas(inicial.estadisticas);
+                mostrarEventos(inicial.eventos);
+                mostrarHistorial(inicial.historial);
+                mostrarStatus(inicial.mala_postura_activa);
+            });
+            stream.addEventListener('muestra', e => {
+                const muestra = JSON.parse(e.data);
+                ultimaMuestra = Date.now();
+                mostrarConexion(muestra.datos);
+                agregarPuntos([muestra.punto]);
+            });
+            stream.addEventListener('estadisticas', e => mostrarEstadisticas(JSON.parse(e.data)));
+            stream.addEventListener('eventos', e => mostrarEventos(JSON.parse(e.data).eventos));
+            stream.addEventListener('status', e => mostrarStatus(JSON.parse(e.data).mala_postura_activa));
+            stream.addEventListener('limpiar', () => {
+                mostrarEventos([]);
+                mostrarEstadisticas({ total_malas: 0, malas_hoy: 0 });
+                mostrarHistorial([]);
+                mostrarStatus(false);
+            });
+            stream.onerror = () => {
+                // EventSource reintenta solo; si el servidor lo cerró se vuelve al sondeo
+                // y se abre otro stream más tarde
+                if (stream.readyState === EventSource.CLOSED) {
+                    stream = null;
+                    setTimeout(conectarStream, REINTENTO_STREAM_MS);
+                }
+                document.getElementById('status').textContent = 'Error conexión ❌';
+                document.getElementById('status').className = 'status desconectado';
+            };
+            return true;
+        }
+
         // Inicializar cuando se carga la página
         window.addEventListener('load', function() {
             initChart();
-            actualizar(); // Cargar datos iniciales
+            if (!conectarStream()) {
+                actualizar(); // Cargar datos iniciales
+            }
         });
 
-        // Iniciar actualizaciones
-        setInterval(actualizar, 2000); // Cada 2 segundos
+        // Sondeo de respaldo si no hay stream; con stream solo se vigila el silencio del cinturón
+        setInterval(function() {
+            if (stream && ultimaMuestra && Date.now() - ultimaMuestra > TIEMPO_INACTIVO_MS) {
+                ultimaMuestra = 0;
+                mostrarConexion(null);
+            }
+            actualizar();
+        }, 2000); // Cada 2 segundos
     </script>
 </body>
 </html>
     '''
 
+DASHBOARD = RecursoEstatico(pagina_dashboard(), "text/html; charset=utf-8")
+
+@app.get("/", response_class=HTMLResponse)
+def dashboard(request: Request):
+    """Dashboard principal: HTML ya armado y comprimido, con ETag fuerte (304 si no cambió)"""
+    return DASHBOARD.respuesta(request)
+
+@app.get("/static/{nombre}")
+def recurso_estatico(nombre: str, request: Request):
+    """Archivos de static/ (precomprimidos, cacheables sin límite gracias al ?v=<version>)"""
+    recurso = estaticos.get(nombre)
+    if recurso is None:
+        raise HTTPException(status_code=404, detail=f"Recurso desconocido: {nombre}")
+    return recurso.respuesta(request)
+
+def buscar_dispositivo(dispositivo_id):
+    dispositivo = obtener_dispositivo(dispositivo_id, crear=False)
+    if dispositivo is None:
+        if modo_lector and segmento.lleno():
+            # Puede existir en el proceso de ingesta sin registro en el segmento
+            raise HTTPException(status_code=503, detail=f"Dispositivo no compartido (límite de "
+                                f"{segmento.max_dispositivos}, ver MAX_DISPOSITIVOS_COMPARTIDOS): {dispositivo_id}")
+        raise HTTPException(status_code=404, detail=f"Dispositivo desconocido: {dispositivo_id}")
+    return dispositivo
+
+def leer_dispositivo(dispositivo_id):
+    """Rutas del cinturón por defecto: antes de la primera muestra devuelve un estado vacío
+    sin registrarlo (como en los procesos de API), así el dashboard abre antes que el cinturón"""
+    dispositivo = obtener_dispositivo(dispositivo_id, crear=False)
+    return EstadoDispositivo(dispositivo_id) if dispositivo is None else dispositivo
+
 @app.get("/api/datos")
 def obtener_datos():
     """API para obtener datos actuales"""
-    if current_data and conexion_bt_activa:
-        return {"success": True, "data": current_data}
+    dispositivo = obtener_dispositivo(DISPOSITIVO_POR_DEFECTO, crear=False)
+    if dispositivo and dispositivo.publicado.ultima_muestra and conexion_activa():
+        return {"success": True, "data": dispositivo.datos_actuales()}
     return {"success": False, "data": None}
 
 @app.get("/api/estadisticas")  
 def obtener_estadisticas():
     """API para estadísticas"""
-    return estadisticas
+    return leer_dispositivo(DISPOSITIVO_POR_DEFECTO).estadisticas()
 
 @app.get("/api/eventos")
 def obtener_eventos():
     """API para eventos de mala postura"""
-    return {"eventos": list(eventos_malas_posturas)[:20]}  # Últimos 20
+    return {"eventos": leer_dispositivo(DISPOSITIVO_POR_DEFECTO).eventos_dicts()}  # Últimos 20
 
 @app.get("/api/historial")
-def obtener_historial():
-    """API para historial de posturas (gráfica tiempo vs postura)"""
-    return {"historial": list(historial_posturas)}
+def obtener_historial(since: Optional[int] = None, limit: Optional[int] = Query(None, ge=1),
+                      puntos: Optional[int] = Query(None, ge=2), formato: str = "registros"):
+    """API para historial de posturas (gráfica tiempo vs postura)
+
+    since=<cursor> devuelve solo muestras nuevas; `cursor` de la respuesta es el siguiente since.
+    formato=columnas evita construir un dict por muestra.
+    """
+    return leer_dispositivo(DISPOSITIVO_POR_DEFECTO).consultar_historial(since, limit, puntos, formato)
+
+@app.get("/api/historial/rango")
+def obtener_historial_rango(desde: Optional[float] = None, hasta: Optional[float] = None,
+                            dispositivo: str = DISPOSITIVO_POR_DEFECTO, sensor: Optional[str] = None,
+                            limite: int = Query(10_000, ge=1, le=MAX_MUESTRAS_RANGO),
+                            puntos: Optional[int] = Query(None, ge=2),
+                            resolucion: Optional[float] = Query(None, gt=0)):
+    """Historial completo de un cinturón en [desde, hasta] (epoch; por defecto, las últimas 24 h)
+
+    Lee los archivos particionados por día (no solo las últimas muestras en memoria).
+    sensor=lumbar|toracico|hombro deja solo las columnas de ese sensor; `siguiente` es el
+    `desde` de la próxima página cuando el rango tiene más de `limite` muestras.
+    Con `puntos` o `resolucion` (segundos por punto) se lee el nivel más grueso que alcanza
+    (agregados de 1 min o 1 h, ver retencion.py); `nivel` dice cuál se usó. Un rango más
+    viejo que la retención de las muestras crudas también sale de los agregados.
+    """
+    if particiones is None:
+        raise HTTPException(status_code=404, detail="Historial particionado desactivado (PARTICIONES_RUTA)")
+    if sensor is not None and sensor not in SENSORES:
+        raise HTTPException(status_code=400, detail=f"sensor debe ser uno de: {', '.join(SENSORES)}")
+    hasta = time.time() if hasta is None else hasta
+    desde = hasta - 86400 if desde is None else desde
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="desde debe ser menor o igual que hasta")
+    if resolucion and not puntos:
+        puntos = max(2, min(MAX_MUESTRAS_RANGO, int((hasta - desde) // resolucion) + 1))
+    paso = resolucion or ((hasta - desde) / puntos if puntos else 0)
+    nivel = compactador.elegir(paso, desde)
+    siguiente = None
+    if nivel is None:
+        ventana = particiones.consultar(dispositivo, desde, hasta, limite + 1)
+        if len(ventana[0]) > limite:
+            siguiente = float(ventana[0][limite])
+            ventana = tuple(columna[:limite] for columna in ventana)
+        muestras = len(ventana[0])
+        if puntos:
+            ventana = buffer_circular.reducir(*ventana, puntos)
+        cols = buffer_circular.columnas(*ventana)
+    else:
+        registros = retencion.reducir(compactador.consultar(dispositivo, nivel, desde, hasta), puntos or limite)
+        muestras = int(registros["n"].sum())
+        cols = buffer_circular.columnas(registros["ts"], registros["alertas"], registros["media"],
+                                        registros["minimo"], registros["maximo"])
+        cols["muestras"] = registros["n"].tolist()
+        cols["segundos_mala"] = np.round(registros["segundos_mala"].astype(np.float64), 1).tolist()
+        cols["segundos_buena"] = np.round(registros["segundos_buena"].astype(np.float64), 1).tolist()
+    if sensor is not None:
+        cols = {clave: valores for clave, valores in cols.items()
+                if clave in ("timestamp", "datetime", "muestras", "segundos_mala", "segundos_buena")
+                or sensor in clave}
+    return {
+        "dispositivo": dispositivo,
+        "desde": desde,
+        "hasta": hasta,
+        "nivel": "crudas" if nivel is None else nivel.nombre,
+        "muestras": muestras,
+        "historial": cols,
+        "siguiente": siguiente
+    }
+
+@app.get("/api/exportar")
+def exportar_historial(desde: Optional[float] = None, hasta: Optional[float] = None,
+                       dispositivo: List[str] = Query([DISPOSITIVO_POR_DEFECTO]),
+                       sensor: List[str] = Query(list(SENSORES)),
+                       formato: str = "csv", nivel: str = "crudas"):
+    """Descarga en streaming del historial en [desde, hasta] (epoch; por defecto, las últimas 24 h)
+
+    formato=csv|arrow|parquet (Arrow y Parquet requieren pyarrow); nivel=crudas|minutos|horas.
+    `dispositivo` y `sensor` se repiten para elegir varios; dispositivo=* exporta todos los
+    cinturones con historial. La memoria usada no depende del largo del rango (ver exportacion.py).
+    """
+    if particiones is None:
+        raise HTTPException(status_code=404, detail="Historial particionado desactivado (PARTICIONES_RUTA)")
+    if formato not in exportacion.FORMATOS:
+        raise HTTPException(status_code=400, detail=f"formato debe ser uno de: {', '.join(exportacion.FORMATOS)}")
+    if not exportacion.disponible(formato):
+        raise HTTPException(status_code=501, detail=f"Exportar a {formato} requiere pyarrow (pip install pyarrow)")
+    if not sensor or set(sensor) - set(SENSORES):
+        raise HTTPException(status_code=400, detail=f"sensor debe ser uno de: {', '.join(SENSORES)}")
+    niveles = {n.nombre: n for n in retencion.NIVELES}
+    if nivel != "crudas" and nivel not in niveles:
+        raise HTTPException(status_code=400, detail=f"nivel debe ser uno de: crudas, {', '.join(niveles)}")
+    hasta = time.time() if hasta is None else hasta
+    desde = hasta - 86400 if desde is None else desde
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="desde debe ser menor o igual que hasta")
+    if "*" in dispositivo:
+        dispositivo = sorted(particiones.dispositivos())
+    sensores = [s for s in SENSORES if s in sensor]
+    nivel = niveles.get(nivel)
+    campos = exportacion.campos(sensores, nivel)
+    bloques = exportacion.bloques(particiones, list(dict.fromkeys(dispositivo)), sensores, desde, hasta,
+                                  compactador, nivel)
+    tipo, extension = exportacion.FORMATOS[formato]
+    nombre = f"postura-{time.strftime('%Y%m%d', time.gmtime(desde))}-{time.strftime('%Y%m%d', time.gmtime(hasta))}"
+    return StreamingResponse(exportacion.exportar(formato, bloques, campos), media_type=tipo,
+                             headers={"Content-Disposition": f'attachment; filename="{nombre}.{extension}"'})
 
 @app.get("/api/status")
 def obtener_status():
     """API para estado de conexión"""
+    fuentes = fuentes_conectadas()
+    dispositivo = obtener_dispositivo(DISPOSITIVO_POR_DEFECTO, crear=False)
     return {
-        "bluetooth_conectado": conexion_bt_activa,
-        "puerto": BT_PORT,
-        "mala_postura_activa": mala_postura_registrada  # Nuevo campo para mostrar si hay una mala postura activa
+        "fuente": FUENTE_DATOS,
+        "bluetooth_conectado": bool(fuentes & FUENTE_BLUETOOTH),
+        "mqtt_conectado": bool(fuentes & FUENTE_MQTT),
+        "puerto": ", ".join(PUERTOS_SERIAL),
+        "puertos": lector_serial.estado() if lector_serial else [],
+        "mala_postura_activa": bool(dispositivo and dispositivo.publicado.mala_postura_activa)  # Nuevo campo para mostrar si hay una mala postura activa
+    }
+
+@app.get("/api/analitica")
+def obtener_analitica():
+    """Ángulo medio/máximo por sensor, tiempo en mala postura y alertas en los últimos 5 min, 1 h y 24 h"""
+    return leer_dispositivo(DISPOSITIVO_POR_DEFECTO).resumen_analitica()
+
+@app.get("/api/sesiones")
+def obtener_sesiones(desde: Optional[float] = None, hasta: Optional[float] = None,
+                     limite: int = Query(100, ge=1, le=MAX_SESIONES_RESPUESTA)):
+    """Sesiones de mala postura que tocan [desde, hasta] (epoch) y el tiempo total en mala postura"""
+    return consultar_sesiones(leer_dispositivo(DISPOSITIVO_POR_DEFECTO), desde, hasta, limite)
+
+def consultar_sesiones(dispositivo, desde, hasta, limite):
+    if desde is not None and hasta is not None and desde > hasta:
+        raise HTTPException(status_code=400, detail="desde debe ser menor o igual que hasta")
+    return dispositivo.consultar_sesiones(desde, hasta, limite)
+
+@app.get("/api/reglas")
+def obtener_reglas():
+    """Reglas de alerta del servidor: por defecto y por cinturón (null = se usa el bit del Arduino)"""
+    if modo_lector:
+        with reglas_lock:
+            configuracion_reglas.cargar()
+    return dict(configuracion_reglas.como_dict(), firmware=ReglasSensores({}).como_dict())
+
+@app.put("/api/reglas")
+def modificar_reglas(cuerpo: dict = Body(...), recalcular: bool = True):
+    """Reglas por defecto: {sensor: {umbral, histeresis, confirmacion}} (grados y segundos; los
+    sensores o campos que falten toman los valores del Arduino). Con recalcular=true también se
+    reevalúan las alertas del historial y se rehacen sesiones y estadísticas"""
+    return guardar_reglas(None, cuerpo, recalcular)
+
+@app.delete("/api/reglas")
+def quitar_reglas(recalcular: bool = True):
+    """Quita las reglas por defecto (los cinturones sin reglas propias vuelven al bit del Arduino)"""
+    return guardar_reglas(None, None, recalcular)
+
+def guardar_reglas(dispositivo_id, cuerpo, recalcular):
+    try:
+        configuradas = None if cuerpo is None else reglas.validar(cuerpo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # El recálculo recorre hasta DIAS_RECALCULO días de historial: más margen que una limpieza
+    recalculados = escritor.ejecutar(cambiar_reglas, dispositivo_id, configuradas, recalcular, timeout=60)
+    return {
+        "success": True,
+        # Con varios procesos de API la ingesta las aplica en menos de REFRESCO_ANALITICA s
+        "aplicadas": recalculados is not None,
+        "recalculados": recalculados or {}
     }
 
 @app.post("/api/limpiar")
 def limpiar_eventos():
     """Limpiar historial de eventos y gráfica"""
-    global eventos_malas_posturas, estadisticas, historial_posturas, mala_postura_registrada
-    eventos_malas_posturas.clear()
-    historial_posturas.clear()
-    estadisticas = {"total_malas": 0, "malas_hoy": 0, "porcentaje_buena": 100}
-    mala_postura_registrada = False  # Resetear flag de postura registrada
-    print("🗑️ Datos limpiados - Sistema reseteado")
+    limpiar(DISPOSITIVO_POR_DEFECTO)
+    log.info("🗑️ Datos limpiados - Sistema reseteado")
     return {"success": True}
 
+@app.get("/api/snapshot")
+async def snapshot(request: Request, wait_for_version: Optional[int] = None,
+                   timeout: float = Query(25, ge=0, le=60)):
+    """Datos, estadísticas, eventos y status en una sola respuesta versionada (ETag / 304)"""
+    return await respuesta_snapshot(request, leer_dispositivo(DISPOSITIVO_POR_DEFECTO),
+                                    wait_for_version, timeout)
+
+async def respuesta_snapshot(request, dispositivo, wait_for_version, timeout):
+    """Devuelve los bytes cacheados; con wait_for_version espera hasta que haya una versión mayor"""
+    if wait_for_version is not None:
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + timeout
+        while True:
+            # Registrar la espera ANTES de mirar la versión para no perder un aviso
+            evento = esperas.setdefault(dispositivo.dispositivo_id, asyncio.Event())
+            # Un estado vacío (ver leer_dispositivo) se cambia por el real cuando llega la primera muestra
+            dispositivo = dispositivos.get(dispositivo.dispositivo_id, dispositivo)
+            restante = limite - loop.time()
+            if dispositivo.publicado.version > wait_for_version or restante <= 0:
+                break
+            try:
+                await asyncio.wait_for(evento.wait(), restante)
+            except asyncio.TimeoutError:
+                break
+
+    etag, cuerpo = dispositivo.snapshot()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+@app.get("/api/stream")
+async def stream(request: Request):
+    """Stream SSE del cinturón por defecto"""
+    return respuesta_stream(request, leer_dispositivo(DISPOSITIVO_POR_DEFECTO))
+
+def respuesta_stream(request, dispositivo):
+    """Envía el estado inicial y después solo los cambios (muestras, eventos, estadísticas)"""
+    async def generar():
+        cola = asyncio.Queue(maxsize=MAX_COLA_STREAM)
+        suscriptores.setdefault(dispositivo.dispositivo_id, set()).add(cola)
+        try:
+            inst = dispositivo.publicado
+            inicial = {
+                "datos": dispositivo.datos_actuales() if dispositivo.conectado(inst) else None,
+                "estadisticas": dispositivo.estadisticas(inst),
+                "eventos": dispositivo.eventos_dicts(inst=inst),
+                "historial": dispositivo.historial_dicts(PUNTOS_GRAFICA, inst),
+                "mala_postura_activa": inst.mala_postura_activa
+            }
+            yield f"event: inicial\ndata: {json.dumps(inicial)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(cola.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"  # Mantener viva la conexión
+        finally:
+            suscriptores[dispositivo.dispositivo_id].discard(cola)
+
+    return StreamingResponse(generar(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 📡 Rutas por dispositivo
+@app.get("/api/dispositivos")
+def listar_dispositivos():
+    """Lista de cinturones conocidos"""
+    return {"dispositivos": [
+        {
+            "id": dispositivo.dispositivo_id,
+            "conectado": dispositivo.conectado(),
+            "mala_postura_activa": dispositivo.publicado.mala_postura_activa
+        }
+        for dispositivo in list(dispositivos.values())
+    ]}
+
+@app.get("/api/dispositivos/{dispositivo_id}/datos")
+def obtener_datos_dispositivo(dispositivo_id: str):
+    """Datos actuales de un cinturón"""
+    dispositivo = buscar_dispositivo(dispositivo_id)
+    if dispositivo.conectado():
+        return {"success": True, "data": dispositivo.datos_actuales()}
+    return {"success": False, "data": None}
+
+@app.get("/api/dispositivos/{dispositivo_id}/estadisticas")
+def obtener_estadisticas_dispositivo(dispositivo_id: str):
+    """Estadísticas de un cinturón"""
+    return buscar_dispositivo(dispositivo_id).estadisticas()
+
+@app.get("/api/dispositivos/{dispositivo_id}/eventos")
+def obtener_eventos_dispositivo(dispositivo_id: str):
+    """Eventos de mala postura de un cinturón"""
+    return {"eventos": buscar_dispositivo(dispositivo_id).eventos_dicts()}
+
+@app.get("/api/dispositivos/{dispositivo_id}/historial")
+def obtener_historial_dispositivo(dispositivo_id: str, since: Optional[int] = None,
+                                  limit: Optional[int] = Query(None, ge=1),
+                                  puntos: Optional[int] = Query(None, ge=2), formato: str = "registros"):
+    """Historial de posturas de un cinturón (mismos parámetros que /api/historial)"""
+    return buscar_dispositivo(dispositivo_id).consultar_historial(since, limit, puntos, formato)
+
+@app.get("/api/dispositivos/{dispositivo_id}/analitica")
+def obtener_analitica_dispositivo(dispositivo_id: str):
+    """Analítica por ventanas de un cinturón (mismo formato que /api/analitica)"""
+    return buscar_dispositivo(dispositivo_id).resumen_analitica()
+
+@app.get("/api/dispositivos/{dispositivo_id}/sesiones")
+def obtener_sesiones_dispositivo(dispositivo_id: str, desde: Optional[float] = None, hasta: Optional[float] = None,
+                                 limite: int = Query(100, ge=1, le=MAX_SESIONES_RESPUESTA)):
+    """Sesiones de mala postura de un cinturón (mismos parámetros que /api/sesiones)"""
+    return consultar_sesiones(buscar_dispositivo(dispositivo_id), desde, hasta, limite)
+
+@app.get("/api/dispositivos/{dispositivo_id}/reglas")
+def obtener_reglas_dispositivo(dispositivo_id: str):
+    """Reglas efectivas de un cinturón (las propias sobre las por defecto) o null si usa el bit del Arduino"""
+    if modo_lector:
+        with reglas_lock:
+            configuracion_reglas.cargar()
+    efectivas = configuracion_reglas.efectivas(dispositivo_id)
+    return {
+        "dispositivo": dispositivo_id,
+        "propias": dispositivo_id in configuracion_reglas.dispositivos,
+        "reglas": efectivas.como_dict() if efectivas else None
+    }
+
+@app.put("/api/dispositivos/{dispositivo_id}/reglas")
+def modificar_reglas_dispositivo(dispositivo_id: str, cuerpo: dict = Body(...), recalcular: bool = True):
+    """Reglas propias de un cinturón (mismo formato y parámetros que PUT /api/reglas)"""
+    return guardar_reglas(dispositivo_id, cuerpo, recalcular)
+
+@app.delete("/api/dispositivos/{dispositivo_id}/reglas")
+def quitar_reglas_dispositivo(dispositivo_id: str, recalcular: bool = True):
+    """Quita las reglas propias de un cinturón (vuelve a las por defecto o al bit del Arduino)"""
+    return guardar_reglas(dispositivo_id, None, recalcular)
+
+@app.get("/api/dispositivos/{dispositivo_id}/status")
+def obtener_status_dispositivo(dispositivo_id: str):
+    """Estado de conexión de un cinturón"""
+    dispositivo = buscar_dispositivo(dispositivo_id)
+    inst = dispositivo.publicado
+    return {
+        "conectado": dispositivo.conectado(inst),
+        "ultima_muestra": inst.ultima_muestra or None,
+        "mala_postura_activa": inst.mala_postura_activa,
+        "tramas_perdidas": inst.tramas_perdidas
+    }
+
+@app.get("/api/dispositivos/{dispositivo_id}/snapshot")
+async def snapshot_dispositivo(dispositivo_id: str, request: Request, wait_for_version: Optional[int] = None,
+                               timeout: float = Query(25, ge=0, le=60)):
+    """Snapshot versionado de un cinturón (mismos parámetros que /api/snapshot)"""
+    return await respuesta_snapshot(request, buscar_dispositivo(dispositivo_id), wait_for_version, timeout)
+
+@app.get("/api/dispositivos/{dispositivo_id}/stream")
+async def stream_dispositivo(dispositivo_id: str, request: Request):
+    """Stream SSE de un cinturón"""
+    return respuesta_stream(request, buscar_dispositivo(dispositivo_id))
+
+@app.post("/api/dispositivos/{dispositivo_id}/limpiar")
+def limpiar_eventos_dispositivo(dispositivo_id: str):
+    """Limpiar historial de eventos y gráfica de un cinturón"""
+    buscar_dispositivo(dispositivo_id)
+    limpiar(dispositivo_id)
+    log.info("🗑️ [%s] Datos limpiados - Sistema reseteado", dispositivo_id)
+    return {"success": True}
+
+# 🧠 Proceso de ingesta (API_WORKERS > 1)
+def vigilar_pedidos(parar):
+    """Latido y estado de las fuentes para los procesos de API; atiende sus pedidos de limpieza"""
+    while not parar.wait(INTERVALO_COMPARTIDO):
+        segmento.fijar_conexion(fuentes_conectadas())
+        for dispositivo_id, pedido in segmento.pedidos_limpieza():
+            escritor.ejecutar(limpiar_dispositivo, dispositivo_id)
+            segmento.atender_limpieza(dispositivo_id, pedido)
+
+async def ingesta_mqtt_sin_api(parar):
+    global ingesta_mqtt, loop_principal
+    loop_principal = asyncio.get_running_loop()
+    ingesta_mqtt = IngestaMQTT(MQTT_BROKER, MQTT_PORT, encolar_sin_esperar, topicos=MQTT_TOPICOS,
+                               dispositivo_por_defecto=DISPOSITIVO_POR_DEFECTO)
+    await ingesta_mqtt.iniciar()
+    try:
+        while not parar.is_set():
+            await asyncio.sleep(INTERVALO_COMPARTIDO)
+    finally:
+        await ingesta_mqtt.detener()
+
+def proceso_ingesta(nombre_segmento, parar, puertos=None):
+    """Serial/MQTT + escritor + almacén en un proceso propio; el estado se publica en el segmento"""
+    global segmento
+    bitacora.configurar(NIVEL_LOG)
+    # systemd y `kill` al grupo mandan SIGTERM a todos los procesos: terminar como con Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    segmento = SegmentoCompartido.abrir(nombre_segmento)
+    segmento.sincronizar()  # Registros de una ejecución anterior de este proceso
+    if almacen:
+        almacen.iniciar()
+    if particiones:
+        particiones.iniciar()
+        compactador.iniciar()
+    escritor.iniciar()
+    threading.Thread(target=vigilar_pedidos, args=(parar,), name="vigilar-pedidos", daemon=True).start()
+    try:
+        if FUENTE_DATOS == 'mqtt':
+            asyncio.run(ingesta_mqtt_sin_api(parar))
+        else:
+            threading.Thread(target=init_bluetooth, args=(puertos,), daemon=True).start()
+            parar.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if lector_serial:
+            lector_serial.detener()
+        escritor.detener()
+        if almacen:
+            almacen.detener()
+        if particiones:
+            compactador.detener()
+            particiones.detener()
+
+@app.get("/metrics")
+def exponer_metricas():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(content=metricas.exponer(), media_type=TIPO_CONTENIDO)
+
 if __name__ == "__main__":
+    import argparse
+    argumentos = argparse.ArgumentParser(description="Monitor de postura")
+    argumentos.add_argument("--puertos", nargs="+", metavar="PUERTO",
+                            help="Leer estos puertos serie (admite comodines y 'puerto=id'); implica la fuente 'serial'")
+    opciones = argumentos.parse_args()
+    if opciones.puertos:
+        FUENTE_DATOS, PUERTOS_SERIAL = 'serial', opciones.puertos
+    bitacora.configurar(NIVEL_LOG)
     print("📱 Monitor de Postura Bluetooth - Versión Inteligente")
     print("=" * 60)
-    print(f"📱 Puerto Bluetooth: {BT_PORT} @ {BAUD_RATE} bps")
+    if FUENTE_DATOS == 'mqtt':
+        print(f"📡 Broker MQTT: {MQTT_BROKER}:{MQTT_PORT} ({', '.join(MQTT_TOPICOS)})")
+    else:
+        print(f"📱 Puertos Bluetooth: {', '.join(PUERTOS_SERIAL)} @ {BAUD_RATE} bps")
     print(f"🌐 Dashboard: http://localhost:{WEB_PORT}")
     print("=" * 60)
-    print("🔄 Flujo: Arduino → Bluetooth → Dashboard")
+    if FUENTE_DATOS == 'mqtt':
+        print("🔄 Flujo: Arduino → Bluetooth → MQTT → Dashboard")
+    else:
+        print("🔄 Flujo: Arduino → Bluetooth → Dashboard")
     print("🧠 Detección inteligente: Una alerta por sesión de mala postura")
     print("=" * 60)
     
-    # Iniciar Bluetooth en hilo separado
-    bt_thread = threading.Thread(target=init_bluetooth, daemon=True)
-    bt_thread.start()
-    
-    print("⏳ Esperando datos del dispositivo Bluetooth...")
+    if FUENTE_DATOS == 'serial':
+        if API_WORKERS == 1:  # Con varios workers el puerto lo abre proceso_ingesta
+            # Iniciar Bluetooth en hilo separado
+            bt_thread = threading.Thread(target=init_bluetooth, args=(PUERTOS_SERIAL,), daemon=True)
+            bt_thread.start()
+        print("⏳ Esperando datos de los dispositivos Bluetooth...")
+    else:
+        # La ingesta MQTT corre dentro del event loop de uvicorn (ver ciclo_vida)
+        print("⏳ Esperando datos por MQTT...")
     
-    # Iniciar servidor web
-    uvicorn.run(app, host="0.0.0.0", port=WEB_PORT)
+    if API_WORKERS > 1:
+        # La ingesta pasa a un proceso propio y los workers leen el estado de memoria compartida
+        compartido = SegmentoCompartido.crear(MAX_HISTORIAL, MAX_EVENTOS, MAX_DISPOSITIVOS_COMPARTIDOS)
+        os.environ[VARIABLE_SEGMENTO] = compartido.nombre
+        parar = multiprocessing.Event()
+        ingesta = multiprocessing.Process(target=proceso_ingesta, args=(compartido.nombre, parar, PUERTOS_SERIAL),
+                                          name="ingesta")
+        ingesta.start()
+        print(f"🧠 {API_WORKERS} procesos de API + 1 de ingesta (memoria compartida {compartido.nombre})")
+        try:
+            uvicorn.run("server:app", host="0.0.0.0", port=WEB_PORT, workers=API_WORKERS, access_log=False)
+        finally:
+            parar.set()
+            ingesta.join(10)
+            compartido.cerrar()
+    else:
+        # Iniciar servidor web (sin log de accesos: la latencia por ruta está en /metrics)
+        uvicorn.run(app, host="0.0.0.0", port=WEB_PORT, access_log=False)
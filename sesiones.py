@@ -0,0 +1,110 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+import numpy as np
+
+# ⏱️ Sesiones de mala postura: inicio, fin, sensores involucrados y desviación máxima
+# Las sesiones de un cinturón no se solapan (hay una abierta a la vez), así que inicios y
+# fines quedan ordenados: "sesiones que tocan [desde, hasta]" son dos búsquedas binarias y
+# "tiempo en mala postura en el rango" sale de sumas prefijas, recortando solo las sesiones
+# de los bordes. O(log n) por consulta aunque el índice tenga meses de historia.
+# Un solo escritor (agregar); los lectores usan el `n` de una instantánea publicada.
+# detectar() arma las sesiones de un historial completo en bloque (p. ej. al cambiar los umbrales).
+
+Sesion = namedtuple("Sesion", "inicio fin sensores pico")
+# Resultado de detectar(): arreglos de las sesiones cerradas, índice de la muestra que abrió cada
+# sesión (incluida la abierta) y la sesión abierta al final como (inicio, sensores, pico) o None
+Deteccion = namedtuple("Deteccion", "inicios fines sensores picos primeras abierta")
+
+
+class IndiceSesiones:
+    __slots__ = ("inicios", "fines", "acumulado", "sensores", "picos")
+
+    def __init__(self):
+        self.inicios = array('d')
+        self.fines = array('d')
+        self.acumulado = array('d', (0.0,))  # acumulado[k] = duración total de las primeras k sesiones
+        self.sensores = array('B')           # OR de los bits de alerta durante la sesión
+        self.picos = array('f')              # Mayor |ángulo - referencia| de un sensor en alerta
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def agregar(self, inicio, fin, sensores, pico):
+        """Agrega una sesión cerrada; se recorta para no solaparse con la anterior"""
+        if self.fines:
+            inicio = max(inicio, self.fines[-1])
+        fin = max(fin, inicio)
+        # `acumulado` primero: un lector acotado por n nunca ve una sesión sin su suma
+        self.acumulado.append(self.acumulado[-1] + fin - inicio)
+        self.sensores.append(sensores)
+        self.picos.append(pico)
+        self.fines.append(fin)
+        self.inicios.append(inicio)
+
+    def recortar(self, k):
+        """Índice nuevo con las primeras k sesiones (el original sigue válido para sus lectores)"""
+        nuevo = IndiceSesiones()
+        nuevo.inicios, nuevo.fines, nuevo.sensores, nuevo.picos = (
+            self.inicios[:k], self.fines[:k], self.sensores[:k], self.picos[:k])
+        nuevo.acumulado = self.acumulado[:k + 1]
+        return nuevo
+
+    def __getitem__(self, k):
+        return Sesion(self.inicios[k], self.fines[k], self.sensores[k], self.picos[k])
+
+    def solapadas(self, desde, hasta, n=None):
+        """(i, j): las sesiones i..j-1 tocan el rango [desde, hasta]"""
+        n = len(self.inicios) if n is None else n
+        i = bisect_left(self.fines, desde, 0, n)
+        j = bisect_right(self.inicios, hasta, i, n)
+        return i, j
+
+    def tiempo(self, desde, hasta, n=None):
+        """Segundos en mala postura dentro de [desde, hasta]"""
+        i, j = self.solapadas(desde, hasta, n)
+        if i >= j:
+            return 0.0
+        total = self.acumulado[j] - self.acumulado[i]
+        # Solo las sesiones de los bordes pueden salirse del rango
+        if self.inicios[i] < desde:
+            total -= desde - self.inicios[i]
+        if self.fines[j - 1] > hasta:
+            total -= self.fines[j - 1] - hasta
+        return max(total, 0.0)
+
+
+def detectar(ts, alertas, desviacion, max_hueco):
+    """Sesiones de muestras ordenadas por tiempo, con las mismas reglas que la ingesta.
+
+    Una sesión empieza con una muestra en alerta y termina con la siguiente muestra buena, o
+    con su última muestra si después hubo más de `max_hueco` s sin datos. `desviacion` es
+    |ángulo - referencia| por sensor (n, 3); el pico solo mira los sensores en alerta.
+    """
+    n = len(ts)
+    mala = alertas != 0
+    hueco = np.zeros(n, dtype=bool)
+    hueco[1:] = np.diff(ts) > max_hueco
+    anterior = np.zeros(n, dtype=bool)
+    anterior[1:] = mala[:-1]
+    siguiente_corta = np.ones(n, dtype=bool)  # La muestra siguiente no continúa la sesión
+    siguiente_corta[:-1] = ~mala[1:] | hueco[1:]
+    primeras = np.flatnonzero(mala & (~anterior | hueco))
+    ultimas = np.flatnonzero(mala & siguiente_corta)
+    if not len(primeras):
+        vacio = np.empty(0)
+        return Deteccion(vacio, vacio, np.empty(0, np.uint8), vacio, primeras, None)
+    bits = (alertas[:, None] >> np.arange(3)) & 1
+    pico = np.where(bits != 0, desviacion, 0.0).max(axis=1)
+    sensores = np.bitwise_or.reduceat(alertas.astype(np.uint8), primeras)
+    picos = np.maximum.reduceat(pico, primeras)
+    # Cierre: la muestra buena que sigue, salvo que llegue después de un hueco
+    despues = np.minimum(ultimas + 1, n - 1)
+    fines = np.where((ultimas + 1 < n) & ~hueco[despues], ts[despues], ts[ultimas])
+    abierta = None
+    if ultimas[-1] == n - 1:
+        abierta = (float(ts[primeras[-1]]), int(sensores[-1]), float(picos[-1]))
+        k = len(primeras) - 1
+        return Deteccion(ts[primeras[:k]], fines[:k], sensores[:k], picos[:k], primeras, abierta)
+    return Deteccion(ts[primeras], fines, sensores, picos, primeras, abierta)
@@ -0,0 +1,119 @@
+// 📈 Gráfica mínima compatible con el subconjunto de Chart.js que usa el dashboard
+// (type 'line', data.labels/datasets, update(), leyenda, relleno, puntos, ticks.callback y títulos de ejes).
+// Se sirve cuando static/chart.min.js no está: el dashboard funciona sin CDN ni Internet.
+(function () {
+    if (window.Chart) return;
+
+    function Chart(ctx, config) {
+        this.ctx = ctx;
+        this.canvas = ctx.canvas;
+        this.data = config.data;
+        this.options = config.options || {};
+        this._dibujar = this.update.bind(this);
+        window.addEventListener('resize', this._dibujar);
+        this.update();
+    }
+
+    Chart.prototype.update = function () {
+        const canvas = this.canvas, ctx = this.ctx, opciones = this.options;
+        const escalas = opciones.scales || {}, ejeX = escalas.x || {}, ejeY = escalas.y || {};
+        const padre = canvas.parentNode, ratio = window.devicePixelRatio || 1;
+        const ancho = padre.clientWidth, alto = padre.clientHeight || 300;
+        if (canvas.width !== ancho * ratio || canvas.height !== alto * ratio) {
+            canvas.width = ancho * ratio;
+            canvas.height = alto * ratio;
+            canvas.style.width = ancho + 'px';
+            canvas.style.height = alto + 'px';
+        }
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        ctx.clearRect(0, 0, ancho, alto);
+        ctx.font = '12px Arial, sans-serif';
+        ctx.textBaseline = 'middle';
+
+        // Leyenda arriba, centrada
+        const datasets = this.data.datasets, etiquetas = this.data.labels;
+        let arriba = 8;
+        const leyenda = (opciones.plugins || {}).legend || {};
+        if (leyenda.display !== false) {
+            const anchos = datasets.map(d => ctx.measureText(d.label || '').width + 28);
+            let x = (ancho - anchos.reduce((a, b) => a + b, 0)) / 2;
+            datasets.forEach((d, i) => {
+                ctx.fillStyle = d.backgroundColor || d.borderColor;
+                ctx.strokeStyle = d.borderColor;
+                ctx.lineWidth = 1;
+                ctx.fillRect(x, arriba + 2, 14, 10);
+                ctx.strokeRect(x, arriba + 2, 14, 10);
+                ctx.fillStyle = '#666';
+                ctx.textAlign = 'left';
+                ctx.fillText(d.label || '', x + 18, arriba + 7);
+                x += anchos[i];
+            });
+            arriba += 24;
+        }
+
+        // Área de trazado
+        const minY = ejeY.min !== undefined ? ejeY.min : 0, maxY = ejeY.max !== undefined ? ejeY.max : 1;
+        const paso = (ejeY.ticks || {}).stepSize || 1, rotuloY = (ejeY.ticks || {}).callback || (v => v);
+        const izquierda = 70, derecha = ancho - 10, abajo = alto - 40;
+        const y = v => abajo - (v - minY) / (maxY - minY) * (abajo - arriba);
+        const n = etiquetas.length;
+        const x = i => n > 1 ? izquierda + i * (derecha - izquierda) / (n - 1) : (izquierda + derecha) / 2;
+
+        ctx.strokeStyle = (ejeY.grid || {}).color || 'rgba(0,0,0,0.1)';
+        ctx.lineWidth = 1;
+        ctx.fillStyle = '#666';
+        ctx.textAlign = 'right';
+        for (let v = Math.ceil(minY / paso) * paso; v <= maxY; v += paso) {
+            ctx.beginPath();
+            ctx.moveTo(izquierda, y(v));
+            ctx.lineTo(derecha, y(v));
+            ctx.stroke();
+            ctx.fillText(rotuloY(v), izquierda - 6, y(v));
+        }
+        // Rótulos del eje X: como mucho ~8 para que no se encimen
+        ctx.textAlign = 'center';
+        const cada = Math.max(1, Math.ceil(n / 8));
+        for (let i = 0; i < n; i += cada) {
+            ctx.fillText(etiquetas[i], x(i), abajo + 12);
+        }
+        if ((ejeX.title || {}).display) ctx.fillText(ejeX.title.text, (izquierda + derecha) / 2, alto - 10);
+        if ((ejeY.title || {}).display) {
+            ctx.save();
+            ctx.translate(12, (arriba + abajo) / 2);
+            ctx.rotate(-Math.PI / 2);
+            ctx.fillText(ejeY.title.text, 0, 0);
+            ctx.restore();
+        }
+
+        // Series: del fondo (última) al frente (primera), como Chart.js
+        for (let k = datasets.length - 1; k >= 0; k--) {
+            const d = datasets[k], datos = d.data;
+            if (!datos.length) continue;
+            ctx.beginPath();
+            datos.forEach((v, i) => i ? ctx.lineTo(x(i), y(v)) : ctx.moveTo(x(i), y(v)));
+            if (d.fill) {
+                ctx.lineTo(x(datos.length - 1), y(Math.max(minY, 0)));
+                ctx.lineTo(x(0), y(Math.max(minY, 0)));
+                ctx.closePath();
+                ctx.fillStyle = d.backgroundColor;
+                ctx.fill();
+                ctx.beginPath();
+                datos.forEach((v, i) => i ? ctx.lineTo(x(i), y(v)) : ctx.moveTo(x(i), y(v)));
+            }
+            ctx.strokeStyle = d.borderColor;
+            ctx.lineWidth = d.borderWidth || 1;
+            ctx.stroke();
+            const radio = d.pointRadius !== undefined ? d.pointRadius : 3;
+            if (radio > 0) {
+                ctx.fillStyle = d.pointBackgroundColor || d.borderColor;
+                datos.forEach((v, i) => {
+                    ctx.beginPath();
+                    ctx.arc(x(i), y(v), radio, 0, 2 * Math.PI);
+                    ctx.fill();
+                });
+            }
+        }
+    };
+
+    window.Chart = Chart;
+})();
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+sys.path.insert(0, os.path.join(RAIZ, "bluetoothReceiver"))
+
+
+@pytest.fixture
+def servidor():
+    """server.py sin SQLite ni particiones y con el registro de dispositivos vacío"""
+    import server
+    guardado = server.almacen, server.particiones, server.compactador
+    server.almacen = server.particiones = server.compactador = None
+    server.dispositivos.clear()
+    yield server
+    server.dispositivos.clear()
+    server.almacen, server.particiones, server.compactador = guardado
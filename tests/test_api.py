@@ -0,0 +1,65 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from decodificador import codificar_binaria
+from simulador import CinturonVirtual
+
+LECTURAS = ["/estadisticas", "/eventos", "/historial", "/analitica", "/sesiones", "/snapshot", "/stream"]
+
+
+@pytest.fixture
+def cliente(servidor):
+    return TestClient(servidor.app)  # Sin `with`: no arranca la ingesta del lifespan
+
+
+@pytest.mark.parametrize("ruta", LECTURAS)
+def test_lectura_de_desconocido_no_crea_dispositivo(servidor, cliente, ruta):
+    assert cliente.get("/api/dispositivos/fantasma" + ruta).status_code == 404
+    assert not servidor.dispositivos
+
+
+@pytest.mark.parametrize("ruta", [ruta for ruta in LECTURAS if ruta != "/stream"])
+def test_cinturon_por_defecto_vacio_antes_de_la_primera_muestra(servidor, cliente, ruta):
+    # El dashboard puede abrirse antes de que el cinturón se conecte
+    assert cliente.get("/api" + ruta).status_code == 200
+    assert not servidor.dispositivos
+
+
+def test_snapshot_vacio(servidor, cliente):
+    snap = cliente.get("/api/snapshot").json()
+    assert snap["datos"] is None
+    assert snap["eventos"] == []
+    assert not servidor.dispositivos
+
+
+def test_status_sin_dispositivo(servidor, cliente):
+    respuesta = cliente.get("/api/status")
+    assert respuesta.status_code == 200
+    assert respuesta.json()["mala_postura_activa"] is False
+    assert not servidor.dispositivos
+
+
+def test_lectura_de_dispositivo_con_datos(servidor, cliente):
+    cinturon = CinturonVirtual(1)
+    servidor.procesar_lote([(servidor.DISPOSITIVO_POR_DEFECTO, cinturon.trama()) for _ in range(3)])
+    respuesta = cliente.get("/api/dispositivos/sim-1/historial")
+    assert respuesta.status_code == 200
+    assert len(respuesta.json()["historial"]) == 3
+
+
+def tramas_firmware(ciclos, cada_json=30, saltear=()):
+    """Como el loop() de cinturon.ino en modo binario: 1 trama JSON por ciclo y la secuencia
+    solo avanza con las binarias; `saltear` son secuencias que se pierden en el camino"""
+    cinturon, secuencia = CinturonVirtual(1), 0
+    for _ in range(ciclos):
+        yield cinturon.trama()
+        for _ in range(cada_json - 1):
+            if secuencia not in saltear:
+                yield codificar_binaria(1, secuencia, [1.0, 2.0, 3.0], 0)
+            secuencia += 1
+
+
+@pytest.mark.parametrize("saltear, perdidas", [((), 0), ((40,), 1)])
+def test_tramas_json_intercaladas_no_cuentan_como_perdidas(servidor, cliente, saltear, perdidas):
+    servidor.procesar_lote([("rfcomm0", trama) for trama in tramas_firmware(4, saltear=saltear)])
+    assert cliente.get("/api/dispositivos/rfcomm0/status").json()["tramas_perdidas"] == perdidas
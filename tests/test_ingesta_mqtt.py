@@ -0,0 +1,127 @@
+import asyncio
+import struct
+import time
+
+import ingesta_mqtt
+from broker_local import BrokerLocal, CONNECT, DISCONNECT, PUBLISH, paquete
+from ingesta_mqtt import IngestaMQTT
+from simulador import CinturonVirtual
+
+
+async def esperar(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "tiempo agotado"
+        await asyncio.sleep(0.02)
+
+
+async def publicar(puerto, mensajes):
+    """Publica [(tópico, payload)] con QoS 0 desde una conexión propia"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", puerto)
+    writer.write(paquete(CONNECT, 0, b"\x00\x04MQTT\x04\x02\x00\x3c\x00\x06prueba"))
+    await reader.readexactly(4)  # CONNACK
+    for topico, payload in mensajes:
+        topico = topico.encode()
+        writer.write(paquete(PUBLISH, 0, struct.pack("!H", len(topico)) + topico + payload))
+    writer.write(paquete(DISCONNECT, 0, b""))
+    await writer.drain()
+    writer.close()
+
+
+def suscrito(broker):
+    return any(broker.clientes.values())
+
+
+async def iniciar(servidor, puerto=0):
+    broker = await BrokerLocal(puerto=puerto).iniciar()
+    ingesta = IngestaMQTT("127.0.0.1", broker.puerto, servidor.procesar_lote,
+                          dispositivo_por_defecto=servidor.DISPOSITIVO_POR_DEFECTO)
+    await ingesta.iniciar()
+    await esperar(lambda: ingesta.conectado and suscrito(broker))
+    return broker, ingesta
+
+
+def muestras(servidor, dispositivo_id):
+    dispositivo = servidor.dispositivos.get(dispositivo_id)
+    return 0 if dispositivo is None else dispositivo.publicado.total
+
+
+def test_json_y_binarias_llegan_a_dispositivos(servidor):
+    json_, binario = CinturonVirtual(1), CinturonVirtual(2, "binario")
+
+    async def escenario():
+        broker, ingesta = await iniciar(servidor)
+        try:
+            await publicar(broker.puerto, [("cinturon/sensores", json_.trama()) for _ in range(5)]
+                           + [("cinturon/sensores", binario.trama()) for _ in range(3)])
+            await esperar(lambda: muestras(servidor, "sim-1") == 5 and muestras(servidor, "2") == 3)
+            assert ingesta.mensajes_recibidos == 8
+        finally:
+            await ingesta.detener()
+            await broker.detener()
+
+    asyncio.run(escenario())
+    assert set(servidor.dispositivos) == {"sim-1", "2"}
+
+
+def test_id_del_topico(servidor):
+    # cinturon/<id>/sensores manda sobre el id de la trama (también el u16 de las binarias)
+    binario = CinturonVirtual(7, "binario")
+
+    async def escenario():
+        broker, ingesta = await iniciar(servidor)
+        try:
+            await publicar(broker.puerto, [("cinturon/pasillo/sensores", binario.trama()) for _ in range(4)])
+            await esperar(lambda: muestras(servidor, "pasillo") == 4)
+        finally:
+            await ingesta.detener()
+            await broker.detener()
+
+    asyncio.run(escenario())
+    assert "7" not in servidor.dispositivos
+
+
+def test_trama_invalida_no_crea_dispositivo(servidor):
+    cinturon = CinturonVirtual(3)
+
+    async def escenario():
+        broker, ingesta = await iniciar(servidor)
+        try:
+            await publicar(broker.puerto, [("cinturon/sensores", b"Calibrando canal 1..."),
+                                           ("cinturon/sensores", b'{"lumbar":{"angulo":'),
+                                           ("cinturon/sensores", cinturon.trama())])
+            await esperar(lambda: muestras(servidor, "sim-3") == 1)
+            assert ingesta.mensajes_recibidos == 3
+        finally:
+            await ingesta.detener()
+            await broker.detener()
+
+    asyncio.run(escenario())
+    assert set(servidor.dispositivos) == {"sim-3"}
+
+
+def test_reconexion_vuelve_a_suscribirse(servidor, monkeypatch):
+    monkeypatch.setattr(ingesta_mqtt, "REINTENTO_SEGUNDOS", 0.1)
+    cinturon = CinturonVirtual(4)
+
+    async def escenario():
+        broker, ingesta = await iniciar(servidor)
+        try:
+            await publicar(broker.puerto, [("cinturon/sensores", cinturon.trama())])
+            await esperar(lambda: muestras(servidor, "sim-4") == 1)
+
+            # Se cae el broker y vuelve en el mismo puerto, sin suscripciones
+            puerto = broker.puerto
+            await broker.detener()
+            await esperar(lambda: not ingesta.conectado)
+            broker = await BrokerLocal(puerto=puerto).iniciar()
+            await esperar(lambda: ingesta.conectado and suscrito(broker))
+            assert ingesta.reconexiones >= 1
+
+            await publicar(broker.puerto, [("cinturon/sensores", cinturon.trama()) for _ in range(2)])
+            await esperar(lambda: muestras(servidor, "sim-4") == 3)
+        finally:
+            await ingesta.detener()
+            await broker.detener()
+
+    asyncio.run(escenario())
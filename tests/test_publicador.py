@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+import pytest
+
+import publicador_mqtt
+from publicador_mqtt import Diario, PublicadorMQTT
+
+
+class Cliente:
+    """Lo mínimo de paho que usa el publicador; confirma cada publicación desde otro hilo"""
+
+    def __init__(self):
+        self.publicador = None
+        self.enviadas = []
+
+    def max_inflight_messages_set(self, n):
+        pass
+
+    def publish(self, topico, trama, qos):
+        self.enviadas.append((topico, trama))
+        mid = len(self.enviadas)
+        threading.Timer(0.01, self.publicador._on_publish, (self, None, mid)).start()
+        return type("Info", (), {"rc": 0, "mid": mid})
+
+
+def esperar(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "tiempo agotado"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def escrituras(monkeypatch):
+    """Hilo de cada Diario.agregar y cantidad de fsync"""
+    hilos, fsyncs = [], []
+    agregar, fsync = Diario.agregar, os.fsync
+    monkeypatch.setattr(Diario, "agregar", lambda diario, tramas: (hilos.append(threading.current_thread()),
+                                                                   agregar(diario, tramas)))
+    monkeypatch.setattr(publicador_mqtt.os, "fsync", lambda fd: (fsyncs.append(fd), fsync(fd)))
+    return hilos, fsyncs
+
+
+def crear(tmp_path, **opciones):
+    cliente = Cliente()
+    cliente.publicador = PublicadorMQTT(cliente, "cinturon/sensores",
+                                        ruta_diario=str(tmp_path / "diario.bin"), **opciones)
+    return cliente, cliente.publicador
+
+
+def test_sin_broker_el_volcado_es_por_lotes(tmp_path, escrituras):
+    hilos, fsyncs = escrituras
+    cliente, publicador = crear(tmp_path)
+    for i in range(100):
+        publicador.publicar(b"trama%d" % i)
+    esperar(lambda: publicador.al_diario == 100)
+    assert threading.current_thread() not in hilos  # publicar() nunca escribe el diario
+    assert len(fsyncs) <= 2
+    tramas, _ = publicador.diario.leer_lote(1000)
+    assert [trama for _, trama in tramas] == [b"trama%d" % i for i in range(100)]
+    publicador.detener()
+
+
+def test_cola_llena_se_vuelca_sin_esperar_el_intervalo(tmp_path, escrituras, monkeypatch):
+    hilos, _ = escrituras
+    monkeypatch.setattr(publicador_mqtt, "INTERVALO_VOLCADO", 60)
+    cliente, publicador = crear(tmp_path, max_cola=10)
+    for i in range(10):
+        publicador.publicar(b"trama%d" % i)
+    esperar(lambda: publicador.al_diario == 10)
+    assert threading.current_thread() not in hilos
+    publicador.detener()
+
+
+def test_al_reconectar_reenvia_el_diario_en_orden(tmp_path, escrituras):
+    cliente, publicador = crear(tmp_path)
+    for i in range(5):
+        publicador.publicar(b"trama%d" % i, "cinturon/rfcomm%d/sensores" % (i % 2))
+    esperar(lambda: publicador.al_diario == 5)
+    publicador._on_connect(cliente, None, None, 0)
+    publicador.publicar(b"en vivo")
+    esperar(lambda: len(cliente.enviadas) == 6 and not publicador.diario.pendiente())
+    assert cliente.enviadas == [("cinturon/rfcomm%d/sensores" % (i % 2), b"trama%d" % i) for i in range(5)] \
+        + [("cinturon/sensores", b"en vivo")]
+    publicador.detener()
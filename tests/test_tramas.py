@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+import pytest
+import serial
+
+from decodificador import decodificar
+from simulador import CinturonVirtual, TransportePty
+from tramas import SeparadorTramas, leer_disponible
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="el puerto virtual necesita un pty")
+
+
+@pytest.fixture
+def enlace():
+    """(transporte, puerto serie abierto sobre el pty, separador)"""
+    transporte = TransportePty()
+    puerto = serial.Serial(transporte.ruta, 115200, timeout=0.05)
+    yield transporte, puerto, SeparadorTramas()
+    puerto.close()
+    transporte.cerrar()
+
+
+def escribir(transporte, datos):
+    os.write(transporte.maestro, datos)
+
+
+def leer(puerto, separador, esperadas, limite=2.0):
+    """Tramas separadas hasta juntar `esperadas` (o agotar el tiempo)"""
+    tramas, fin = [], time.monotonic() + limite
+    while len(tramas) < esperadas and time.monotonic() < fin:
+        tramas += separador.alimentar(leer_disponible(puerto))
+    return tramas
+
+
+def test_trama_partida_en_varias_lecturas(enlace):
+    transporte, puerto, separador = enlace
+    json_ = CinturonVirtual(1).trama()
+    binaria = CinturonVirtual(2, "binario").trama()
+    for trama, final in ((json_, b"\n"), (binaria, b"")):
+        partes = (trama[:3], trama[3:len(trama) // 2], trama[len(trama) // 2:] + final)
+        for parte in partes[:-1]:
+            escribir(transporte, parte)
+            assert leer(puerto, separador, 1, limite=0.2) == []
+        escribir(transporte, partes[-1])
+        assert leer(puerto, separador, 1) == [trama]
+    assert separador.descartadas == 0
+
+
+def test_resincroniza_tras_basura(enlace):
+    transporte, puerto, separador = enlace
+    json_ = CinturonVirtual(1).trama()
+    binaria = CinturonVirtual(2, "binario").trama()
+    # Texto de depuración, ruido binario, falsos inicios de trama (0xA5 suelto) y basura antes de '{'
+    escribir(transporte, b"Calibrando canal 1... Mantente quieto.\r\n\x00\xff\x13\xa5\x07garbage"
+             + binaria + b"\xa5\x01\x02" + b"ruido {" + json_[1:] + b"\n" + json_ + b"\n")
+    assert leer(puerto, separador, 3) == [binaria, json_, json_]
+    assert separador.descartadas > 0
+
+
+def test_crc_incorrecto_se_descarta(enlace):
+    transporte, puerto, separador = enlace
+    cinturon = CinturonVirtual(3, "binario")
+    rota = bytearray(cinturon.trama())
+    rota[6] ^= 0x10
+    buena = cinturon.trama()
+    escribir(transporte, bytes(rota) + buena)
+    assert leer(puerto, separador, 1) == [buena]
+    assert separador.descartadas >= 1
+
+
+def test_flujo_mixto_json_y_binario(enlace):
+    transporte, puerto, separador = enlace
+    cinturones = [CinturonVirtual(1), CinturonVirtual(2, "binario"), CinturonVirtual(3), CinturonVirtual(4, "binario")]
+    rondas = [[c.trama() for c in cinturones] for _ in range(50)]
+    enviadas = [trama for ronda in rondas for trama in ronda]
+    # En otro hilo: el buffer del pty es chico y la escritura espera a que se lea
+    envio = threading.Thread(target=lambda: [transporte.enviar(ronda) for ronda in rondas], daemon=True)
+    envio.start()
+    recibidas = leer(puerto, separador, len(enviadas), limite=5.0)
+    envio.join(5.0)
+    assert recibidas == enviadas
+    assert [decodificar(t).dispositivo for t in recibidas[:4]] == ["sim-1", "2", "sim-3", "4"]
+    assert separador.descartadas == 0
@@ -0,0 +1,90 @@
+# 🧵 Separación de tramas del puerto serial/Bluetooth
+# En lugar de readline() (una llamada y un decode por línea), se drena en bloque todo lo
+# que haya en el buffer del puerto y las tramas se separan de forma incremental.
+# Tolera basura (texto de depuración, bytes sueltos tras una reconexión) y líneas partidas.
+# Acepta en el mismo flujo tramas JSON (una por línea) y binarias (byte mágico 0xA5 + CRC).
+
+from decodificador import CRC, MAGIA, TAMANOS_BINARIOS, crc16
+
+MAX_TRAMA = 1024    # Bytes; una "línea" más larga es basura y se descarta
+MAX_LECTURA = 4096  # Bytes leídos del puerto por llamada como máximo
+
+
+class SeparadorTramas:
+    __slots__ = ("buffer", "max_trama", "descartadas")
+
+    def __init__(self, max_trama=MAX_TRAMA):
+        self.buffer = b""
+        self.max_trama = max_trama
+        self.descartadas = 0
+
+    def alimentar(self, datos):
+        """Agrega bytes recibidos y devuelve la lista de tramas completas (bytes, JSON o binarias)"""
+        buf = self.buffer + datos if self.buffer else datos
+        if b"\n" not in datos and b"\xa5" not in buf:
+            self.buffer = buf
+            if len(buf) > self.max_trama:
+                # Sin fin de línea a la vista: descartar para no crecer sin límite
+                self.buffer = b""
+                self.descartadas += 1
+            return []
+
+        tramas = []
+        i, n = 0, len(buf)
+        while i < n:
+            byte = buf[i]
+            if byte == MAGIA:
+                if n - i < 2:
+                    break
+                tamano = TAMANOS_BINARIOS.get(buf[i + 1])
+                if tamano is not None:
+                    if n - i < tamano:
+                        break  # Trama binaria incompleta: esperar el resto
+                    trama = buf[i:i + tamano]
+                    if crc16(trama[:-CRC.size]) == CRC.unpack_from(trama, tamano - CRC.size)[0]:
+                        tramas.append(trama)
+                        i += tamano
+                        continue
+                # Falso inicio o CRC incorrecto: resincronizar en el siguiente byte
+                self.descartadas += 1
+                i += 1
+                continue
+            if byte < 0x20 or byte > 0x7E:
+                # Bytes sueltos (fin de línea, ruido tras reconectar): saltarlos
+                i += 1
+                continue
+
+            fin = buf.find(b"\n", i)
+            if byte != 0x7B:  # Texto que no empieza con '{': puede esconder una trama binaria
+                magia = buf.find(b"\xa5", i, fin if fin >= 0 else n)
+                if magia >= 0 and buf.find(b"{", i, magia) < 0:
+                    self.descartadas += 1
+                    i = magia
+                    continue
+            if fin < 0:
+                if n - i > self.max_trama:
+                    self.descartadas += 1
+                    i = n
+                break
+            linea = buf[i:fin]
+            i = fin + 1
+            inicio = linea.find(b"{")
+            if inicio < 0:
+                if linea.strip():
+                    self.descartadas += 1
+                continue
+            trama = linea[inicio:].rstrip()  # Quita basura previa y el \r final
+            if len(trama) > self.max_trama:
+                self.descartadas += 1
+                continue
+            tramas.append(trama)
+        self.buffer = buf[i:]
+        return tramas
+
+    def reiniciar(self):
+        self.buffer = b""
+
+
+def leer_disponible(puerto, maximo=MAX_LECTURA):
+    """Espera al menos un byte (o el timeout del puerto) y luego drena lo que haya en el buffer"""
+    return puerto.read(min(max(1, puerto.in_waiting), maximo))